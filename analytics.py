@@ -0,0 +1,421 @@
+"""Demand-planning analytics over the loan history, vectorized with NumPy.
+
+Loans (and archived loans) are read ``CHUNK_SIZE`` at a time.  SQLite turns
+each chunk into a few long strings with ``group_concat``: the book ids
+comma-separated, and the three dates of every loan padded to a fixed width
+so NumPy can view them as a byte matrix and convert the digits to epoch
+seconds itself, which costs less than three ``strftime`` calls per loan in
+SQL.  No Python object is built per loan.  Every chunk is folded into
+fixed-size totals: hourly histograms of loan durations and of return
+lateness, per-title checkout counts for the last ``periods`` weeks or months
+(grouped by sorting with ``np.unique``) and per-title days on loan (summed
+with ``np.bincount``).  Memory therefore depends on the number of titles
+and periods, not on the number of loans.
+
+``analyze`` derives from them:
+
+* the loan-duration distribution per day, its mean and percentiles;
+* return-lateness percentiles (return minus due date, in days);
+* checkouts per period, overall and per title;
+* a per-title demand forecast (exponential smoothing) and the copies needed
+  to meet it: by Little's law the copies out at once are the checkouts per
+  day times the days on loan.  Titles are ranked by how many copies they
+  lack compared with ``total_copies``.
+
+NumPy is only needed by this module; the rest of the app runs without it.
+
+Usage::
+
+    python analytics.py --period month --periods 12 --top 20
+"""
+import argparse
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+import numpy as np
+
+import database
+from database import connection
+from records import Record, record_type
+
+CHUNK_SIZE = 100000
+SERIES_PERIODS = 12
+TOP_TITLES = 50
+# Weight of the latest period in the exponential-smoothing forecast.
+SMOOTHING = 0.3
+# Headroom over the mean number of copies out at once.
+SAFETY_FACTOR = 1.25
+# Returned loans a title needs before its own mean duration is trusted.
+MIN_RETURNS = 5
+# Longer loans, and lateness beyond +/- this many days, share the edge bins.
+MAX_DURATION_DAYS = 120
+LATENESS_RANGE_DAYS = 90
+PERCENTILES = (50, 75, 90, 95, 99)
+
+HOUR = 3600
+DAY = 24 * HOUR
+# Stands in for a missing (or unparsable) date.
+NO_TIME = -1
+# period -> mean length in days
+PERIOD_DAYS = {'week': 7, 'month': 365.2425 / 12}
+
+TITLE_COLUMNS = ('book_id', 'title', 'total_copies', 'checkouts', 'forecast',
+                 'loan_days', 'needed', 'shortfall')
+
+# One chunk as (count, last id, strings...); numeric values are coalesced
+# because group_concat skips NULLs, which would misalign the columns.
+CHUNK_SQL = '''
+    SELECT COUNT(*), MAX(id), {columns}
+    FROM (SELECT * FROM {table} WHERE id > ?{where} ORDER BY id LIMIT ?)
+'''
+# The same for all the rows in a date range at once.
+RANGE_SQL = 'SELECT COUNT(*), MAX(id), {columns} FROM {table} WHERE 1{where}'
+BOOK_COLUMNS = ('id', 'COALESCE(total_copies, 0)')
+# 'YYYY-MM-DD HH:MM:SS', the part of loan_date and of the isoformat due and
+# return dates that strftime('%s') reads; fractions of a second are cut off
+# and a missing date becomes blanks.
+DATE_WIDTH = 19
+LOAN_DATES = ('loan_date', 'due_date', 'return_date')
+LOAN_CHUNK_COLUMNS = (
+    "group_concat(book_id, ',')",
+    "group_concat(printf('{formats}', {dates}), '')".format(
+        formats=f'%-{DATE_WIDTH}.{DATE_WIDTH}s' * len(LOAN_DATES), dates=', '.join(LOAN_DATES)),
+)
+# Offsets of the year, month, day, hour, minute and second digits.
+DATE_FIELDS = ((0, 4), (5, 7), (8, 10), (11, 13), (14, 16), (17, 19))
+
+
+def _iter_texts(conn, table, columns, where, params, chunk_size):
+    sql = CHUNK_SQL.format(columns=', '.join(columns), table=table, where=where)
+    after = 0
+    while True:
+        count, after, *texts = conn.execute(sql, (after, *params, chunk_size)).fetchone()
+        if not count:
+            return
+        yield texts
+
+
+def iter_columns(conn, table, columns, where='', params=(), chunk_size=CHUNK_SIZE):
+    """Yield tuples of int64 arrays, one per SQL expression in ``columns``,
+    for ``chunk_size`` rows of ``table`` at a time in id order."""
+    columns = [f"group_concat({column}, ',')" for column in columns]
+    for texts in _iter_texts(conn, table, columns, where, params, chunk_size):
+        yield tuple(np.fromstring(text, dtype=np.int64, sep=',') for text in texts)
+
+
+def parse_times(text, fields):
+    """Epoch seconds (UTC, like ``strftime('%s')``) of ``fields`` dates per row
+    packed ``DATE_WIDTH`` bytes each; an array of shape (rows, fields).
+
+    A date without a time of day is read as midnight; blank or malformed
+    dates give ``NO_TIME``.
+    """
+    raw = np.frombuffer(text.encode(), np.uint8).reshape(-1, fields, DATE_WIDTH)
+    # One contiguous (rows, fields) plane per character position.
+    planes = np.ascontiguousarray(np.moveaxis(raw, -1, 0))
+    digits = planes - np.uint8(ord('0'))
+    values, valid = [], []
+    for start, stop in DATE_FIELDS:
+        value = digits[start].astype(np.int64)
+        for i in range(start + 1, stop):
+            value = value * 10 + digits[i]
+        values.append(value)
+        valid.append(np.maximum.reduce(digits[start:stop]) <= 9)
+    year, month, day, hour, minute, second = values
+    timed = valid[3] & valid[4] & valid[5]
+    untimed = (planes[DATE_FIELDS[2][1]:] == ord(' ')).all(axis=0)
+    dated = valid[0] & valid[1] & valid[2] & (month >= 1) & (month <= 12) & (timed | untimed)
+    month_start = np.where(dated, (year - 1970) * 12 + month - 1, 0)
+    days = month_start.astype('datetime64[M]').astype('datetime64[D]').astype(np.int64) + day - 1
+    clock = np.where(timed, hour * HOUR + minute * 60 + second, 0)
+    return np.where(dated, days * DAY + clock, NO_TIME)
+
+
+def _loan_filter(since, until):
+    where, params = '', []
+    if since:
+        where += ' AND loan_date >= ?'
+        params.append(str(since))
+    if until:
+        where += " AND loan_date < date(?, '+1 day')"
+        params.append(str(until))
+    return where, params
+
+
+def iter_loan_chunks(conn, since=None, until=None, history=True, chunk_size=CHUNK_SIZE):
+    """Yield ``(book_id, loan_time, due_time, return_time)`` arrays of live
+    and, with ``history``, archived loans; times are epoch seconds."""
+    where, params = _loan_filter(since, until)
+    for table in ('loans', 'loans_archive') if history else ('loans',):
+        for book_ids, dates in _iter_texts(conn, table, LOAN_CHUNK_COLUMNS, where, params,
+                                           chunk_size):
+            times = parse_times(dates, len(LOAN_DATES))
+            yield (np.fromstring(book_ids, dtype=np.int64, sep=','),
+                   times[:, 0], times[:, 1], times[:, 2])
+
+
+def iter_loan_range(conn, since, until, history=True):
+    """Like ``iter_loan_chunks`` for a short date range, read in one query per
+    table through the ``loan_date`` indexes (a shard of a parallel report)."""
+    where, params = _loan_filter(since, until)
+    for table in ('loans', 'loans_archive') if history else ('loans',):
+        count, _, book_ids, dates = conn.execute(
+            RANGE_SQL.format(columns=', '.join(LOAN_CHUNK_COLUMNS), table=table, where=where),
+            params).fetchone()
+        if count:
+            times = parse_times(dates, len(LOAN_DATES))
+            yield (np.fromstring(book_ids, dtype=np.int64, sep=','),
+                   times[:, 0], times[:, 1], times[:, 2])
+
+
+def count_loans(conn, since=None, until=None, history=True):
+    where, params = _loan_filter(since, until)
+    return sum(conn.execute(f'SELECT COUNT(*) FROM {table} WHERE 1{where}', params).fetchone()[0]
+               for table in (('loans', 'loans_archive') if history else ('loans',)))
+
+
+def epoch_seconds(day):
+    """Epoch seconds of midnight starting ``day``, read as UTC like SQLite does."""
+    return int(np.datetime64(str(day), 's').astype(np.int64))
+
+
+def period_index(times, period):
+    """Number of the week (Monday-based) or month since 1970 of each epoch time."""
+    if period == 'week':
+        # 1970-01-01 was a Thursday; week 0 starts on Monday 1969-12-29.
+        return (times // DAY + 3) // 7
+    if period == 'month':
+        return times.astype('datetime64[s]').astype('datetime64[M]').astype(np.int64)
+    raise ValueError(f'period must be one of {tuple(PERIOD_DAYS)}')
+
+
+def period_label(index, period):
+    """``YYYY-MM`` of a month, or the date of a week's Monday."""
+    if period == 'week':
+        return str(np.datetime64(int(index) * 7 - 3, 'D'))
+    return str(np.datetime64(int(index), 'M'))
+
+
+class DemandTotals:
+    """Fixed-size totals that chunks of loans are folded into."""
+
+    def __init__(self, first_period, periods, period, books):
+        self.first_period = first_period
+        self.periods = periods
+        self.period = period
+        self.books = books
+        self.loans = 0
+        # Checkouts per title and period, title-major: book_id * periods + slot.
+        self.checkouts = np.zeros(books * periods, np.int32)
+        self.returned = np.zeros(books, np.int64)
+        self.loan_seconds = np.zeros(books, np.float64)
+        self.durations = np.zeros(MAX_DURATION_DAYS * 24 + 1, np.int64)
+        self.lateness = np.zeros(2 * LATENESS_RANGE_DAYS * 24 + 1, np.int64)
+
+    def add(self, book_id, loan_time, due_time, return_time):
+        self.loans += len(book_id)
+        known = (book_id >= 0) & (book_id < self.books) & (loan_time != NO_TIME)
+
+        slot = period_index(loan_time, self.period) - self.first_period
+        recent = known & (slot >= 0) & (slot < self.periods)
+        keys, counts = np.unique(book_id[recent] * self.periods + slot[recent],
+                                 return_counts=True)
+        self.checkouts[keys] += counts.astype(np.int32)
+
+        returned = known & (return_time != NO_TIME)
+        seconds = (return_time - loan_time)[returned]
+        hours = np.clip(seconds // HOUR, 0, self.durations.size - 1)
+        self.durations += np.bincount(hours, minlength=self.durations.size)
+        books, codes = np.unique(book_id[returned], return_inverse=True)
+        self.returned[books] += np.bincount(codes, minlength=books.size)
+        self.loan_seconds[books] += np.bincount(codes, weights=seconds, minlength=books.size)
+
+        late = returned & (due_time != NO_TIME)
+        hours = (return_time[late] - due_time[late]) // HOUR + LATENESS_RANGE_DAYS * 24
+        self.lateness += np.bincount(np.clip(hours, 0, self.lateness.size - 1),
+                                     minlength=self.lateness.size)
+
+    def parts(self):
+        """The totals with the zeros left out, small enough to send between processes."""
+        keys, books = np.flatnonzero(self.checkouts), np.flatnonzero(self.returned)
+        return (self.loans, keys, self.checkouts[keys], books, self.returned[books],
+                self.loan_seconds[books], self.durations, self.lateness)
+
+    def merge(self, parts):
+        """Add the ``parts()`` of totals over other loans."""
+        loans, keys, checkouts, books, returned, loan_seconds, durations, lateness = parts
+        self.loans += loans
+        self.checkouts[keys] += checkouts
+        self.returned[books] += returned
+        self.loan_seconds[books] += loan_seconds
+        self.durations += durations
+        self.lateness += lateness
+
+
+def histogram_percentiles(counts, start, width, percentiles=PERCENTILES):
+    """The upper edges of the bins in which each percentile of a histogram falls."""
+    total = counts.sum()
+    if not total:
+        return dict.fromkeys(percentiles)
+    ranks = np.asarray(percentiles, np.float64) / 100 * total
+    bins = np.searchsorted(np.cumsum(counts), ranks)
+    return {p: round(float(edge), 2)
+            for p, edge in zip(percentiles, start + (bins + 1) * width)}
+
+
+def smoothed_forecast(series, alpha=SMOOTHING):
+    """Next-period level of every row of ``series`` by exponential smoothing."""
+    level = series[:, 0].astype(np.float64)
+    for column in series.T[1:]:
+        level *= 1 - alpha
+        level += alpha * column
+    return level
+
+
+def _book_copies(conn, books, chunk_size):
+    copies = np.zeros(books, np.int64)
+    for book_id, total in iter_columns(conn, 'books', BOOK_COLUMNS, chunk_size=chunk_size):
+        copies[book_id] = total
+    return copies
+
+
+def _titles(conn, book_ids):
+    placeholders = ', '.join('?' * len(book_ids))
+    return dict(conn.execute(f'SELECT id, title FROM books WHERE id IN ({placeholders})',
+                             book_ids).fetchall())
+
+
+def demand_window(until=None, period='month', periods=SERIES_PERIODS):
+    """Index of the first of the ``periods`` weeks or months up to ``until`` (default today)."""
+    end = epoch_seconds((until or date.today()) + timedelta(days=1))
+    return int(period_index(np.array([end]), period)[0]) - periods
+
+
+def book_count(conn):
+    """Size of the per-title arrays: the highest book id plus one."""
+    return conn.execute('SELECT COALESCE(MAX(id), 0) + 1 FROM books').fetchone()[0]
+
+
+def summarize(conn, totals, top=TOP_TITLES, chunk_size=CHUNK_SIZE):
+    """The result of ``analyze`` from the totals over every loan, without ``seconds``."""
+    books, periods, period = totals.books, totals.periods, totals.period
+    copies = _book_copies(conn, books, chunk_size)
+
+    checkouts = totals.checkouts.reshape(books, periods)
+    in_demand = np.flatnonzero(checkouts.any(axis=1))
+    series = checkouts[in_demand]
+    forecast = smoothed_forecast(series) if periods else np.zeros(in_demand.size)
+
+    returned = totals.returned.sum()
+    mean_days = totals.loan_seconds.sum() / returned / DAY if returned else 0.0
+    own = totals.returned[in_demand] >= MIN_RETURNS
+    loan_days = np.full(in_demand.size, mean_days)
+    loan_days[own] = (totals.loan_seconds[in_demand][own]
+                      / totals.returned[in_demand][own] / DAY)
+    needed = np.maximum(np.ceil(forecast * loan_days / PERIOD_DAYS[period]
+                                * SAFETY_FACTOR), 1).astype(np.int64)
+    shortfall = needed - copies[in_demand]
+    ranked = np.lexsort((-forecast, -shortfall))[:top]
+
+    book_ids = in_demand[ranked].tolist()
+    names = _titles(conn, book_ids) if book_ids else {}
+    title = record_type(Record, TITLE_COLUMNS)
+    titles = [title((book_id, names.get(book_id), int(copies[book_id]),
+                     int(series[i].sum()), round(float(forecast[i]), 2),
+                     round(float(loan_days[i]), 1), int(needed[i]), int(shortfall[i])))
+              for book_id, i in zip(book_ids, ranked.tolist())]
+
+    durations = totals.durations
+    day_counts = np.add.reduceat(durations, np.arange(0, durations.size, 24))
+    late, judged = totals.lateness[LATENESS_RANGE_DAYS * 24:].sum(), totals.lateness.sum()
+    return {
+        'loans': totals.loans,
+        'returned': int(returned),
+        'period': period,
+        'periods': [period_label(totals.first_period + i, period) for i in range(periods)],
+        'checkouts': checkouts.sum(axis=0).tolist(),
+        'duration': {
+            'days': day_counts.tolist(),
+            'mean': round(mean_days, 2),
+            'percentiles': histogram_percentiles(durations, 0, 1 / 24),
+        },
+        'lateness': {
+            'late_share': round(float(late / judged), 4) if judged else None,
+            'percentiles': histogram_percentiles(totals.lateness, -LATENESS_RANGE_DAYS, 1 / 24),
+        },
+        'titles': titles,
+        'series': (in_demand, series),
+    }
+
+
+def analyze(since=None, until=None, period='month', periods=SERIES_PERIODS, history=True,
+            top=TOP_TITLES, chunk_size=CHUNK_SIZE, progress=None):
+    """Analyze the loans checked out between ``since`` and ``until`` (inclusive dates).
+
+    Demand is counted for the ``periods`` complete weeks or months up to
+    ``until`` (default today).  ``progress(read, total)`` is called after
+    every chunk.  Returns a dict; ``titles`` holds records with
+    ``TITLE_COLUMNS`` for the ``top`` titles short of the most copies, and
+    ``series`` the ``(book_ids, checkouts)`` arrays of every title in demand.
+    ``parallel_reports.run('demand', ...)`` computes the same over several
+    processes.
+    """
+    start = time.perf_counter()
+    first_period = demand_window(until, period, periods)
+    with connection() as conn:
+        total = count_loans(conn, since, until, history) if progress is not None else None
+        totals = DemandTotals(first_period, periods, period, book_count(conn))
+        for chunk in iter_loan_chunks(conn, since, until, history, chunk_size):
+            totals.add(*chunk)
+            if progress is not None:
+                progress(totals.loans, total)
+        result = summarize(conn, totals, top, chunk_size)
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def _print_progress(read, total):
+    sys.stderr.write(f'\r{read:,} / {total:,} loans')
+    sys.stderr.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Loan-duration, lateness and demand analytics.')
+    parser.add_argument('--since', type=date.fromisoformat, help='first loan date (YYYY-MM-DD)')
+    parser.add_argument('--until', type=date.fromisoformat, help='last loan date (YYYY-MM-DD)')
+    parser.add_argument('--period', choices=PERIOD_DAYS, default='month')
+    parser.add_argument('--periods', type=int, default=SERIES_PERIODS,
+                        help='periods of demand history to forecast from')
+    parser.add_argument('--top', type=int, default=20, help='titles to list')
+    parser.add_argument('--live-only', action='store_true', help='leave out archived loans')
+    parser.add_argument('--db', help='database file (default: library.db)')
+    args = parser.parse_args(argv)
+
+    if args.db:
+        database.DB_PATH = Path(args.db)
+    database.init_database()
+    database.configure_pool(database.DB_PATH)
+    try:
+        result = analyze(args.since, args.until, args.period, args.periods,
+                         not args.live_only, args.top, progress=_print_progress)
+    finally:
+        database.close_pool()
+
+    sys.stderr.write('\n')
+    duration, lateness = result['duration'], result['lateness']
+    print(f"{result['loans']:,} loans ({result['returned']:,} returned) "
+          f"in {result['seconds']:.1f}s")
+    print(f"days on loan: mean {duration['mean']}, percentiles {duration['percentiles']}")
+    print(f"days late: {lateness['late_share'] or 0:.1%} returned late, "
+          f"percentiles {lateness['percentiles']}")
+    print('checkouts: ' + ', '.join(f'{label} {count}' for label, count
+                                    in zip(result['periods'], result['checkouts'])))
+    print('\t'.join(TITLE_COLUMNS))
+    for title in result['titles']:
+        print('\t'.join(str(value) for value in title))
+
+
+if __name__ == '__main__':
+    main()
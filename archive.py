@@ -0,0 +1,126 @@
+"""Hot/cold split of the loan history.
+
+Returned loans that fell due more than ``ARCHIVE_AFTER_DAYS`` ago are moved
+from ``loans`` to ``loans_archive`` in batches of ``ARCHIVE_BATCH_SIZE``, one
+short transaction per batch, so the live table and its indexes only hold
+loans that are out plus recent history.  The archive is read only when
+history is asked for (``LoanModel.get_all_loans(history=True)``).
+
+Counters are unaffected: ``book_stats`` is maintained by triggers on loan
+insert and status change, never on delete, and ``maintenance.py
+rebuild-stats`` counts the archive as well.
+
+Deleting rows leaves free pages inside the file; ``reclaim_space`` hands
+them back to the file system with ``PRAGMA incremental_vacuum``, a few pages
+per write transaction, while the database stays in use.  That needs
+``auto_vacuum = INCREMENTAL``: new databases get it, an existing one is
+converted once by ``full_vacuum``.
+
+Usage::
+
+    python maintenance.py archive-loans --days 365
+    python maintenance.py vacuum [--full]
+"""
+from datetime import datetime, timedelta
+
+from cache import invalidates
+from changefeed import log_reload
+from database import connection, transaction
+
+ARCHIVE_AFTER_DAYS = 365
+ARCHIVE_BATCH_SIZE = 5000
+ARCHIVE_INTERVAL_SECONDS = 24 * 60 * 60
+VACUUM_STEP_PAGES = 1000
+
+ARCHIVE_COLUMNS = 'id, user_id, book_id, loan_date, due_date, return_date, status'
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+def archive_cutoff(days=ARCHIVE_AFTER_DAYS, now=None):
+    """Due dates before this (local ISO time, like ``loans.due_date``) are archived."""
+    return ((now or datetime.now()) - timedelta(days=days)).isoformat()
+
+
+@invalidates('loans')
+def archive_batch(cutoff, batch_size=ARCHIVE_BATCH_SIZE):
+    """Move up to ``batch_size`` returned loans due before ``cutoff``; returns how many."""
+    with transaction() as conn:
+        conn.execute('CREATE TEMP TABLE IF NOT EXISTS archive_batch (id INTEGER PRIMARY KEY)')
+        conn.execute('DELETE FROM temp.archive_batch')
+        # A range of idx_loans_status_due.
+        moved = conn.execute('''
+            INSERT INTO temp.archive_batch (id)
+            SELECT id FROM loans
+            WHERE status = 'returned' AND due_date < ?
+            LIMIT ?
+        ''', (cutoff, batch_size)).rowcount
+        if moved:
+            conn.execute(f'''
+                INSERT INTO loans_archive ({ARCHIVE_COLUMNS})
+                SELECT {ARCHIVE_COLUMNS} FROM loans WHERE id IN temp.archive_batch
+            ''')
+            conn.execute('DELETE FROM loans WHERE id IN temp.archive_batch')
+            log_reload(conn, 'loans')
+    return moved
+
+
+def archive_returned_loans(days=ARCHIVE_AFTER_DAYS, batch_size=ARCHIVE_BATCH_SIZE,
+                           progress=None):
+    """Archive every returned loan due more than ``days`` ago; returns how many.
+
+    ``progress(moved)`` is called after each batch.
+    """
+    cutoff = archive_cutoff(days)
+    moved = 0
+    while True:
+        count = archive_batch(cutoff, batch_size)
+        if not count:
+            return moved
+        moved += count
+        if progress is not None:
+            progress(moved)
+
+
+def run_archive_jobs():
+    """Archive old returned loans, then reclaim the space; returns how many moved."""
+    moved = archive_returned_loans()
+    reclaim_space()
+    return moved
+
+
+def free_pages(conn):
+    return conn.execute('PRAGMA freelist_count').fetchone()[0]
+
+
+def reclaim_space(step=VACUUM_STEP_PAGES):
+    """Release free pages to the file system in steps; returns how many.
+
+    Each ``PRAGMA incremental_vacuum`` step is its own short write
+    transaction.  Does nothing (and returns 0) unless the database uses
+    ``auto_vacuum = INCREMENTAL``.
+    """
+    released = 0
+    with connection() as conn:
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != AUTO_VACUUM_INCREMENTAL:
+            return 0
+        while True:
+            before = free_pages(conn)
+            if not before:
+                return released
+            # Frees one page per step of the statement, so drain it.
+            conn.execute(f'PRAGMA incremental_vacuum({int(step)})').fetchall()
+            after = free_pages(conn)
+            if after >= before:
+                return released
+            released += before - after
+
+
+def full_vacuum():
+    """Rebuild the file with ``VACUUM``, switching it to incremental auto-vacuum.
+
+    Blocks writers for the whole rebuild and needs free disk space about the
+    size of the database; run it once, off-hours.
+    """
+    with connection() as conn:
+        conn.execute(f'PRAGMA auto_vacuum = {AUTO_VACUUM_INCREMENTAL}')
+        conn.execute('VACUUM')
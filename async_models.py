@@ -0,0 +1,142 @@
+"""Asyncio twins of the model classes.
+
+``AsyncBookModel``, ``AsyncUserModel`` and ``AsyncLoanModel`` have the same
+methods as their blocking counterparts in ``models.py``, as coroutines::
+
+    books, users = await asyncio.gather(AsyncBookModel.get_books_page(),
+                                        AsyncUserModel.get_users_page())
+    loan = await AsyncLoanModel.create_loan(user_id, book_id)
+
+Reads run on a bounded thread pool, one pooled connection per worker, so
+independent reads proceed in parallel.  Writes run one at a time on a single
+writer thread.  Cancelling a read that is already running interrupts its
+query; a write that has started is always allowed to finish, so a cancelled
+write either did not happen or happened completely.
+"""
+import asyncio
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+from database import connection
+from models import BookModel, UserModel, LoanModel
+
+
+class _Job:
+    """One model call on a worker thread; can be interrupted mid-query."""
+
+    def __init__(self, func, args, kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self._lock = threading.Lock()
+        self._conn = None
+        self.cancelled = False
+
+    def run(self):
+        if self.cancelled:
+            raise asyncio.CancelledError()
+        with connection() as conn:
+            with self._lock:
+                self._conn = conn
+            try:
+                return self.func(*self.args, **self.kwargs)
+            finally:
+                with self._lock:
+                    self._conn = None
+
+    def interrupt(self):
+        # A no-op when no statement is running, see workers._SearchJob.
+        with self._lock:
+            self.cancelled = True
+            if self._conn is not None:
+                self._conn.interrupt()
+
+
+class ModelExecutor:
+    """Runs blocking model calls for coroutines: parallel reads, serial writes."""
+
+    def __init__(self, readers=database.POOL_SIZE):
+        self.readers = ThreadPoolExecutor(readers, thread_name_prefix='model-reader')
+        self.writer = ThreadPoolExecutor(1, thread_name_prefix='model-writer')
+
+    async def read(self, func, *args, **kwargs):
+        job = _Job(func, args, kwargs)
+        future = asyncio.get_running_loop().run_in_executor(self.readers, job.run)
+        try:
+            return await future
+        except asyncio.CancelledError:
+            job.interrupt()
+            raise
+        except sqlite3.OperationalError:
+            if job.cancelled:
+                raise asyncio.CancelledError()
+            raise
+
+    async def write(self, func, *args, **kwargs):
+        job = _Job(func, args, kwargs)
+        # Shielded so that cancelling the caller never abandons a write
+        # half-way; a queued write that has not started is skipped.
+        future = asyncio.get_running_loop().run_in_executor(self.writer, job.run)
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            job.cancelled = True
+            raise
+
+    def close(self):
+        self.readers.shutdown(wait=True)
+        self.writer.shutdown(wait=True)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """The shared ``ModelExecutor``, created on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ModelExecutor()
+        return _executor
+
+
+def close_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.close()
+            _executor = None
+
+
+def is_write(func):
+    return hasattr(func, 'invalidates')
+
+
+def _twin(model):
+    """Build an async class mirroring every public static method of ``model``."""
+    namespace = {'__doc__': f'Async twin of ``models.{model.__name__}``.',
+                 'model': model}
+    for name, value in vars(model).items():
+        if not isinstance(value, staticmethod) or name.startswith('_'):
+            continue
+        func = getattr(model, name)
+        write = is_write(func)
+
+        def method(*args, _func=func, _write=write, **kwargs):
+            executor = get_executor()
+            run = executor.write if _write else executor.read
+            return run(_func, *args, **kwargs)
+
+        method.__name__ = name
+        method.__qualname__ = f'Async{model.__name__}.{name}'
+        method.__doc__ = func.__doc__
+        namespace[name] = staticmethod(method)
+    return type(f'Async{model.__name__}', (), namespace)
+
+
+AsyncBookModel = _twin(BookModel)
+AsyncUserModel = _twin(UserModel)
+AsyncLoanModel = _twin(LoanModel)
@@ -0,0 +1,15 @@
+"""Performance benchmarks for the library model layer.
+
+Run a benchmark from the project root, e.g.::
+
+    python -m benchmarks.datagen bench.db --books 1000000 --users 200000 --loans 10000000
+    python -m benchmarks.run --db bench.db --out results.json --compare baseline.json
+    python -m benchmarks.bench_connections
+    python -m benchmarks.bench_records
+    python -m benchmarks.bench_analytics --db bench.db
+    python -m benchmarks.bench_parallel_reports --db bench.db --report loan-history
+    python -m benchmarks.export_plans --db bench.db
+    python -m benchmarks.cache_check
+    python -m benchmarks.load_test --connections 16 --depth 4
+    python -m benchmarks.startup --runs 5
+"""
@@ -0,0 +1,167 @@
+"""Wall time and peak memory of ``analytics.analyze`` versus a pure-Python loop.
+
+The loop reads the loans row by row and computes the same metrics with
+dictionaries and sorted lists; the two results are checked against each
+other (percentiles to within the one-hour histogram bins).
+
+Usage::
+
+    python -m benchmarks.bench_analytics --loans 1000000
+    python -m benchmarks.bench_analytics --db bench.db --until 2024-12-31
+"""
+import argparse
+import gc
+import math
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+import analytics
+import database
+from benchmarks.datagen import generate
+
+ROW_SQL = '''
+    SELECT book_id, CAST(strftime('%s', loan_date) AS INTEGER),
+           CAST(strftime('%s', due_date) AS INTEGER),
+           CAST(strftime('%s', return_date) AS INTEGER)
+    FROM {table}
+    WHERE loan_date < date(?, '+1 day')
+'''
+
+
+def python_period(seconds, period):
+    if period == 'week':
+        return (seconds // analytics.DAY + 3) // 7
+    moment = datetime.fromtimestamp(seconds, timezone.utc)
+    return (moment.year - 1970) * 12 + moment.month - 1
+
+
+def python_percentiles(values, percentiles=analytics.PERCENTILES):
+    values.sort()
+    return {p: values[max(0, math.ceil(p / 100 * len(values)) - 1)] if values else None
+            for p in percentiles}
+
+
+def python_analyze(until, period, periods, top):
+    """``analytics.analyze`` one row at a time, without NumPy."""
+    end = analytics.epoch_seconds(date.fromordinal(until.toordinal() + 1))
+    first = python_period(end, period) - periods
+    checkouts = defaultdict(lambda: [0] * periods)
+    returned, loan_seconds = defaultdict(int), defaultdict(float)
+    durations, lateness = [], []
+    loans = 0
+    with database.connection() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        for table in ('loans', 'loans_archive'):
+            for book_id, loan_time, due_time, return_time in cursor.execute(
+                    ROW_SQL.format(table=table), (str(until),)):
+                loans += 1
+                if loan_time is None:
+                    continue
+                slot = python_period(loan_time, period) - first
+                if 0 <= slot < periods:
+                    checkouts[book_id][slot] += 1
+                if return_time is None:
+                    continue
+                seconds = return_time - loan_time
+                durations.append(seconds / analytics.DAY)
+                returned[book_id] += 1
+                loan_seconds[book_id] += seconds
+                if due_time is not None:
+                    lateness.append((return_time - due_time) / analytics.DAY)
+        copies = dict(conn.execute('SELECT id, total_copies FROM books').fetchall())
+
+    total_returned = sum(returned.values())
+    mean_days = sum(loan_seconds.values()) / total_returned / analytics.DAY
+    rows = []
+    for book_id, series in checkouts.items():
+        level = float(series[0])
+        for count in series[1:]:
+            level = analytics.SMOOTHING * count + (1 - analytics.SMOOTHING) * level
+        days = (loan_seconds[book_id] / returned[book_id] / analytics.DAY
+                if returned[book_id] >= analytics.MIN_RETURNS else mean_days)
+        needed = max(math.ceil(level * days / analytics.PERIOD_DAYS[period]
+                               * analytics.SAFETY_FACTOR), 1)
+        rows.append((needed - copies.get(book_id, 0), level, book_id, needed))
+    rows.sort(key=lambda row: (-row[0], -row[1], row[2]))
+    return {
+        'loans': loans,
+        'duration': python_percentiles(durations),
+        'lateness': python_percentiles(lateness),
+        'titles': [(book_id, needed, shortfall) for shortfall, _, book_id, needed in rows[:top]],
+    }
+
+
+def check(fast, slow):
+    assert fast['loans'] == slow['loans'], (fast['loans'], slow['loans'])
+    for key in ('duration', 'lateness'):
+        for p, value in slow[key].items():
+            edge = fast[key]['percentiles'][p]
+            assert edge - 1 / 24 - 0.01 <= value <= edge + 0.01, (key, p, edge, value)
+    titles = [(t.book_id, t.needed, t.shortfall) for t in fast['titles']]
+    assert titles == slow['titles'], (titles[:5], slow['titles'][:5])
+
+
+def measure(func, memory):
+    gc.collect()
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+    peak = None
+    if memory:
+        peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+    return result, seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--db', help='existing database (default: generate one)')
+    parser.add_argument('--books', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--loans', type=int, default=1000000)
+    parser.add_argument('--until', type=date.fromisoformat, default=date(2024, 12, 31),
+                        help='end of the demand history (datagen ends at 2025-01-01)')
+    parser.add_argument('--period', choices=analytics.PERIOD_DAYS, default='month')
+    parser.add_argument('--periods', type=int, default=analytics.SERIES_PERIODS)
+    parser.add_argument('--top', type=int, default=analytics.TOP_TITLES)
+    parser.add_argument('--no-memory', action='store_true',
+                        help='skip the (slow) traced runs for peak memory')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(args.db) if args.db else Path(tmp) / 'bench.db'
+        if not args.db:
+            generate(path, args.books, args.users, args.loans)
+        database.DB_PATH = path
+        database.init_database()
+        database.configure_pool(path)
+        cases = (
+            ('numpy', lambda: analytics.analyze(until=args.until, period=args.period,
+                                                periods=args.periods, top=args.top)),
+            ('python', lambda: python_analyze(args.until, args.period, args.periods, args.top)),
+        )
+        results = {}
+        try:
+            for name, func in cases:
+                results[name], seconds, _ = measure(func, False)
+                line = f'{name:<7} {seconds:8.2f} s'
+                if not args.no_memory:
+                    _, _, peak = measure(func, True)
+                    line += f'  {peak:8.1f} MiB peak'
+                print(line)
+        finally:
+            database.close_pool()
+    check(results['numpy'], results['python'])
+    loans = results['numpy']['loans']
+    print(f'{loans:,} loans; results agree')
+
+
+if __name__ == '__main__':
+    main()
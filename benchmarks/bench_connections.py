@@ -0,0 +1,71 @@
+"""Per-call latency of a fresh connection per query versus the pool."""
+import argparse
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import database
+
+
+def seed(path, books):
+    database.DB_PATH = path
+    database.init_database()
+    conn = database.get_connection()
+    conn.executemany(
+        'INSERT INTO books (title, author, isbn, category) VALUES (?, ?, ?, ?)',
+        ((f'Title {i}', f'Author {i % 500}', f'isbn-{i}', 'General') for i in range(books)))
+    conn.commit()
+    conn.close()
+
+
+def per_call_fresh(path, book_id):
+    conn = database.get_connection()
+    conn.row_factory = database.dict_factory
+    conn.execute('SELECT * FROM books WHERE id = ?', (book_id,)).fetchone()
+    conn.close()
+
+
+def per_call_pooled(path, book_id):
+    with database.connection() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = database.dict_factory
+        cursor.execute('SELECT * FROM books WHERE id = ?', (book_id,)).fetchone()
+
+
+def measure(func, path, calls, books):
+    samples = []
+    for i in range(calls):
+        start = time.perf_counter()
+        func(path, i % books + 1)
+        samples.append((time.perf_counter() - start) * 1e6)
+    samples.sort()
+    return {
+        'mean_us': statistics.fmean(samples),
+        'p50_us': samples[len(samples) // 2],
+        'p99_us': samples[int(len(samples) * 0.99)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--calls', type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'bench.db'
+        seed(path, args.books)
+        before = measure(per_call_fresh, path, args.calls, args.books)
+        database.configure_pool(path)
+        after = measure(per_call_pooled, path, args.calls, args.books)
+        database.close_pool()
+
+    for label, result in (('get_connection()', before), ('pooled', after)):
+        print(f"{label:<18} mean {result['mean_us']:8.1f} us  "
+              f"p50 {result['p50_us']:8.1f} us  p99 {result['p99_us']:8.1f} us")
+    print(f"speedup (mean): {before['mean_us'] / after['mean_us']:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""Wall time of ``parallel_reports.run`` as the number of worker processes grows.
+
+Every worker count must produce the same result; the speed-up is relative
+to one worker.  Only as many workers as there are cores can help, so run
+it on the machine the reports are meant for.
+
+Usage::
+
+    python -m benchmarks.bench_parallel_reports --loans 1000000
+    python -m benchmarks.bench_parallel_reports --db bench.db --report demand --workers 1 4 16
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import date
+from pathlib import Path
+
+import database
+import parallel_reports
+from benchmarks.datagen import generate
+
+
+def comparable(name, result):
+    if name == 'demand':
+        return {key: value for key, value in result.items() if key not in ('series', 'seconds')}
+    return result
+
+
+def worker_counts():
+    counts, count = [], 1
+    while count < parallel_reports.WORKERS:
+        counts.append(count)
+        count *= 2
+    return counts + [parallel_reports.WORKERS]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--db', help='existing database (default: generate one)')
+    parser.add_argument('--books', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--loans', type=int, default=1000000)
+    parser.add_argument('--report', choices=sorted(parallel_reports.REPORTS),
+                        default='loan-history')
+    parser.add_argument('--until', type=date.fromisoformat, default=date(2024, 12, 31),
+                        help='end of the range (datagen ends at 2025-01-01)')
+    parser.add_argument('--workers', type=int, nargs='+', default=worker_counts())
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(args.db) if args.db else Path(tmp) / 'bench.db'
+        if not args.db:
+            generate(path, args.books, args.users, args.loans)
+        database.DB_PATH = path
+        database.init_database()
+        database.configure_pool(path)
+        baseline = expected = None
+        try:
+            print(f'{os.cpu_count()} cores, report {args.report}')
+            for workers in args.workers:
+                start = time.perf_counter()
+                result = parallel_reports.run(args.report, until=args.until, workers=workers)
+                seconds = time.perf_counter() - start
+                result = comparable(args.report, result)
+                if expected is None:
+                    baseline, expected = seconds, result
+                assert result == expected, f'{workers} workers disagree'
+                print(f'{workers:3} workers {seconds:8.2f} s  x{baseline / seconds:.2f}')
+        finally:
+            database.close_pool()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""CPU time and memory of ``dict_factory`` rows versus compact records."""
+import argparse
+import gc
+import statistics
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import database
+from benchmarks.datagen import generate
+from models import LOAN_SELECT
+from records import Book, Loan, row_factory
+
+QUERIES = (
+    ('books', 'SELECT * FROM books', Book),
+    ('loans', LOAN_SELECT, Loan),
+)
+
+
+def fetch(conn, sql, factory):
+    cursor = conn.cursor()
+    cursor.row_factory = factory
+    return cursor.execute(sql).fetchall()
+
+
+def cpu_ms(conn, sql, factory, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fetch(conn, sql, factory)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def retained_bytes(conn, sql, factory):
+    gc.collect()
+    tracemalloc.start()
+    rows = fetch(conn, sql, factory)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size / len(rows) if rows else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--books', type=int, default=100000)
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--loans', type=int, default=300000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'bench.db'
+        generate(path, args.books, args.users, args.loans)
+        database.configure_pool(path)
+        with database.connection() as conn:
+            for name, sql, record in QUERIES:
+                for label, make in (('dict_factory', lambda: database.dict_factory),
+                                    ('records', lambda: row_factory(record))):
+                    ms = cpu_ms(conn, sql, make(), args.repeat)
+                    per_row = retained_bytes(conn, sql, make())
+                    print(f'{name:<6} {label:<13} {ms:9.1f} ms  {per_row:7.0f} bytes/row')
+        database.close_pool()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""Check that the query cache invalidates exactly what a write changes.
+
+Scenarios, on a small generated dataset (or a copy of ``--db``):
+
+* a local write to users keeps the cached books entries;
+* a write by another connection drops everything, whether or not a local
+  write follows it, and whether it lands before a local commit or right
+  after it.
+
+Exits non-zero if a scenario fails.
+
+Usage::
+
+    python -m benchmarks.cache_check
+    python -m benchmarks.cache_check --db library.db
+"""
+import argparse
+import sqlite3
+import sys
+import tempfile
+from pathlib import Path
+
+import database
+from benchmarks.datagen import generate
+from benchmarks.run import copy_dataset
+
+
+def external_write(path, sql, params=()):
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute(sql, params)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def scenarios(path):
+    from cache import query_cache
+    from models import BookModel, UserModel
+
+    rename = 'UPDATE books SET title = ? WHERE id = 1'
+
+    def local_users_write():
+        BookModel.get_book_by_id(1)
+        hits = query_cache.hits
+        UserModel.add_user('Cache Check', 'cache-check@example.org', '', '')
+        BookModel.get_book_by_id(1)
+        return query_cache.hits == hits + 1
+
+    def external_write_alone():
+        BookModel.get_book_by_id(1)
+        external_write(path, rename, ('External 1',))
+        return BookModel.get_book_by_id(1).title == 'External 1'
+
+    def external_then_local_write():
+        BookModel.get_book_by_id(1)
+        external_write(path, rename, ('External 2',))
+        UserModel.update_user(1, 'Cache Check', 'cache-check-2@example.org', '', '')
+        return BookModel.get_book_by_id(1).title == 'External 2'
+
+    def external_right_after_local_commit():
+        # A hook ahead of the cache's has another connection commit between
+        # our COMMIT and the cache adopting the new data_version.
+        def hook(conn):
+            return lambda: external_write(path, rename, ('External 3',))
+        BookModel.get_book_by_id(1)
+        database.COMMIT_HOOKS.insert(0, hook)
+        try:
+            UserModel.update_user(1, 'Cache Check', 'cache-check-3@example.org', '', '')
+        finally:
+            database.COMMIT_HOOKS.remove(hook)
+        return BookModel.get_book_by_id(1).title == 'External 3'
+
+    return [local_users_write, external_write_alone, external_then_local_write,
+            external_right_after_local_commit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--db', help='dataset to copy (default: generate one)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'cache.db'
+        if args.db:
+            copy_dataset(args.db, path)
+        else:
+            generate(path, books=1000, users=200, loans=2000)
+        database.DB_PATH = path
+        database.init_database()
+        database.configure_pool(path)
+        failed = 0
+        try:
+            for scenario in scenarios(path):
+                ok = scenario()
+                failed += not ok
+                print(f"{scenario.__name__:<36} {'ok' if ok else 'FAILED'}")
+        finally:
+            database.close_pool()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""Deterministic synthetic library datasets.
+
+The same ``seed`` and sizes always produce the same database.  Rows are
+written with ``executemany`` into the bare tables and the remaining schema
+migrations (indexes, search index, statistics) run once afterwards, so they
+are built in bulk rather than row by row.
+
+Usage::
+
+    python -m benchmarks.datagen bench.db --books 1000000 --users 200000 --loans 10000000
+"""
+import argparse
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+from itertools import islice
+
+from migrations import create_base_tables, migrate
+
+BATCH_SIZE = 50000
+LOAN_DAYS = 14
+
+CATEGORIES = ('Fiction', 'Science', 'History', 'Children', 'Poetry', 'Philosophy',
+              'Religion', 'Technology', 'Art', 'Biography', 'Travel', 'Reference')
+WORDS = ('river', 'night', 'garden', 'light', 'stone', 'city', 'silent', 'empire',
+         'winter', 'secret', 'journey', 'ocean', 'desert', 'golden', 'shadow',
+         'star', 'book', 'memory', 'fire', 'house', 'forest', 'last', 'first', 'song')
+FIRST_NAMES = ('Ahmed', 'Sara', 'Omar', 'Layla', 'John', 'Maria', 'Yusuf', 'Nour',
+               'David', 'Fatima', 'Ali', 'Emma', 'Hassan', 'Mona', 'Karim', 'Lina')
+LAST_NAMES = ('Haddad', 'Smith', 'Khalil', 'Garcia', 'Mansour', 'Brown', 'Saleh',
+              'Nasser', 'Wilson', 'Aziz', 'Taylor', 'Farouk', 'Martin', 'Youssef')
+
+
+def _books(rng, count):
+    for i in range(1, count + 1):
+        title = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))).title()
+        author = f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}'
+        copies = rng.randint(1, 5)
+        yield (i, f'{title} {i}', author, f'978{i:010d}', rng.choice(CATEGORIES),
+               copies, copies)
+
+
+def _users(rng, count):
+    for i in range(1, count + 1):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        yield (i, f'{first} {last}', f'{first.lower()}.{last.lower()}{i}@example.org',
+               f'+1555{i:07d}', f'{rng.randint(1, 999)} {rng.choice(WORDS).title()} St')
+
+
+def _loans(rng, count, books, users, years, now):
+    """Loans in chronological order over ``years``; recent ones still active."""
+    span = years * 365 * 86400
+    start = now - timedelta(seconds=span)
+    step = span / max(count, 1)
+    for i in range(1, count + 1):
+        loan_date = start + timedelta(seconds=i * step + rng.random() * step)
+        due_date = loan_date + timedelta(days=LOAN_DAYS)
+        returned = loan_date + timedelta(days=rng.randint(1, LOAN_DAYS + 10),
+                                         seconds=rng.randint(0, 86399))
+        if returned < now:
+            return_date, status = returned.isoformat(), 'returned'
+        else:
+            return_date, status = None, 'active'
+        # Skew demand: a fifth of all loans go to the top 1% of titles.
+        if rng.random() < 0.2:
+            book_id = rng.randint(1, max(1, books // 100))
+        else:
+            book_id = rng.randint(1, books)
+        yield (i, rng.randint(1, users), book_id,
+               loan_date.strftime('%Y-%m-%d %H:%M:%S'), due_date.isoformat(),
+               return_date, status)
+
+
+def _insert(conn, sql, rows, progress, label):
+    written = 0
+    while True:
+        batch = list(islice(rows, BATCH_SIZE))
+        if not batch:
+            break
+        conn.execute('BEGIN')
+        conn.executemany(sql, batch)
+        conn.execute('COMMIT')
+        written += len(batch)
+        if progress:
+            progress(label, written)
+    return written
+
+
+def generate(path, books=10000, users=2000, loans=100000, years=3, seed=42,
+             now=None, progress=None):
+    """Create a populated, fully migrated library database at ``path``."""
+    rng = random.Random(seed)
+    now = now or datetime(2025, 1, 1)
+    conn = sqlite3.connect(path, isolation_level=None)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = OFF')
+    try:
+        conn.execute('BEGIN')
+        create_base_tables(conn)
+        conn.execute('COMMIT')
+        _insert(conn, '''
+            INSERT INTO books (id, title, author, isbn, category, total_copies, available_copies)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', _books(rng, books), progress, 'books')
+        _insert(conn, '''
+            INSERT INTO users (id, name, email, phone, address) VALUES (?, ?, ?, ?, ?)
+        ''', _users(rng, users), progress, 'users')
+        _insert(conn, '''
+            INSERT INTO loans (id, user_id, book_id, loan_date, due_date, return_date, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', _loans(rng, loans, books, users, years, now), progress, 'loans')
+
+        # Make copy counts consistent with the loans still out.
+        conn.execute('BEGIN')
+        conn.execute('CREATE TEMP TABLE active_loans (book_id INTEGER PRIMARY KEY, n INTEGER)')
+        conn.execute('''
+            INSERT INTO active_loans
+            SELECT book_id, COUNT(*) FROM loans WHERE status = 'active' GROUP BY book_id
+        ''')
+        conn.execute('''
+            UPDATE books SET
+                total_copies = MAX(total_copies,
+                                   (SELECT n FROM active_loans WHERE book_id = books.id)),
+                available_copies = MAX(total_copies,
+                                       (SELECT n FROM active_loans WHERE book_id = books.id))
+                                   - (SELECT n FROM active_loans WHERE book_id = books.id)
+            WHERE id IN (SELECT book_id FROM active_loans)
+        ''')
+        conn.execute('DROP TABLE active_loans')
+        conn.execute('COMMIT')
+        migrate(conn)
+        conn.execute('PRAGMA optimize')
+    finally:
+        conn.close()
+
+
+def _print_progress(label, written):
+    sys.stderr.write(f'\r{label}: {written:,}   ')
+    sys.stderr.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate a synthetic library database.')
+    parser.add_argument('path')
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--loans', type=int, default=100000)
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    generate(args.path, args.books, args.users, args.loans, args.years, args.seed,
+             progress=_print_progress)
+    sys.stderr.write(f'\ndone in {time.perf_counter() - start:.1f}s\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Check that no export query makes SQLite sort its whole result.
+
+Runs ``EXPLAIN QUERY PLAN`` for every filter combination ``export.py``
+accepts (date range, status, history) and fails if a plan uses a temporary
+B-tree.  A generated dataset is checked twice: as generated, and after
+``ANALYZE`` with an empty archive, since statistics change the plans.
+
+Usage::
+
+    python -m benchmarks.export_plans
+    python -m benchmarks.export_plans --db library.db
+"""
+import argparse
+import itertools
+import sqlite3
+import sys
+import tempfile
+from datetime import date
+from pathlib import Path
+
+import export
+from benchmarks.datagen import generate
+
+SINCE = date(2024, 1, 1)
+UNTIL = date(2024, 6, 30)
+
+
+def filter_combinations():
+    """Yield ``(table, since, until, status, history)`` for every export filter."""
+    for table in sorted(export.TABLES):
+        statuses = (None,) + export.STATUSES if table == 'loans' else (None,)
+        histories = (False, True) if table == 'loans' else (False,)
+        yield from itertools.product((table,), (None, SINCE), (None, UNTIL),
+                                     statuses, histories)
+
+
+def sorting_plans(path):
+    """The filter combinations whose plan sorts, with the plan."""
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        return [(combination, plan) for combination in filter_combinations()
+                for plan in [export.query_plan(conn, *combination)]
+                if any('TEMP B-TREE' in step for step in plan)]
+    finally:
+        conn.close()
+
+
+def check(path, label):
+    failures = sorting_plans(path)
+    for (table, since, until, status, history), plan in failures:
+        print(f'{label}: {table} since={since} until={until} status={status} '
+              f'history={history} sorts: {plan}')
+    print(f'{label}: {len(failures)} sorting plans')
+    return not failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--db', help='existing database (default: generate one)')
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--loans', type=int, default=100000)
+    args = parser.parse_args()
+
+    if args.db:
+        ok = check(args.db, args.db)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / 'plans.db'
+            generate(path, args.books, args.users, args.loans)
+            ok = check(path, 'generated')
+            conn = sqlite3.connect(path)
+            conn.execute('ANALYZE')
+            conn.close()
+            ok = check(path, 'analyzed') and ok
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
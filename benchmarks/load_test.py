@@ -0,0 +1,227 @@
+"""Load test for the HTTP/JSON service (``server.py``).
+
+Starts the server in a subprocess against a synthetic dataset, then drives it
+from keep-alive client connections that pipeline several requests each.
+Two phases are measured: a read mix (book by id, book pages, search, active
+loans) and circulation (``POST /loans`` checkouts, half of them followed
+later by ``POST /loans/<id>/return``).  Loans still open when the phase ends
+are returned afterwards, so a dataset reused with ``--db`` keeps its stock
+from run to run.  Requests/sec and latency percentiles are reported per
+phase.
+
+Usage::
+
+    python -m benchmarks.load_test --connections 32 --depth 8 --seconds 10
+"""
+import argparse
+import asyncio
+import json
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.datagen import generate
+from benchmarks.run import percentile
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def request_bytes(method, path, body=None):
+    payload = json.dumps(body).encode() if body is not None else b''
+    head = (f'{method} {path} HTTP/1.1\r\nHost: localhost\r\n'
+            f'Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n')
+    return head.encode('latin-1') + payload
+
+
+async def read_response(reader):
+    """Read one response; returns ``(status, body)``."""
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split(' ')[1])
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+    if headers.get('transfer-encoding') == 'chunked':
+        body = bytearray()
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).strip(), 16)
+            chunk = await reader.readexactly(size + 2)
+            if not size:
+                break
+            body += chunk[:-2]
+        return status, bytes(body)
+    return status, await reader.readexactly(int(headers.get('content-length', 0)))
+
+
+async def client(port, mix, depth, deadline, latencies, statuses):
+    """One connection keeping ``depth`` requests in flight until ``deadline``."""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    # Bounds the pipeline: the sender blocks once ``depth`` requests are
+    # waiting for their responses.
+    sent = asyncio.Queue(depth)
+
+    async def send():
+        while time.perf_counter() < deadline:
+            await sent.put(time.perf_counter())
+            writer.write(mix.request())
+            await writer.drain()
+        await sent.put(None)
+
+    async def receive():
+        while True:
+            started = await sent.get()
+            if started is None:
+                return
+            status, body = await read_response(reader)
+            latencies.append(time.perf_counter() - started)
+            mix.response(status, body)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    await asyncio.gather(send(), receive())
+    writer.close()
+
+
+async def phase(port, mix, connections, depth, seconds):
+    latencies, statuses = [], {}
+    started = time.perf_counter()
+    deadline = started + seconds
+    await asyncio.gather(*(client(port, mix, depth, deadline, latencies, statuses)
+                           for _ in range(connections)))
+    elapsed = time.perf_counter() - started
+    await mix.finish(port)
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'requests_per_sec': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+    }
+
+
+class ReadMix:
+    def __init__(self, sizes, rng):
+        self.rng = rng
+        self.paths = [
+            lambda: f'/books/{rng.randint(1, sizes["books"])}',
+            lambda: f'/users/{rng.randint(1, sizes["users"])}',
+            lambda: '/books?limit=50',
+            lambda: '/books/search?q=golden%20river&limit=20',
+            lambda: '/loans?status=active&limit=50',
+        ]
+
+    def request(self):
+        return request_bytes('GET', self.rng.choice(self.paths)())
+
+    def response(self, status, body):
+        pass
+
+    async def finish(self, port):
+        pass
+
+
+class CirculationMix:
+    """Checkouts, with returns of the loans they opened mixed in."""
+
+    def __init__(self, sizes, rng, return_share=0.5):
+        self.sizes = sizes
+        self.rng = rng
+        self.return_share = return_share
+        self.open_loans = []
+
+    def request(self):
+        if self.open_loans and self.rng.random() < self.return_share:
+            loan_id = self.open_loans.pop(self.rng.randrange(len(self.open_loans)))
+            return request_bytes('POST', f'/loans/{loan_id}/return')
+        return request_bytes('POST', '/loans', {
+            'user_id': self.rng.randint(1, self.sizes['users']),
+            'book_id': self.rng.randint(1, self.sizes['books']),
+        })
+
+    def response(self, status, body):
+        if status == 201:
+            self.open_loans.append(json.loads(body)['id'])
+
+    async def finish(self, port):
+        """Return the loans still open, outside the measurement."""
+        if not self.open_loans:
+            return
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(request_bytes('POST', '/loans/return', {'loan_ids': self.open_loans}))
+        await writer.drain()
+        status, body = await read_response(reader)
+        writer.close()
+        if status != 200:
+            raise RuntimeError(f'returning open loans failed: {status} {body[:200]!r}')
+        self.open_loans = []
+
+
+def dataset_sizes(path):
+    """Row counts of a reused dataset, so requests only name existing ids."""
+    conn = sqlite3.connect(path)
+    try:
+        return {table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                for table in ('books', 'users', 'loans')}
+    finally:
+        conn.close()
+
+
+def start_server(path):
+    process = subprocess.Popen(
+        [sys.executable, str(ROOT / 'server.py'), '--port', '0', '--db', str(path)],
+        cwd=ROOT, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line.startswith('listening on'):
+        process.kill()
+        raise RuntimeError('server did not start')
+    return process, int(line.rsplit(':', 1)[1])
+
+
+def run(sizes, connections, depth, seconds, db=None, seed=42):
+    rng = random.Random(seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(db) if db else Path(tmp) / 'load.db'
+        if not path.exists():
+            generate(path, sizes['books'], sizes['users'], sizes['loans'])
+        sizes = dataset_sizes(path)
+        process, port = start_server(path)
+        try:
+            results = {}
+            for name, mix in (('reads', ReadMix(sizes, rng)),
+                              ('circulation', CirculationMix(sizes, rng))):
+                sys.stderr.write(f'{name} ...\n')
+                results[name] = asyncio.run(phase(port, mix, connections, depth, seconds))
+        finally:
+            process.terminate()
+            process.wait()
+    return {'sizes': sizes, 'connections': connections, 'depth': depth,
+            'seconds': seconds, 'results': results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Load test the HTTP/JSON service.')
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--loans', type=int, default=100000)
+    parser.add_argument('--connections', type=int, default=16)
+    parser.add_argument('--depth', type=int, default=4, help='pipelined requests per connection')
+    parser.add_argument('--seconds', type=float, default=5.0, help='duration of each phase')
+    parser.add_argument('--db', help='reuse (or create) this dataset instead of a temporary one')
+    args = parser.parse_args(argv)
+
+    sizes = {'books': args.books, 'users': args.users, 'loans': args.loans}
+    report = run(sizes, args.connections, args.depth, args.seconds, args.db)
+    print(json.dumps(report, indent=2))
+    for name, result in report['results'].items():
+        sys.stderr.write(f"{name:<10} {result['requests_per_sec']:>10,.0f} req/s  "
+                         f"p50 {result['p50_ms']:.2f} ms  p99 {result['p99_ms']:.2f} ms\n")
+
+
+if __name__ == '__main__':
+    main()
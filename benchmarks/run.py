@@ -0,0 +1,301 @@
+"""Timing harness for the model layer and the table-fill paths of the GUI.
+
+Every ``BookModel``, ``UserModel`` and ``LoanModel`` method is timed against
+a synthetic dataset (see ``benchmarks.datagen``), and so are
+``BooksTab.load_books`` and ``LoansTab.load_loans`` when PyQt5 is available
+(run offscreen).  Results are written as JSON and can be compared with an
+earlier run.
+
+A dataset given with ``--db`` is copied first and the cases run on the
+copy, so the write cases leave it untouched and later runs start from the
+same data.  The sizes recorded are counted in the dataset.
+
+Usage::
+
+    python -m benchmarks.run --books 100000 --loans 1000000 --out after.json --compare before.json
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import database
+from benchmarks.datagen import generate
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss_kb():
+    """Peak resident set size of this process in KiB, or None if unknown."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def percentile(samples, pct):
+    index = min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))
+    return samples[index]
+
+
+def measure(func, repeat, max_seconds):
+    """Call ``func`` up to ``repeat`` times (or until ``max_seconds``)."""
+    samples = []
+    started = time.perf_counter()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+        if time.perf_counter() - started > max_seconds:
+            break
+    total = sum(samples)
+    samples.sort()
+    return {
+        'calls': len(samples),
+        'mean_ms': total / len(samples) * 1000,
+        'p50_ms': percentile(samples, 50) * 1000,
+        'p95_ms': percentile(samples, 95) * 1000,
+        'p99_ms': percentile(samples, 99) * 1000,
+        'ops_per_sec': len(samples) / total if total else None,
+        'peak_rss_kb': peak_rss_kb(),
+    }
+
+
+def dataset_sizes(path):
+    """Row counts of the dataset at ``path``."""
+    conn = sqlite3.connect(path)
+    try:
+        return {name: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+                for name, table in (('books', 'books'), ('users', 'users'),
+                                    ('loans', 'loans'), ('archived_loans', 'loans_archive'))}
+    finally:
+        conn.close()
+
+
+def copy_dataset(source, target):
+    """Copy the database at ``source`` to ``target`` with the backup API."""
+    src, dst = sqlite3.connect(source), sqlite3.connect(target)
+    try:
+        src.backup(dst)
+    finally:
+        dst.close()
+        src.close()
+
+
+def sample_ids(table, count=997):
+    """About ``count`` ids spread evenly over ``table``."""
+    with database.connection() as conn:
+        rows = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+        step = max(1, rows // count)
+        return [row[0] for row in conn.execute(
+            f'SELECT id FROM {table} WHERE id % ? = 0 ORDER BY id LIMIT ?', (step, count))]
+
+
+def model_cases():
+    """``(name, callable)`` pairs covering every model method."""
+    from models import BookModel, UserModel, LoanModel
+    from overdue import run_overdue_jobs
+
+    counter = itertools.count(1)
+    book_ids = itertools.cycle(sample_ids('books'))
+    user_ids = itertools.cycle(sample_ids('users'))
+    loan_ids = itertools.cycle(sample_ids('loans'))
+    open_loans, added_books, added_users = [], [], []
+
+    def add_book():
+        n = next(counter)
+        book = BookModel.add_book(f'Bench Book {n}', 'Bench Author', f'bench-{n}', 'Bench', 3)
+        if book:
+            added_books.append(book.id)
+
+    def delete_book():
+        if added_books:
+            BookModel.delete_book(added_books.pop())
+
+    def add_user():
+        n = next(counter)
+        user = UserModel.add_user(f'Bench User {n}', f'bench{n}@example.org', '', '')
+        if user:
+            added_users.append(user.id)
+
+    def update_user():
+        n = next(counter)
+        UserModel.update_user(next(user_ids), f'Updated User {n}', f'updated{n}@example.org', '', '')
+
+    def delete_user():
+        if added_users:
+            UserModel.delete_user(added_users.pop())
+
+    def create_loan():
+        loan = LoanModel.create_loan(next(user_ids), next(book_ids))
+        if loan:
+            open_loans.append(loan['id'])
+
+    def return_book():
+        if open_loans:
+            LoanModel.return_book(open_loans.pop())
+
+    def create_loans_batch():
+        open_loans.extend(filter(None, LoanModel.create_loans_batch(
+            [(next(user_ids), next(book_ids)) for _ in range(50)])))
+
+    def return_loans_batch():
+        batch = [open_loans.pop() for _ in range(min(50, len(open_loans)))]
+        LoanModel.return_loans_batch(batch)
+
+    def walk_pages(fetch_page, pages=10):
+        def run():
+            after = None
+            for _ in range(pages):
+                _, after = fetch_page(after)
+                if after is None:
+                    break
+        return run
+
+    return [
+        ('BookModel.get_all_books', BookModel.get_all_books),
+        ('BookModel.get_books_page x10', walk_pages(BookModel.get_books_page)),
+        ('BookModel.get_book_by_id', lambda: BookModel.get_book_by_id(next(book_ids))),
+        ('BookModel.search_books', lambda: BookModel.search_books('golden river')),
+        ('BookModel.find_available_books', lambda: BookModel.find_available_books('Star')),
+        ('BookModel.add_book', add_book),
+        ('BookModel.update_book', lambda: BookModel.update_book(
+            next(book_ids), 'Updated Title', 'Bench Author', None, 'Bench', 3)),
+        ('BookModel.delete_book', delete_book),
+        ('UserModel.get_all_users', UserModel.get_all_users),
+        ('UserModel.get_users_page x10', walk_pages(UserModel.get_users_page)),
+        ('UserModel.get_user_by_id', lambda: UserModel.get_user_by_id(next(user_ids))),
+        ('UserModel.search_users', lambda: UserModel.search_users('sara')),
+        ('UserModel.find_users', lambda: UserModel.find_users('Om')),
+        ('UserModel.add_user', add_user),
+        ('UserModel.update_user', update_user),
+        ('UserModel.delete_user', delete_user),
+        ('LoanModel.get_loan', lambda: LoanModel.get_loan(next(loan_ids))),
+        ('LoanModel.create_loan', create_loan),
+        ('LoanModel.return_book', return_book),
+        ('LoanModel.create_loans_batch x50', create_loans_batch),
+        ('LoanModel.return_loans_batch x50', return_loans_batch),
+        ('LoanModel.get_all_loans', LoanModel.get_all_loans),
+        ('LoanModel.get_active_loans', LoanModel.get_active_loans),
+        ('LoanModel.get_loans_page x10', walk_pages(LoanModel.get_loans_page)),
+        ('LoanModel.get_active_loans_page x10', walk_pages(LoanModel.get_active_loans_page)),
+        ('LoanModel.get_overdue_loans_page x10', walk_pages(LoanModel.get_overdue_loans_page)),
+        ('overdue.run_overdue_jobs', run_overdue_jobs),
+        ('LoanModel.get_most_borrowed_books', LoanModel.get_most_borrowed_books),
+    ]
+
+
+def gui_cases():
+    """Table-fill paths of the tabs, or nothing if PyQt5 is not installed."""
+    try:
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        from PyQt5.QtWidgets import QApplication
+        import main
+    except ImportError:
+        return []
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+    books_tab = main.BooksTab()
+    loans_tab = main.LoansTab()
+
+    def fill(load):
+        def run():
+            load()
+            app.processEvents()
+        return run
+
+    return [
+        ('BooksTab.load_books', fill(books_tab.load_books)),
+        ('LoansTab.load_loans', fill(loans_tab.load_loans)),
+    ]
+
+
+def run(sizes, repeat, max_seconds, db=None, use_cache=False):
+    from cache import query_cache
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / 'bench.db'
+        source = Path(db) if db else path
+        if not source.exists():
+            started = time.perf_counter()
+            generate(source, sizes['books'], sizes['users'], sizes['loans'])
+            sys.stderr.write(f'generated dataset in {time.perf_counter() - started:.1f}s\n')
+        if source != path:
+            copy_dataset(source, path)
+        database.DB_PATH = path
+        database.init_database()
+        sizes = dataset_sizes(path)
+        database.configure_pool(path)
+        query_cache.enabled = use_cache
+        results = {}
+        try:
+            for name, func in model_cases() + gui_cases():
+                sys.stderr.write(f'{name} ...\n')
+                results[name] = measure(func, repeat, max_seconds)
+        finally:
+            database.close_pool()
+
+    return {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'sizes': sizes,
+            'repeat': repeat,
+            'cache': use_cache,
+        },
+        'results': results,
+        'peak_rss_kb': peak_rss_kb(),
+    }
+
+
+def compare(current, baseline):
+    """Print p50/p99 ratios of ``current`` against ``baseline`` per case."""
+    print(f"{'case':<40} {'p50 ms':>10} {'base':>10} {'ratio':>7} {'p99 ratio':>10}")
+    for name, result in current['results'].items():
+        base = baseline.get('results', {}).get(name)
+        if base is None:
+            print(f"{name:<40} {result['p50_ms']:>10.3f} {'-':>10}")
+            continue
+        ratio = result['p50_ms'] / base['p50_ms'] if base['p50_ms'] else float('nan')
+        tail = result['p99_ms'] / base['p99_ms'] if base['p99_ms'] else float('nan')
+        print(f"{name:<40} {result['p50_ms']:>10.3f} {base['p50_ms']:>10.3f} "
+              f"{ratio:>6.2f}x {tail:>9.2f}x")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the library model layer.')
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--loans', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=200, help='calls per case')
+    parser.add_argument('--max-seconds', type=float, default=10.0, help='time budget per case')
+    parser.add_argument('--db', help='reuse (or create) this dataset; the cases run on a copy of it')
+    parser.add_argument('--cache', action='store_true', help='leave the query cache enabled')
+    parser.add_argument('--out', help='write JSON results here (default: stdout)')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    args = parser.parse_args(argv)
+
+    sizes = {'books': args.books, 'users': args.users, 'loans': args.loans}
+    report = run(sizes, args.repeat, args.max_seconds, args.db, args.cache)
+    text = json.dumps(report, indent=2)
+    if args.out:
+        Path(args.out).write_text(text)
+    else:
+        print(text)
+    if args.compare:
+        compare(report, json.loads(Path(args.compare).read_text()))
+
+
+if __name__ == '__main__':
+    main()
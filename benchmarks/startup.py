@@ -0,0 +1,63 @@
+"""Cold-start timing of the GUI.
+
+Launches ``main.py --startup-timing`` (offscreen) several times against a
+synthetic dataset and reports the median milliseconds from process start to
+each milestone: imports done, window created, first paint, first tab loaded
+and interactive.
+
+Usage::
+
+    python -m benchmarks.startup --runs 5 --books 100000 --loans 1000000
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+from benchmarks.datagen import generate
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def measure_once(path):
+    env = dict(os.environ, QT_QPA_PLATFORM='offscreen')
+    result = subprocess.run(
+        [sys.executable, str(ROOT / 'main.py'), '--db', str(path), '--startup-timing'],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True, timeout=300)
+    return json.loads(result.stdout)
+
+
+def run(sizes, runs, db=None):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(db) if db else Path(tmp) / 'startup.db'
+        if not path.exists():
+            generate(path, sizes['books'], sizes['users'], sizes['loans'])
+        samples = [measure_once(path) for _ in range(runs)]
+    return {
+        'sizes': sizes,
+        'runs': runs,
+        'median_ms': {name: statistics.median(sample[name] for sample in samples)
+                      for name in samples[0]},
+        'samples': samples,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure GUI cold-start time.')
+    parser.add_argument('--books', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--loans', type=int, default=100000)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--db', help='reuse (or create) this dataset instead of a temporary one')
+    args = parser.parse_args(argv)
+
+    sizes = {'books': args.books, 'users': args.users, 'loans': args.loans}
+    print(json.dumps(run(sizes, args.runs, args.db), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,303 @@
+"""Streaming bulk import of catalogue records (CSV, JSONL or MARC 21).
+
+Input is parsed one record at a time and written in large ``executemany``
+batches, one transaction per batch, so memory use does not depend on the
+size of the input file.  Secondary book indexes, the search-index triggers
+and the change-log triggers are dropped for the duration of the load and
+rebuilt once at the end; the change log then gets a single "reload books"
+entry instead of one row per book.  If the process is killed before that,
+the next ``database.init_database`` finishes the rebuild
+(``migrations.repair_book_load``).
+
+Usage::
+
+    python bulk_import.py acquisitions.csv --on-duplicate update
+    python bulk_import.py feed.mrc --format marc --report duplicates.txt
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+from itertools import islice
+from pathlib import Path
+
+import database
+from cache import invalidates
+from database import connection, transaction
+from changefeed import log_reload
+from migrations import BOOK_INDEXES, book_load_statements
+
+BATCH_SIZE = 5000
+DUPLICATE_MODES = ('skip', 'update', 'report')
+
+# Largest number of ISBNs looked up in one ``IN (...)`` query.
+_LOOKUP_CHUNK = 500
+
+_INSERT = '''
+    INSERT INTO books (title, author, isbn, category, total_copies, available_copies)
+    VALUES (?, ?, ?, ?, ?, ?)
+'''
+
+_UPSERT = {
+    'skip': _INSERT + ' ON CONFLICT (isbn) DO NOTHING',
+    'report': _INSERT + ' ON CONFLICT (isbn) DO NOTHING',
+    'update': _INSERT + '''
+        ON CONFLICT (isbn) DO UPDATE SET
+            title = excluded.title,
+            author = excluded.author,
+            category = excluded.category,
+            available_copies = available_copies + excluded.total_copies - total_copies,
+            total_copies = excluded.total_copies
+    ''',
+}
+
+
+# -- Readers ----------------------------------------------------------------
+
+def read_csv(stream):
+    """Yield records from a CSV file with a header row."""
+    yield from csv.DictReader(stream)
+
+
+def read_jsonl(stream):
+    """Yield records from a file with one JSON object per line."""
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def _subfield(raw, code):
+    for part in raw.split(b'\x1f')[1:]:
+        if part[:1] == code:
+            return part[1:]
+    return None
+
+
+def read_marc(stream):
+    """Yield records from an ISO 2709 (MARC 21) binary stream."""
+    while True:
+        leader = stream.read(24)
+        if len(leader) < 24 or not leader.strip():
+            return
+        length = int(leader[:5])
+        base = int(leader[12:17])
+        encoding = 'utf-8' if leader[9:10] == b'a' else 'latin-1'
+        body = stream.read(length - 24)
+        directory = body[:base - 25]
+        data = body[base - 24:]
+
+        fields = {}
+        for i in range(0, len(directory) - 11, 12):
+            tag = directory[i:i + 3].decode('ascii')
+            size = int(directory[i + 3:i + 7])
+            start = int(directory[i + 7:i + 12])
+            fields.setdefault(tag, data[start:start + size].rstrip(b'\x1e'))
+
+        def value(*sources):
+            for tag, code in sources:
+                if tag in fields:
+                    raw = _subfield(fields[tag], code)
+                    if raw:
+                        return raw.decode(encoding, 'replace').strip(' /:;,.')
+            return None
+
+        isbn = value(('020', b'a'))
+        yield {
+            'title': value(('245', b'a')),
+            'author': value(('100', b'a'), ('110', b'a'), ('245', b'c')),
+            'isbn': isbn.split()[0] if isbn else None,
+            'category': value(('650', b'a'), ('082', b'a')),
+        }
+
+
+READERS = {'csv': read_csv, 'jsonl': read_jsonl, 'marc': read_marc}
+
+
+def open_records(path, fmt=None):
+    """Yield records from ``path``, choosing the reader from the extension."""
+    path = Path(path)
+    if fmt is None:
+        fmt = {'.jsonl': 'jsonl', '.ndjson': 'jsonl', '.mrc': 'marc',
+               '.marc': 'marc'}.get(path.suffix.lower(), 'csv')
+    if fmt == 'marc':
+        with open(path, 'rb') as stream:
+            yield from read_marc(stream)
+    else:
+        with open(path, newline='', encoding='utf-8-sig') as stream:
+            yield from READERS[fmt](stream)
+
+
+# -- Loader -----------------------------------------------------------------
+
+def to_row(record):
+    """Normalise a record to an insert tuple, or None if it is unusable."""
+    title = (record.get('title') or '').strip()
+    author = (record.get('author') or '').strip()
+    if not title or not author:
+        return None
+    isbn = (record.get('isbn') or '').strip() or None
+    category = (record.get('category') or '').strip() or None
+    try:
+        copies = max(1, int(record.get('total_copies') or 1))
+    except (TypeError, ValueError):
+        copies = 1
+    return (title, author, isbn, category, copies, copies)
+
+
+def _existing_isbns(conn, isbns):
+    found = set()
+    isbns = list(isbns)
+    for i in range(0, len(isbns), _LOOKUP_CHUNK):
+        chunk = isbns[i:i + _LOOKUP_CHUNK]
+        marks = ', '.join('?' * len(chunk))
+        found.update(isbn for isbn, in conn.execute(
+            f'SELECT isbn FROM books WHERE isbn IN ({marks})', chunk))
+    return found
+
+
+def drop_book_indexes(conn):
+    """Drop secondary book indexes, search and change-log triggers ahead of a bulk load."""
+    for name in BOOK_INDEXES:
+        conn.execute(f'DROP INDEX IF EXISTS {name}')
+    for suffix in ('ai', 'ad', 'au'):
+        conn.execute(f'DROP TRIGGER IF EXISTS books_fts_{suffix}')
+        conn.execute(f'DROP TRIGGER IF EXISTS changes_books_{suffix}')
+
+
+def rebuild_book_indexes(conn):
+    """Recreate what ``drop_book_indexes`` removed and refresh statistics."""
+    with transaction():
+        for statement in book_load_statements(conn):
+            conn.execute(statement)
+        has_change_log = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'changes'").fetchone()
+        if has_change_log:
+            # One "reload books" entry instead of a change row per book.
+            log_reload(conn, 'books')
+    conn.execute('PRAGMA optimize')
+
+
+@invalidates('books')
+def import_books(records, on_duplicate='skip', batch_size=BATCH_SIZE,
+                 defer_indexes=True, progress=None, report=None):
+    """Insert ``records`` (an iterable of mappings) into ``books``.
+
+    ``on_duplicate`` decides what happens to a record whose ISBN already
+    exists: ``skip`` it, ``update`` the existing book, or ``report`` it (skip
+    and write ``isbn<TAB>title`` to the ``report`` stream).  ``progress`` is
+    called with the running stats after every batch.  Returns the stats.
+    """
+    if on_duplicate not in DUPLICATE_MODES:
+        raise ValueError(f'on_duplicate must be one of {DUPLICATE_MODES}')
+    sql = _UPSERT[on_duplicate]
+    stats = {'read': 0, 'inserted': 0, 'updated': 0, 'duplicates': 0,
+             'invalid': 0, 'seconds': 0.0, 'rows_per_sec': 0.0}
+    start = time.perf_counter()
+    records = iter(records)
+
+    with connection() as conn:
+        if defer_indexes:
+            with transaction():
+                drop_book_indexes(conn)
+        try:
+            while True:
+                batch = list(islice(records, batch_size))
+                if not batch:
+                    break
+                stats['read'] += len(batch)
+                rows = []
+                for record in batch:
+                    row = to_row(record)
+                    if row is None:
+                        stats['invalid'] += 1
+                    else:
+                        rows.append(row)
+
+                with transaction():
+                    # Counted from the lookup, not total_changes, which also
+                    # counts the rows written by triggers.
+                    existing = _existing_isbns(conn, {r[2] for r in rows if r[2]})
+                    fresh, duplicates = [], []
+                    for row in rows:
+                        isbn = row[2]
+                        if isbn and isbn in existing:
+                            duplicates.append(row)
+                        else:
+                            fresh.append(row)
+                            if isbn:
+                                existing.add(isbn)
+                    if on_duplicate == 'update':
+                        conn.executemany(sql, rows)
+                        stats['inserted'] += len(fresh)
+                        stats['updated'] += len(duplicates)
+                    else:
+                        conn.executemany(sql, fresh)
+                        stats['inserted'] += len(fresh)
+                        stats['duplicates'] += len(duplicates)
+                        if report is not None:
+                            report.writelines(f'{row[2]}\t{row[0]}\n'
+                                              for row in duplicates)
+                counted = (stats['inserted'] + stats['updated']
+                           + stats['duplicates'] + stats['invalid'])
+                if counted != stats['read']:
+                    raise RuntimeError(f'import stats do not add up: {stats}')
+
+                stats['seconds'] = time.perf_counter() - start
+                stats['rows_per_sec'] = stats['read'] / stats['seconds']
+                if progress is not None:
+                    progress(stats)
+        finally:
+            if defer_indexes:
+                rebuild_book_indexes(conn)
+
+    stats['seconds'] = time.perf_counter() - start
+    stats['rows_per_sec'] = stats['read'] / stats['seconds'] if stats['seconds'] else 0.0
+    return stats
+
+
+def _print_progress(stats):
+    sys.stderr.write(f"\r{stats['read']:,} rows  {stats['rows_per_sec']:,.0f} rows/s")
+    sys.stderr.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Bulk import books into the catalogue.')
+    parser.add_argument('file', help='CSV, JSONL or MARC 21 file')
+    parser.add_argument('--format', choices=sorted(READERS), help='input format (default: by extension)')
+    parser.add_argument('--on-duplicate', choices=DUPLICATE_MODES, default='skip')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    parser.add_argument('--report', help='write duplicate ISBNs here (with --on-duplicate report)')
+    parser.add_argument('--keep-indexes', action='store_true',
+                        help='maintain indexes during the load instead of rebuilding them')
+    parser.add_argument('--db', help='database file (default: library.db)')
+    args = parser.parse_args(argv)
+
+    if args.db:
+        database.DB_PATH = Path(args.db)
+    database.init_database()
+    database.configure_pool(database.DB_PATH)
+
+    report = open(args.report, 'w', encoding='utf-8') if args.report else None
+    try:
+        stats = import_books(open_records(args.file, args.format),
+                             on_duplicate=args.on_duplicate,
+                             batch_size=args.batch_size,
+                             defer_indexes=not args.keep_indexes,
+                             progress=_print_progress,
+                             report=report)
+    finally:
+        if report is not None:
+            report.close()
+        database.close_pool()
+
+    sys.stderr.write('\n')
+    print(f"read {stats['read']:,}  inserted {stats['inserted']:,}  "
+          f"updated {stats['updated']:,}  duplicates {stats['duplicates']:,}  "
+          f"invalid {stats['invalid']:,}  in {stats['seconds']:.1f}s "
+          f"({stats['rows_per_sec']:,.0f} rows/s)")
+
+
+if __name__ == '__main__':
+    main()
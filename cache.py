@@ -0,0 +1,173 @@
+"""Write-aware LRU cache for model read methods.
+
+Read methods are wrapped with ``@cached(*tables)`` and write methods with
+``@invalidates(*tables)``.  Every table has a version counter that writes
+bump; a cached result is served only while the versions of all the tables
+it was computed from are unchanged, so invalidation is exact for writes made
+through the models.
+
+Writes from other processes are detected with ``PRAGMA data_version`` on a
+dedicated watcher connection: when it moves the whole cache is dropped.  It
+moves on local commits too, so every pool transaction reports its commit
+(``database.COMMIT_HOOKS``): just before COMMIT, with the write lock held,
+any move is external; right after it, the new version is adopted as our
+own unless the writing connection's data_version, which ignores its own
+commits, shows that another connection committed in between.
+"""
+import functools
+import sqlite3
+import threading
+from collections import OrderedDict
+
+import database
+
+MAX_ENTRIES = 256
+
+
+class QueryCache:
+    """Bounded LRU of query results keyed on call arguments."""
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.enabled = True
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+        self._watcher = None
+        self._watched_path = None
+        self._data_version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    # -- cross-process change detection ------------------------------------
+
+    def _current_data_version(self):
+        path = database.get_pool().path
+        if self._watcher is None or self._watched_path != path:
+            if self._watcher is not None:
+                self._watcher.close()
+            self._watcher = sqlite3.connect(path, check_same_thread=False)
+            self._watched_path = path
+            self._entries.clear()
+            self._data_version = None
+        return self._watcher.execute('PRAGMA data_version').fetchone()[0]
+
+    def _check_external(self):
+        version = self._current_data_version()
+        if self._data_version is not None and version != self._data_version:
+            self.invalidations += 1
+            self._entries.clear()
+        self._data_version = version
+
+    # -- public API ---------------------------------------------------------
+
+    def local_commit(self, conn):
+        """Commit hook for a pool transaction on ``conn`` (write lock held)."""
+        with self._lock:
+            if self._watcher is None:
+                return None  # nothing has been cached yet
+            self._check_external()
+            before = conn.execute('PRAGMA data_version').fetchone()[0]
+
+        def committed():
+            with self._lock:
+                version = self._current_data_version()
+                if conn.execute('PRAGMA data_version').fetchone()[0] != before:
+                    # Another connection committed after ours, before the
+                    # watcher was read.
+                    self.invalidations += 1
+                    self._entries.clear()
+                self._data_version = version
+        return committed
+
+    def bump(self, *tables):
+        """Record a local write to ``tables``."""
+        with self._lock:
+            for table in tables:
+                self._versions[table] = self._versions.get(table, 0) + 1
+            self.invalidations += 1
+
+    def get_or_compute(self, key, tables, compute):
+        """Return the cached result for ``key`` or compute and store it."""
+        if not self.enabled:
+            return compute()
+        with self._lock:
+            self._check_external()
+            snapshot = tuple(self._versions.get(table, 0) for table in tables)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == snapshot:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        value = compute()
+
+        with self._lock:
+            # Only store the result if no write happened while computing it.
+            if snapshot == tuple(self._versions.get(table, 0) for table in tables):
+                self._entries[key] = (snapshot, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        return value
+
+    def clear(self):
+        """Drop every cached result."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Hit/miss statistics as a dictionary."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+            }
+
+
+query_cache = QueryCache()
+database.COMMIT_HOOKS.append(query_cache.local_commit)
+
+
+def cached(*tables):
+    """Cache a read method's results until one of ``tables`` is written."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (func.__qualname__, args, tuple(sorted(kwargs.items())))
+            try:
+                hash(key)
+            except TypeError:
+                return func(*args, **kwargs)
+            return query_cache.get_or_compute(key, tables, lambda: func(*args, **kwargs))
+        return wrapper
+    return decorator
+
+
+def invalidates(*tables):
+    """Bump the versions of ``tables`` after a write method runs."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            try:
+                return func(*args, **kwargs)
+            finally:
+                query_cache.bump(*tables)
+        wrapper.invalidates = tables
+        return wrapper
+    return decorator
+
+
+def cache_stats():
+    """Hit/miss statistics of the shared query cache."""
+    return query_cache.stats()
@@ -0,0 +1,113 @@
+"""Follow the ``changes`` log to see what other connections wrote.
+
+Triggers append one row per insert, update and delete on books, users and
+loans to ``changes`` (see ``migrations.create_change_log``).  A
+``ChangeFeed`` remembers the last ``seq`` it has seen and, when polled,
+returns only the rows changed since then::
+
+    feed = ChangeFeed()
+    changes = feed.poll()   # None, or {'books': {12: 'update'}, 'loans': None}
+
+Polling is cheap when nothing happened: ``PRAGMA data_version`` on the
+feed's own connection only moves when some other connection commits, so an
+idle poll is a single pragma read.  A table maps to None instead of its
+changed rows when it must be reloaded as a whole: after a bulk load, when
+more than ``MAX_CHANGES`` rows changed at once, or when the log was
+compacted past the feed's position.
+
+The feed sees every commit, including this process's own, so consumers
+must treat a change as "re-read this row" rather than as an event to apply
+once.
+"""
+import sqlite3
+
+import database
+from migrations import CHANGE_LOG_TABLES
+
+POLL_INTERVAL_MS = 1000
+# Above this many changed rows per poll the tables are reloaded instead.
+MAX_CHANGES = 500
+
+
+class ChangeFeed:
+    """Reads new ``changes`` rows on a dedicated connection."""
+
+    def __init__(self, path=None, max_changes=MAX_CHANGES):
+        self.path = path or database.get_pool().path
+        self.max_changes = max_changes
+        self._conn = None
+        self._data_version = None
+        self.last_seq = None
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=database.BUSY_TIMEOUT,
+                                         isolation_level=None, check_same_thread=False)
+        return self._conn
+
+    def start(self):
+        """Start following from the current end of the log."""
+        conn = self._connection()
+        self._data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+        self.last_seq = latest_seq(conn)
+
+    def poll(self):
+        """Return ``{table: {row_id: op} or None}`` for changes since the last poll.
+
+        Returns None when nothing was committed since.  ``op`` is ``insert``
+        when the row did not exist at the previous poll, otherwise the last
+        operation (``update`` or ``delete``).
+        """
+        if self.last_seq is None:
+            self.start()
+            return None
+        conn = self._connection()
+        version = conn.execute('PRAGMA data_version').fetchone()[0]
+        if version == self._data_version:
+            return None
+        self._data_version = version
+
+        conn.execute('BEGIN')
+        try:
+            compacted = conn.execute(
+                'SELECT compacted_through FROM change_log_state').fetchone()[0]
+            if compacted > self.last_seq:
+                self.last_seq = latest_seq(conn)
+                return dict.fromkeys(CHANGE_LOG_TABLES)
+            rows = conn.execute('''
+                SELECT seq, table_name, row_id, op FROM changes
+                WHERE seq > ? ORDER BY seq LIMIT ?
+            ''', (self.last_seq, self.max_changes + 1)).fetchall()
+            if len(rows) > self.max_changes:
+                self.last_seq = latest_seq(conn)
+                return dict.fromkeys(CHANGE_LOG_TABLES)
+        finally:
+            conn.execute('COMMIT')
+        if not rows:
+            return None
+
+        changes = {}
+        for seq, table, row_id, op in rows:
+            self.last_seq = seq
+            if op == 'reload' or (table in changes and changes[table] is None):
+                changes[table] = None
+                continue
+            table_changes = changes.setdefault(table, {})
+            if table_changes.get(row_id) != 'insert':
+                table_changes[row_id] = op
+        return changes
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+def latest_seq(conn):
+    """The highest ``seq`` in the change log (0 if it is empty)."""
+    return conn.execute('SELECT COALESCE(MAX(seq), 0) FROM changes').fetchone()[0]
+
+
+def log_reload(conn, table):
+    """Tell followers to reload ``table``, e.g. after a load that bypassed the triggers."""
+    conn.execute("INSERT INTO changes (table_name, op) VALUES (?, 'reload')", (table,))
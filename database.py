@@ -1,55 +1,55 @@
+import base64
+import bisect
+import functools
+import json
+import queue
+import re
 import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from pathlib import Path
 
+from migrations import migrate, repair_book_load
+
 DB_PATH = Path(__file__).parent / 'library.db'
 
+POOL_SIZE = 4
+BUSY_TIMEOUT = 5.0
+
+# Called as ``hook(conn)`` by every pool transaction just before COMMIT, with
+# the write lock held; a callable it returns runs right after the COMMIT
+# (see cache.QueryCache.local_commit).
+COMMIT_HOOKS = []
+
+# Applied to every connection when it is opened, read-only ones included.
+READ_PRAGMAS = (
+    'PRAGMA mmap_size = 268435456',
+    'PRAGMA cache_size = -16000',
+    'PRAGMA temp_store = MEMORY',
+)
+# Applied to every pooled connection when it is opened.
+CONNECTION_PRAGMAS = (
+    'PRAGMA journal_mode = WAL',
+    'PRAGMA synchronous = NORMAL',
+) + READ_PRAGMAS
+
 
 def init_database():
-    """Initialize database with all required tables."""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS books (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            title TEXT NOT NULL,
-            author TEXT NOT NULL,
-            isbn TEXT UNIQUE,
-            category TEXT,
-            total_copies INTEGER DEFAULT 1,
-            available_copies INTEGER DEFAULT 1,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            email TEXT UNIQUE,
-            phone TEXT,
-            address TEXT,
-            membership_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS loans (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            book_id INTEGER NOT NULL,
-            loan_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            due_date TIMESTAMP,
-            return_date TIMESTAMP,
-            status TEXT DEFAULT 'active',
-            FOREIGN KEY (user_id) REFERENCES users(id),
-            FOREIGN KEY (book_id) REFERENCES books(id)
-        )
-    ''')
-
-    conn.commit()
-    conn.close()
+    """Initialize database with all required tables.
+
+    Applies any pending migrations and finishes a bulk load that was killed
+    mid-way; when neither is needed this costs a ``PRAGMA user_version`` and
+    a ``sqlite_master`` read and runs no DDL.
+    """
+    conn = sqlite3.connect(DB_PATH, isolation_level=None)
+    try:
+        migrate(conn)
+        repair_book_load(conn)
+    finally:
+        conn.close()
 
 
 def get_connection():
@@ -57,9 +57,348 @@ def get_connection():
     return sqlite3.connect(DB_PATH)
 
 
+def connect_read_only(path=None):
+    """Open a read-only connection (``mode=ro`` URI) outside the pool.
+
+    For other processes, e.g. report workers: it can never write or take a
+    write lock, and in WAL mode it reads alongside the app's writers.
+    """
+    uri = Path(path or DB_PATH).resolve().as_uri() + '?mode=ro'
+    conn = sqlite3.connect(uri, uri=True, isolation_level=None)
+    for pragma in READ_PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
+
+class ConnectionPool:
+    """Thread-aware pool of long-lived, tuned database connections.
+
+    A thread that already holds a connection gets the same one back, so
+    nested ``connection()``/``transaction()`` blocks share one unit of work.
+    """
+
+    def __init__(self, path=None, size=POOL_SIZE, timeout=BUSY_TIMEOUT):
+        self.path = path or DB_PATH
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=self.timeout,
+                               isolation_level=None, check_same_thread=False)
+        for pragma in CONNECTION_PRAGMAS:
+            conn.execute(pragma)
+        instrumentation.attach(conn)
+        return conn
+
+    def _checkout(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if len(self._connections) < self.size:
+                conn = self._connect()
+                self._connections.append(conn)
+                return conn
+        # Waits as long as SQLite waits for a lock, and fails the same way.
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError(
+                f'no pooled connection became free within {self.timeout}s '
+                f'(all {self.size} are in use)') from None
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of the block."""
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            yield held
+            return
+        conn = self._checkout()
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            if conn.in_transaction:
+                conn.rollback()
+            if instrumentation.enabled:
+                instrumentation.flush()
+            self._idle.put(conn)
+
+    @contextmanager
+    def transaction(self):
+        """Run the block as one write transaction, rolled back on error."""
+        with self.connection() as conn:
+            if conn.in_transaction:
+                yield conn
+                return
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+                after = [hook(conn) for hook in COMMIT_HOOKS]
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+            for committed in after:
+                if committed is not None:
+                    committed()
+
+    def close(self):
+        """Close every connection opened by the pool."""
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+            self._idle = queue.LifoQueue()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_PATH)
+    return _pool
+
+
+def configure_pool(path=None, size=POOL_SIZE):
+    """Replace the process-wide pool, e.g. to point it at another file."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = ConnectionPool(path or DB_PATH, size)
+    return _pool
+
+
+def close_pool():
+    """Close the process-wide pool."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+def connection():
+    """Borrow a pooled connection: ``with connection() as conn: ...``."""
+    return get_pool().connection()
+
+
+def transaction():
+    """Borrow a pooled connection inside a transaction."""
+    return get_pool().transaction()
+
+
 def dict_factory(cursor, row):
     """Convert database row to dictionary."""
     d = {}
     for idx, col in enumerate(cursor.description):
         d[col[0]] = row[idx]
     return d
+
+
+# Upper bounds (ms) of the latency histogram buckets; the last one is open.
+HISTOGRAM_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+SLOW_QUERY_MS = 100
+SLOW_LOG_SIZE = 200
+
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACE = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    """Collapse whitespace and replace literals with ``?`` to group statements."""
+    return _SPACE.sub(' ', _LITERAL.sub('?', sql)).strip()
+
+
+class LatencyHistogram:
+    """Count, total, max and bucketed latencies of one statement or method."""
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.rows = 0
+        self.buckets = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+
+    def add(self, ms, rows=0):
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.rows += rows
+        self.buckets[bisect.bisect_left(HISTOGRAM_BUCKETS_MS, ms)] += 1
+
+    def to_dict(self):
+        labels = [f'<={bound}' for bound in HISTOGRAM_BUCKETS_MS] + [f'>{HISTOGRAM_BUCKETS_MS[-1]}']
+        return {
+            'count': self.count,
+            'total_ms': round(self.total_ms, 3),
+            'mean_ms': round(self.total_ms / self.count, 3) if self.count else 0.0,
+            'max_ms': round(self.max_ms, 3),
+            'rows': self.rows,
+            'histogram_ms': dict(zip(labels, self.buckets)),
+        }
+
+
+class Instrumentation:
+    """Statement and model-method latency statistics plus a slow-query log.
+
+    Statements are observed through ``Connection.set_trace_callback``.  SQLite
+    reports when a statement starts, so a statement's latency is measured up
+    to the next statement on the same thread or until its connection goes
+    back to the pool, whichever comes first.  Slow statements get their
+    ``EXPLAIN QUERY PLAN`` captured when the stats are read.  While disabled
+    no trace callback is installed and model wrappers cost one attribute
+    check.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.slow_query_ms = SLOW_QUERY_MS
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.statements = {}
+            self.methods = {}
+            self.slow_queries = deque(maxlen=SLOW_LOG_SIZE)
+
+    def enable(self, slow_query_ms=None):
+        """Start collecting; ``slow_query_ms`` sets the slow-log threshold."""
+        if slow_query_ms is not None:
+            self.slow_query_ms = slow_query_ms
+        self.enabled = True
+        for conn in list(get_pool()._connections):
+            self.attach(conn)
+
+    def disable(self):
+        self.enabled = False
+        for conn in list(get_pool()._connections):
+            conn.set_trace_callback(None)
+
+    def attach(self, conn):
+        conn.set_trace_callback(self._trace if self.enabled else None)
+
+    def _trace(self, sql):
+        if sql.startswith('--'):
+            return  # statement run by a trigger or virtual table; part of the outer one
+        now = time.perf_counter()
+        self._finish(now)
+        self._local.pending = (sql, now)
+
+    def _finish(self, now):
+        pending = getattr(self._local, 'pending', None)
+        if pending is None:
+            return
+        self._local.pending = None
+        sql, started = pending
+        ms = (now - started) * 1000
+        key = normalize_sql(sql)
+        with self._lock:
+            self.statements.setdefault(key, LatencyHistogram()).add(ms)
+            if ms >= self.slow_query_ms:
+                self.slow_queries.append({'sql': sql, 'ms': round(ms, 3),
+                                          'at': time.time(), 'plan': None})
+
+    def flush(self):
+        """Close the statement in flight on this thread, if any."""
+        self._finish(time.perf_counter())
+
+    def record_call(self, name, ms, rows):
+        with self._lock:
+            self.methods.setdefault(name, LatencyHistogram()).add(ms, rows)
+
+    def _explain_slow_queries(self):
+        pending = [entry for entry in self.slow_queries if entry['plan'] is None]
+        if not pending:
+            return
+        conn = sqlite3.connect(get_pool().path)
+        try:
+            for entry in pending:
+                if not re.match(r'\s*(SELECT|WITH|INSERT|UPDATE|DELETE)\b',
+                                entry['sql'], re.IGNORECASE):
+                    entry['plan'] = []
+                    continue
+                try:
+                    entry['plan'] = [row[3] for row in
+                                     conn.execute('EXPLAIN QUERY PLAN ' + entry['sql'])]
+                except sqlite3.Error as exc:
+                    entry['plan'] = [f'unavailable: {exc}']
+        finally:
+            conn.close()
+
+    def snapshot(self):
+        """All collected statistics as a JSON-serialisable dictionary."""
+        self._explain_slow_queries()
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'slow_query_ms': self.slow_query_ms,
+                'methods': {name: h.to_dict() for name, h in sorted(self.methods.items())},
+                'statements': {sql: h.to_dict() for sql, h in sorted(
+                    self.statements.items(), key=lambda item: -item[1].total_ms)},
+                'slow_queries': list(self.slow_queries),
+            }
+
+    def export_json(self, path):
+        """Write ``snapshot()`` to ``path``."""
+        with open(path, 'w', encoding='utf-8') as fh:
+            json.dump(self.snapshot(), fh, indent=2, ensure_ascii=False)
+
+
+instrumentation = Instrumentation()
+
+
+def _row_count(result):
+    if isinstance(result, tuple) and result and isinstance(result[0], list):
+        return len(result[0])  # (rows, cursor) from the page methods
+    if isinstance(result, list):
+        return len(result)
+    return 0 if result is None else 1
+
+
+def timed(name, func):
+    """Wrap ``func`` so its calls are recorded under ``name`` while enabled."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not instrumentation.enabled:
+            return func(*args, **kwargs)
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        instrumentation.record_call(name, (time.perf_counter() - start) * 1000,
+                                    _row_count(result))
+        return result
+    return wrapper
+
+
+def instrument_model(cls):
+    """Class decorator: time every public static method of a model class."""
+    for attr, value in list(vars(cls).items()):
+        if isinstance(value, staticmethod) and not attr.startswith('_'):
+            setattr(cls, attr, staticmethod(timed(f'{cls.__name__}.{attr}', value.__func__)))
+    return cls
+
+
+def encode_cursor(key):
+    """Pack a pagination sort key into an opaque continuation token."""
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_cursor(token):
+    """Unpack a continuation token made by ``encode_cursor``."""
+    return json.loads(base64.urlsafe_b64decode(token.encode()))
@@ -0,0 +1,286 @@
+"""Streaming export of loans, books and users (CSV, JSONL or chunked columns).
+
+Rows are read with ``fetchmany`` in chunks of ``CHUNK_SIZE`` and each chunk
+is written out before the next one is read, through a buffered and
+optionally gzip-compressed stream, so peak memory depends on the chunk size
+and not on the size of the table.  Date-range and status filters become
+``WHERE`` clauses of the export query.
+
+Formats:
+
+* ``csv``: a header row, then one row per record.
+* ``jsonl``: one JSON object per record.
+* ``columns``: gzip-compressed JSON lines; a header line naming the table
+  and its columns, then one line per chunk holding the values column by
+  column (``{"rows": n, "data": [[...], ...]}``).  ``read_columns`` streams
+  the records back.
+
+Usage::
+
+    python export.py loans loans.csv.gz --since 2024-01-01 --status overdue
+    python export.py loans history.csv.gz --history
+    python export.py books books.jsonl
+    python export.py users users.cols --format columns
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import os
+import sys
+import time
+from datetime import date
+from pathlib import Path
+
+import database
+from database import connection
+
+CHUNK_SIZE = 5000
+BUFFER_SIZE = 1 << 20
+GZIP_LEVEL = 6
+
+# models.LOAN_SELECT with the joins written as CROSS JOIN, which makes SQLite
+# keep the loans as the outer loop: with statistics saying a table is small
+# it may otherwise start from users and sort the result.
+_LOAN_EXPORT_SELECT = '''
+    SELECT {t}.id, {t}.user_id, {t}.book_id, u.name, b.title,
+           {t}.loan_date, {t}.due_date, {t}.return_date, {t}.status
+    FROM {table} {t}
+    CROSS JOIN users u ON u.id = {t}.user_id
+    CROSS JOIN books b ON b.id = {t}.book_id
+'''
+LOAN_EXPORT_SELECT = _LOAN_EXPORT_SELECT.format(table='loans', t='l')
+# Live and archived loans, as models.LOAN_HISTORY_SELECT.
+LOAN_HISTORY_EXPORT_SELECT = f'''
+    SELECT * FROM (
+        {LOAN_EXPORT_SELECT}
+        UNION ALL
+        {_LOAN_EXPORT_SELECT.format(table='loans_archive', t='a')}
+    ) l
+'''
+
+# table -> (query, date column for --since/--until, status column or None,
+#           ORDER BY, ORDER BY with a date range, ORDER BY with a status
+# only).  Every order follows the index the filter is searched with, so
+# SQLite never has to sort (and hold) the whole result; export_plans checks
+# that in the benchmarks.
+TABLES = {
+    'loans': (LOAN_EXPORT_SELECT, 'l.loan_date', 'l.status', 'l.id', 'l.loan_date, l.id',
+              'l.status, l.due_date, l.id'),
+    'books': ('SELECT * FROM books', 'created_at', None, 'id', 'id', None),
+    'users': ('SELECT * FROM users', 'membership_date', None, 'id', 'id', None),
+}
+# Loans including the archive; the UNION ALL is merged on loan_date so both
+# halves are read in index order.  The archive has no status index.
+LOAN_HISTORY = (LOAN_HISTORY_EXPORT_SELECT, 'l.loan_date', 'l.status', 'l.loan_date, l.id',
+                'l.loan_date, l.id', 'l.loan_date, l.id')
+FORMATS = ('csv', 'jsonl', 'columns')
+STATUSES = ('active', 'overdue', 'returned')
+COLUMNS_FORMAT_VERSION = 1
+
+
+def build_query(table, since=None, until=None, status=None, history=False):
+    """The export query for ``table`` and its parameters; dates are inclusive.
+
+    ``history`` adds archived loans to a loans export.
+    """
+    if history and table != 'loans':
+        raise ValueError('history applies to loans only')
+    select, date_column, status_column, order, ranged_order, status_order = (
+        LOAN_HISTORY if history else TABLES[table])
+    where, params = [], []
+    if since:
+        where.append(f'{date_column} >= ?')
+        params.append(str(since))
+    if until:
+        where.append(f"{date_column} < date(?, '+1 day')")
+        params.append(str(until))
+    if status:
+        if status_column is None:
+            raise ValueError(f'{table} cannot be filtered by status')
+        where.append(f'{status_column} = ?')
+        params.append(status)
+    sql = select
+    if where:
+        sql += ' WHERE ' + ' AND '.join(where)
+    if since or until:
+        order = ranged_order
+    elif status:
+        order = status_order
+    return f'{sql} ORDER BY {order}', params
+
+
+def query_plan(conn, table, since=None, until=None, status=None, history=False):
+    """The ``EXPLAIN QUERY PLAN`` details of an export query."""
+    sql, params = build_query(table, since, until, status, history)
+    return [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+
+
+def count_rows(table, since=None, until=None, status=None, history=False):
+    """How many rows an export with these filters will write."""
+    sql, params = build_query(table, since, until, status, history)
+    with connection() as conn:
+        return conn.execute(f'SELECT COUNT(*) FROM ({sql})', params).fetchone()[0]
+
+
+def iter_chunks(sql, params, chunk_size=CHUNK_SIZE):
+    """Yield the column names, then lists of at most ``chunk_size`` row tuples."""
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        cursor.execute(sql, params)
+        yield [column[0] for column in cursor.description]
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield rows
+
+
+# -- Writers ------------------------------------------------------------------
+# Each writer takes the open text stream, the column names and the chunks,
+# and yields the number of rows written after every chunk.
+
+def write_csv(out, table, columns, chunks):
+    writer = csv.writer(out)
+    writer.writerow(columns)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield len(rows)
+
+
+def write_jsonl(out, table, columns, chunks):
+    dumps = json.JSONEncoder(ensure_ascii=False).encode
+    for rows in chunks:
+        out.write(''.join(dumps(dict(zip(columns, row))) + '\n' for row in rows))
+        yield len(rows)
+
+
+def write_columns(out, table, columns, chunks):
+    dumps = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+    out.write(dumps({'format': 'columns', 'version': COLUMNS_FORMAT_VERSION,
+                     'table': table, 'columns': columns}) + '\n')
+    for rows in chunks:
+        out.write(dumps({'rows': len(rows), 'data': [list(values) for values in zip(*rows)]}))
+        out.write('\n')
+        yield len(rows)
+
+
+WRITERS = {'csv': write_csv, 'jsonl': write_jsonl, 'columns': write_columns}
+
+
+def read_columns(path):
+    """Yield the records of a ``columns`` export as dictionaries, one chunk at a time."""
+    with gzip.open(path, 'rt', encoding='utf-8') as stream:
+        header = json.loads(stream.readline())
+        columns = header['columns']
+        for line in stream:
+            chunk = json.loads(line)
+            for row in zip(*chunk['data']):
+                yield dict(zip(columns, row))
+
+
+def format_for(path):
+    """Guess the format from the file name, ignoring a trailing ``.gz``."""
+    path = Path(path)
+    suffix = path.suffix.lower()
+    if suffix == '.gz':
+        suffix = Path(path.stem).suffix.lower()
+    return {'.jsonl': 'jsonl', '.ndjson': 'jsonl', '.cols': 'columns'}.get(suffix, 'csv')
+
+
+def open_output(path, compress=False):
+    """Open ``path`` as a text stream with a large write buffer, gzip-compressed if asked."""
+    if compress:
+        raw = io.BufferedWriter(gzip.GzipFile(path, 'wb', compresslevel=GZIP_LEVEL), BUFFER_SIZE)
+        return io.TextIOWrapper(raw, encoding='utf-8', newline='')
+    return open(path, 'w', encoding='utf-8', newline='', buffering=BUFFER_SIZE)
+
+
+def export(table, path, fmt=None, compress=None, since=None, until=None, status=None,
+           chunk_size=CHUNK_SIZE, progress=None, cancelled=None, history=False):
+    """Write ``table`` to ``path`` and return the stats.
+
+    ``fmt`` defaults to the one suggested by the file name and ``compress``
+    to whether it ends in ``.gz``; the ``columns`` format is always
+    compressed.  ``progress(written, total)`` is called after every chunk.
+    When ``cancelled()`` turns true the export stops between chunks and the
+    partial file is removed.
+    """
+    fmt = fmt or format_for(path)
+    if fmt not in WRITERS:
+        raise ValueError(f'format must be one of {FORMATS}')
+    if compress is None:
+        compress = str(path).endswith('.gz')
+    compress = compress or fmt == 'columns'
+    sql, params = build_query(table, since, until, status, history)
+    total = count_rows(table, since, until, status, history) if progress is not None else None
+    stats = {'table': table, 'format': fmt, 'rows': 0, 'cancelled': False,
+             'seconds': 0.0, 'rows_per_sec': 0.0}
+    start = time.perf_counter()
+
+    chunks = iter_chunks(sql, params, chunk_size)
+    try:
+        columns = next(chunks)
+        with open_output(path, compress) as out:
+            for written in WRITERS[fmt](out, table, columns, chunks):
+                stats['rows'] += written
+                if progress is not None:
+                    progress(stats['rows'], total)
+                if cancelled is not None and cancelled():
+                    stats['cancelled'] = True
+                    break
+    finally:
+        chunks.close()
+    if stats['cancelled']:
+        os.remove(path)
+
+    stats['seconds'] = time.perf_counter() - start
+    stats['rows_per_sec'] = stats['rows'] / stats['seconds'] if stats['seconds'] else 0.0
+    return stats
+
+
+def _print_progress(written, total):
+    sys.stderr.write(f'\r{written:,} / {total:,} rows')
+    sys.stderr.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Export loans, books or users.')
+    parser.add_argument('table', choices=sorted(TABLES))
+    parser.add_argument('file', help='output file; a .gz suffix compresses it')
+    parser.add_argument('--format', choices=FORMATS, help='output format (default: by extension)')
+    parser.add_argument('--gzip', action='store_true', help='compress whatever the file name')
+    parser.add_argument('--since', type=date.fromisoformat, help='first date (YYYY-MM-DD) to include')
+    parser.add_argument('--until', type=date.fromisoformat, help='last date (YYYY-MM-DD) to include')
+    parser.add_argument('--status', choices=STATUSES,
+                        help='only loans with this status')
+    parser.add_argument('--history', action='store_true',
+                        help='include archived loans')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--db', help='database file (default: library.db)')
+    args = parser.parse_args(argv)
+    if args.status and args.table != 'loans':
+        parser.error('--status applies to loans only')
+    if args.history and args.table != 'loans':
+        parser.error('--history applies to loans only')
+
+    if args.db:
+        database.DB_PATH = Path(args.db)
+    database.init_database()
+    database.configure_pool(database.DB_PATH)
+    try:
+        stats = export(args.table, args.file, args.format, args.gzip or None,
+                       args.since, args.until, args.status, args.chunk_size,
+                       progress=_print_progress, history=args.history)
+    finally:
+        database.close_pool()
+
+    sys.stderr.write('\n')
+    print(f"exported {stats['rows']:,} {args.table} as {stats['format']} "
+          f"in {stats['seconds']:.1f}s ({stats['rows_per_sec']:,.0f} rows/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,32 @@
+import time
+PROCESS_START = time.perf_counter()
+
+import argparse
+import functools
+import importlib
+import json
 import sys
 import warnings
+from datetime import datetime
+from pathlib import Path
 warnings.filterwarnings('ignore', category=DeprecationWarning)
 
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QTabWidget, QWidget, QVBoxLayout,
                              QHBoxLayout, QPushButton, QTableWidget, QTableWidgetItem,
+                             QTableView, QAbstractItemView, QHeaderView,
                              QDialog, QLabel, QLineEdit, QSpinBox, QMessageBox,
-                             QComboBox, QTextEdit)
-from PyQt5.QtCore import Qt, QDateTime, QSize
-from PyQt5.QtGui import QFont, QIcon, QColor
-from database import init_database
+                             QComboBox, QTextEdit, QListWidget, QListWidgetItem,
+                             QCompleter, QFileDialog, QProgressBar, QCheckBox, QDateEdit)
+from PyQt5.QtCore import Qt, QDate, QDateTime, QSize, QModelIndex, QTimer, pyqtSignal
+from PyQt5.QtGui import QFont, QIcon, QColor, QStandardItemModel, QStandardItem
+
+import database
+from database import instrumentation
 from models import BookModel, UserModel, LoanModel
-from datetime import datetime
+from table_models import LazyTableModel, Order, list_pager, date_text
+# workers, search, reports and parallel_reports are imported by the tabs
+# that use them, so they load with their tab, or on a worker thread once the
+# window is interactive, instead of at startup.
 
 
 STYLESHEET = """
@@ -81,19 +97,19 @@ STYLESHEET = """
         font-weight: 500;
     }
     
-    QTableWidget {
+    QTableView {
         border: 1px solid #bdc3c7;
         gridline-color: #ecf0f1;
         background-color: white;
     }
     
-    QTableWidget::item {
+    QTableView::item {
         padding: 5px;
         border-right: 1px solid #ecf0f1;
         border-bottom: 1px solid #ecf0f1;
     }
     
-    QTableWidget::item:selected {
+    QTableView::item:selected {
         background-color: #3498db;
         color: white;
     }
@@ -111,6 +127,157 @@ STYLESHEET = """
     }
 """
 
+BOOK_COLUMNS = [
+    ('ID', 'id'),
+    ('العنوان', 'title'),
+    ('المؤلف', 'author'),
+    ('ISBN', 'isbn'),
+    ('الفئة', 'category'),
+    ('العدد الكلي', 'total_copies'),
+    ('المتاح', 'available_copies'),
+]
+
+USER_COLUMNS = [
+    ('ID', 'id'),
+    ('الاسم', 'name'),
+    ('البريد الإلكتروني', 'email'),
+    ('الهاتف', 'phone'),
+    ('العنوان', 'address'),
+]
+
+LOAN_COLUMNS = [
+    ('ID', 'id'),
+    ('المستخدم', 'name'),
+    ('الكتاب', 'title'),
+    ('تاريخ الإعارة', 'loan_date', date_text),
+    ('تاريخ الاستحقاق', 'due_date', date_text),
+    ('تاريخ الإرجاع', 'return_date', date_text),
+    ('الحالة', 'status'),
+    ('User ID', 'user_id'),
+    ('Book ID', 'book_id'),
+]
+
+
+BOOK_ORDER = Order('title', 'id')
+USER_ORDER = Order('name', 'id')
+
+# Loans filter text -> (pager, its sort order, status shown or None for all)
+LOAN_VIEWS = {
+    'جميع الإعارات': (LoanModel.get_loans_page, Order('loan_date', 'id', descending=True), None),
+    'الإعارات النشطة فقط': (LoanModel.get_active_loans_page, Order('due_date', 'id'), 'active'),
+    'الإعارات المتأخرة فقط': (LoanModel.get_overdue_loans_page, Order('due_date', 'id'), 'overdue'),
+    'السجل الكامل (مع الأرشيف)': (functools.partial(LoanModel.get_loans_page, history=True),
+                                  Order('loan_date', 'id', descending=True), None),
+}
+
+# The parallel_reports report of analytics.analyze (NumPy).
+DEMAND_REPORT = 'demand'
+# Reports combo text -> reports.REPORTS name, parallel_reports.REPORTS name (run in
+# worker processes), or None for the most-borrowed books
+REPORT_VIEWS = {
+    'أكثر الكتب استعارة': None,
+    'الإعارات حسب التصنيف': 'circulation',
+    'المستخدمون النشطون أسبوعياً': 'active-users',
+    'متوسط مدة الإعارة حسب التصنيف': 'loan-duration',
+    'نسبة التأخير حسب التصنيف': 'overdue-rate',
+    'تخطيط الطلب وعدد النسخ': DEMAND_REPORT,
+    'السجل الكامل للإعارات حسب التصنيف': 'loan-history',
+}
+REPORT_PERIODS = [('شهري', 'month'), ('أسبوعي', 'week'), ('يومي', 'day'), ('سنوي', 'year')]
+REPORT_HEADERS = {
+    'id': 'ID', 'title': 'العنوان', 'author': 'المؤلف', 'borrow_count': 'عدد الإعارات',
+    'period': 'الفترة', 'category': 'التصنيف', 'checkouts': 'الإعارات',
+    'returns': 'الإرجاعات', 'users': 'المستخدمون النشطون', 'average_days': 'متوسط المدة (أيام)',
+    'due': 'المستحقة', 'late': 'المتأخرة', 'late_percent': 'نسبة التأخير %',
+    'book_id': 'ID', 'total_copies': 'النسخ الحالية', 'forecast': 'الطلب المتوقع',
+    'loan_days': 'متوسط المدة (أيام)', 'needed': 'النسخ المطلوبة', 'shortfall': 'النقص',
+}
+MOST_BORROWED_COLUMNS = ('id', 'title', 'author', 'borrow_count')
+
+EXPORT_TABLES = [('الإعارات', 'loans'), ('الكتب', 'books'), ('المستخدمون', 'users')]
+EXPORT_STATUSES = [('كل الحالات', None), ('نشطة', 'active'), ('متأخرة', 'overdue'),
+                   ('مرجعة', 'returned')]
+# Save dialog filter -> (format, gzip)
+EXPORT_FILTERS = {
+    'CSV (*.csv)': ('csv', False),
+    'CSV gzip (*.csv.gz)': ('csv', True),
+    'JSON Lines (*.jsonl)': ('jsonl', False),
+    'JSON Lines gzip (*.jsonl.gz)': ('jsonl', True),
+    'Columns (*.cols)': ('columns', True),
+}
+
+
+def user_label_text(user):
+    return f"{user['name']} - {user['email']}" if user['email'] else user['name']
+
+
+def book_label_text(book):
+    return f"{book['title']} - {book['author']}"
+
+
+def create_table_view(model):
+    """Build a row-selecting table view over a LazyTableModel."""
+    table = QTableView()
+    table.setModel(model)
+    table.horizontalHeader().setStretchLastSection(True)
+    table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+    table.verticalHeader().setDefaultSectionSize(30)
+    table.setSelectionBehavior(QAbstractItemView.SelectRows)
+    return table
+
+
+class RecordPicker(QLineEdit):
+    """Type-ahead picker backed by an indexed, limited query.
+
+    ``find(prefix)`` runs on a worker thread after a short debounce and its
+    records are listed in the completer popup; ``record_id`` holds the ID of
+    the record the user picked, or None.
+    """
+
+    picked = pyqtSignal(object, str)
+
+    def __init__(self, find, label, parent=None):
+        super().__init__(parent)
+        self.label = label
+        self.record_id = None
+        self.results = QStandardItemModel(self)
+        self.completer = QCompleter(self.results, self)
+        self.completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        self.completer.activated[QModelIndex].connect(self.pick)
+        self.setCompleter(self.completer)
+        from workers import SearchScheduler
+        self.searcher = SearchScheduler(lambda conn, prefix: find(prefix), self,
+                                        debounce_ms=150)
+        self.searcher.results_ready.connect(self.show_results)
+        self.searcher.failed.connect(self.search_failed)
+        self.textEdited.connect(self.lookup)
+
+    def lookup(self, text):
+        self.record_id = None
+        prefix = text.strip()
+        if prefix:
+            self.searcher.schedule(prefix)
+        else:
+            self.searcher.cancel()
+            self.results.clear()
+
+    def show_results(self, prefix, records):
+        self.results.clear()
+        self.setToolTip('')
+        for record in records:
+            item = QStandardItem(self.label(record))
+            item.setData(record['id'], Qt.UserRole)
+            self.results.appendRow(item)
+        self.completer.complete()
+
+    def search_failed(self, prefix, message):
+        self.results.clear()
+        self.setToolTip(f'Search failed: {message}')
+
+    def pick(self, index):
+        self.record_id = index.data(Qt.UserRole)
+        self.picked.emit(self.record_id, index.data())
+
 
 class BookDialog(QDialog):
     def __init__(self, parent=None, book=None):
@@ -284,13 +451,14 @@ class UserDialog(QDialog):
 
 
 class LoanDialog(QDialog):
-    def __init__(self, parent=None):
+    def __init__(self, parent=None, batch=False):
         super().__init__(parent)
+        self.batch = batch
         self.init_ui()
 
     def init_ui(self):
-        self.setWindowTitle('إنشاء إعارة جديدة')
-        self.setGeometry(100, 100, 450, 280)
+        self.setWindowTitle('إعارة جماعية' if self.batch else 'إنشاء إعارة جديدة')
+        self.setGeometry(100, 100, 450, 480 if self.batch else 280)
         self.setMinimumWidth(450)
         
         layout = QVBoxLayout()
@@ -300,18 +468,26 @@ class LoanDialog(QDialog):
         user_label = QLabel('المستخدم:')
         user_label.setFont(QFont('Arial', 10, QFont.Bold))
         layout.addWidget(user_label)
-        self.user_combo = QComboBox()
-        self.user_combo.setMinimumHeight(35)
-        self.load_users()
-        layout.addWidget(self.user_combo)
+        self.user_picker = RecordPicker(UserModel.find_users, user_label_text)
+        self.user_picker.setPlaceholderText('اكتب الاسم أو البريد الإلكتروني...')
+        self.user_picker.setMinimumHeight(35)
+        layout.addWidget(self.user_picker)
         
-        book_label = QLabel('الكتاب:')
+        book_label = QLabel('الكتب:' if self.batch else 'الكتاب:')
         book_label.setFont(QFont('Arial', 10, QFont.Bold))
         layout.addWidget(book_label)
-        self.book_combo = QComboBox()
-        self.book_combo.setMinimumHeight(35)
-        self.load_books()
-        layout.addWidget(self.book_combo)
+        self.book_picker = RecordPicker(BookModel.find_available_books, book_label_text)
+        self.book_picker.setPlaceholderText('اكتب العنوان أو ISBN...')
+        self.book_picker.setMinimumHeight(35)
+        layout.addWidget(self.book_picker)
+        if self.batch:
+            # Picked books collect in a list; double-click removes one.
+            self.book_picker.picked.connect(self.add_book)
+            self.book_list = QListWidget()
+            self.book_list.setMinimumHeight(200)
+            self.book_list.itemDoubleClicked.connect(
+                lambda item: self.book_list.takeItem(self.book_list.row(item)))
+            layout.addWidget(self.book_list)
         
         days_label = QLabel('مدة الإعارة (بالأيام):')
         days_label.setFont(QFont('Arial', 10, QFont.Bold))
@@ -332,7 +508,7 @@ class LoanDialog(QDialog):
         cancel_btn = QPushButton('❌ إلغاء')
         cancel_btn.setMinimumHeight(40)
         cancel_btn.setMinimumWidth(120)
-        create_btn.clicked.connect(self.accept)
+        create_btn.clicked.connect(self.validate)
         cancel_btn.clicked.connect(self.reject)
         btn_layout.addStretch()
         btn_layout.addWidget(create_btn)
@@ -341,23 +517,34 @@ class LoanDialog(QDialog):
         
         self.setLayout(layout)
 
-    def load_users(self):
-        users = UserModel.get_all_users()
-        for user in users:
-            self.user_combo.addItem(user['name'], user['id'])
+    def add_book(self, book_id, label):
+        item = QListWidgetItem(label)
+        item.setData(Qt.UserRole, book_id)
+        self.book_list.addItem(item)
+        # Clear once the completer has finished writing the pick into the box.
+        QTimer.singleShot(0, self.book_picker.clear)
 
-    def load_books(self):
-        books = BookModel.get_all_books()
-        for book in books:
-            if book['available_copies'] > 0:
-                self.book_combo.addItem(f"{book['title']} - {book['author']}", book['id'])
+    def validate(self):
+        if self.user_picker.record_id is None:
+            QMessageBox.warning(self, 'Error', 'Please pick a user from the list')
+        elif not self.batch and self.book_picker.record_id is None:
+            QMessageBox.warning(self, 'Error', 'Please pick a book from the list')
+        elif self.batch and self.book_list.count() == 0:
+            QMessageBox.warning(self, 'Error', 'Please select at least one book')
+        else:
+            self.accept()
 
     def get_data(self):
-        return {
-            'user_id': self.user_combo.currentData(),
-            'book_id': self.book_combo.currentData(),
+        data = {
+            'user_id': self.user_picker.record_id,
             'days': self.days_input.value()
         }
+        if self.batch:
+            data['book_ids'] = [self.book_list.item(row).data(Qt.UserRole)
+                                for row in range(self.book_list.count())]
+        else:
+            data['book_id'] = self.book_picker.record_id
+        return data
 
 
 class BooksTab(QWidget):
@@ -380,12 +567,14 @@ class BooksTab(QWidget):
         self.search_input.textChanged.connect(self.search_books)
         layout.addWidget(self.search_input)
         
-        self.table = QTableWidget()
-        self.table.setColumnCount(7)
-        self.table.setHorizontalHeaderLabels(['ID', 'العنوان', 'المؤلف', 'ISBN', 'الفئة', 'العدد الكلي', 'المتاح'])
-        self.table.horizontalHeader().setStretchLastSection(True)
-        self.table.setRowHeight(25, 30)
-        self.table.setSelectionBehavior(1)
+        import search
+        from workers import SearchScheduler
+        self.searcher = SearchScheduler(search.search_books, self)
+        self.searcher.results_ready.connect(self.show_search_results)
+        self.searcher.failed.connect(self.search_failed)
+        
+        self.model = LazyTableModel(BOOK_COLUMNS, self)
+        self.table = create_table_view(self.model)
         layout.addWidget(self.table)
         
         btn_layout = QHBoxLayout()
@@ -410,7 +599,7 @@ class BooksTab(QWidget):
         refresh_btn = QPushButton('🔄 تحديث')
         refresh_btn.setMinimumHeight(40)
         refresh_btn.setMinimumWidth(100)
-        refresh_btn.clicked.connect(self.load_books)
+        refresh_btn.clicked.connect(self.refresh_books)
         
         btn_layout.addWidget(add_btn)
         btn_layout.addWidget(edit_btn)
@@ -423,33 +612,39 @@ class BooksTab(QWidget):
         self.load_books()
 
     def load_books(self):
-        books = BookModel.get_all_books()
-        self.table.setRowCount(len(books))
-        for row, book in enumerate(books):
-            self.table.setItem(row, 0, QTableWidgetItem(str(book['id'])))
-            self.table.setItem(row, 1, QTableWidgetItem(book['title']))
-            self.table.setItem(row, 2, QTableWidgetItem(book['author']))
-            self.table.setItem(row, 3, QTableWidgetItem(book['isbn'] or ''))
-            self.table.setItem(row, 4, QTableWidgetItem(book['category'] or ''))
-            self.table.setItem(row, 5, QTableWidgetItem(str(book['total_copies'])))
-            self.table.setItem(row, 6, QTableWidgetItem(str(book['available_copies'])))
+        self.model.reset(BookModel.get_books_page, BOOK_ORDER)
+
+    def refresh_books(self):
+        """Reload the rows shown: the current search's results, or the whole catalogue."""
+        keyword = self.search_input.text()
+        if keyword:
+            self.searcher.schedule(keyword)
+        else:
+            self.load_books()
 
     def search_books(self):
         keyword = self.search_input.text()
         if keyword:
-            books = BookModel.search_books(keyword)
+            self.searcher.schedule(keyword)
         else:
-            books = BookModel.get_all_books()
-        
-        self.table.setRowCount(len(books))
-        for row, book in enumerate(books):
-            self.table.setItem(row, 0, QTableWidgetItem(str(book['id'])))
-            self.table.setItem(row, 1, QTableWidgetItem(book['title']))
-            self.table.setItem(row, 2, QTableWidgetItem(book['author']))
-            self.table.setItem(row, 3, QTableWidgetItem(book['isbn'] or ''))
-            self.table.setItem(row, 4, QTableWidgetItem(book['category'] or ''))
-            self.table.setItem(row, 5, QTableWidgetItem(str(book['total_copies'])))
-            self.table.setItem(row, 6, QTableWidgetItem(str(book['available_copies'])))
+            self.searcher.cancel()
+            self.load_books()
+
+    def show_search_results(self, keyword, books):
+        self.model.reset(list_pager(books))
+
+    def search_failed(self, keyword, message):
+        QMessageBox.warning(self, 'Error', f'Search failed: {message}')
+
+    def apply_changes(self, changes):
+        """Refresh the rows other app instances changed (see ``changefeed``)."""
+        if 'books' not in changes:
+            return
+        keyword = self.search_input.text()
+        if keyword:
+            self.searcher.schedule(keyword)
+        elif not self.model.apply_changes(changes['books'], BookModel.get_book_by_id):
+            self.load_books()
 
     def add_book(self):
         dialog = BookDialog(self)
@@ -460,43 +655,48 @@ class BooksTab(QWidget):
                                        data['total_copies'])
             if result:
                 QMessageBox.information(self, 'Success', 'Book added successfully')
-                self.load_books()
+                if not self.model.insert_record(result):
+                    self.refresh_books()
             else:
                 QMessageBox.warning(self, 'Error', 'Failed to add book (ISBN may be duplicate)')
 
     def edit_book(self):
-        row = self.table.currentRow()
-        if row < 0:
+        book = self.model.record(self.table.currentIndex().row())
+        if book is None:
             QMessageBox.warning(self, 'Error', 'Please select a book')
             return
         
-        book_id = int(self.table.item(row, 0).text())
+        book_id = book['id']
+        shown = book
         book = BookModel.get_book_by_id(book_id)
         
         dialog = BookDialog(self, book)
         if dialog.exec_() == QDialog.Accepted:
             data = dialog.get_data()
-            if BookModel.update_book(book_id, data['title'], data['author'],
-                                    data['isbn'], data['category'], 
-                                    data['total_copies']):
+            updated = BookModel.update_book(book_id, data['title'], data['author'],
+                                            data['isbn'], data['category'],
+                                            data['total_copies'])
+            if updated:
                 QMessageBox.information(self, 'Success', 'Book updated successfully')
-                self.load_books()
+                if not self.model.replace_record(shown, updated):
+                    self.refresh_books()
             else:
                 QMessageBox.warning(self, 'Error', 'Failed to update book')
 
     def delete_book(self):
-        row = self.table.currentRow()
-        if row < 0:
+        book = self.model.record(self.table.currentIndex().row())
+        if book is None:
             QMessageBox.warning(self, 'Error', 'Please select a book')
             return
         
-        book_id = int(self.table.item(row, 0).text())
+        book_id = book['id']
         reply = QMessageBox.question(self, 'Confirm', 'Delete this book?',
                                     QMessageBox.Yes | QMessageBox.No)
         if reply == QMessageBox.Yes:
             if BookModel.delete_book(book_id):
                 QMessageBox.information(self, 'Success', 'Book deleted successfully')
-                self.load_books()
+                if not self.model.remove_record(book):
+                    self.refresh_books()
             else:
                 QMessageBox.warning(self, 'Error', 'Failed to delete book')
 
@@ -521,11 +721,14 @@ class UsersTab(QWidget):
         self.search_input.textChanged.connect(self.search_users)
         layout.addWidget(self.search_input)
         
-        self.table = QTableWidget()
-        self.table.setColumnCount(5)
-        self.table.setHorizontalHeaderLabels(['ID', 'الاسم', 'البريد الإلكتروني', 'الهاتف', 'العنوان'])
-        self.table.horizontalHeader().setStretchLastSection(True)
-        self.table.setRowHeight(25, 30)
+        import search
+        from workers import SearchScheduler
+        self.searcher = SearchScheduler(search.search_users, self)
+        self.searcher.results_ready.connect(self.show_search_results)
+        self.searcher.failed.connect(self.search_failed)
+        
+        self.model = LazyTableModel(USER_COLUMNS, self)
+        self.table = create_table_view(self.model)
         layout.addWidget(self.table)
         
         btn_layout = QHBoxLayout()
@@ -550,7 +753,7 @@ class UsersTab(QWidget):
         refresh_btn = QPushButton('🔄 تحديث')
         refresh_btn.setMinimumHeight(40)
         refresh_btn.setMinimumWidth(100)
-        refresh_btn.clicked.connect(self.load_users)
+        refresh_btn.clicked.connect(self.refresh_users)
         
         btn_layout.addWidget(add_btn)
         btn_layout.addWidget(edit_btn)
@@ -563,29 +766,39 @@ class UsersTab(QWidget):
         self.load_users()
 
     def load_users(self):
-        users = UserModel.get_all_users()
-        self.table.setRowCount(len(users))
-        for row, user in enumerate(users):
-            self.table.setItem(row, 0, QTableWidgetItem(str(user['id'])))
-            self.table.setItem(row, 1, QTableWidgetItem(user['name']))
-            self.table.setItem(row, 2, QTableWidgetItem(user['email'] or ''))
-            self.table.setItem(row, 3, QTableWidgetItem(user['phone'] or ''))
-            self.table.setItem(row, 4, QTableWidgetItem(user['address'] or ''))
+        self.model.reset(UserModel.get_users_page, USER_ORDER)
+
+    def refresh_users(self):
+        """Reload the rows shown: the current search's results, or all users."""
+        keyword = self.search_input.text()
+        if keyword:
+            self.searcher.schedule(keyword)
+        else:
+            self.load_users()
 
     def search_users(self):
         keyword = self.search_input.text()
         if keyword:
-            users = UserModel.search_users(keyword)
+            self.searcher.schedule(keyword)
         else:
-            users = UserModel.get_all_users()
-        
-        self.table.setRowCount(len(users))
-        for row, user in enumerate(users):
-            self.table.setItem(row, 0, QTableWidgetItem(str(user['id'])))
-            self.table.setItem(row, 1, QTableWidgetItem(user['name']))
-            self.table.setItem(row, 2, QTableWidgetItem(user['email'] or ''))
-            self.table.setItem(row, 3, QTableWidgetItem(user['phone'] or ''))
-            self.table.setItem(row, 4, QTableWidgetItem(user['address'] or ''))
+            self.searcher.cancel()
+            self.load_users()
+
+    def show_search_results(self, keyword, users):
+        self.model.reset(list_pager(users))
+
+    def search_failed(self, keyword, message):
+        QMessageBox.warning(self, 'Error', f'Search failed: {message}')
+
+    def apply_changes(self, changes):
+        """Refresh the rows other app instances changed (see ``changefeed``)."""
+        if 'users' not in changes:
+            return
+        keyword = self.search_input.text()
+        if keyword:
+            self.searcher.schedule(keyword)
+        elif not self.model.apply_changes(changes['users'], UserModel.get_user_by_id):
+            self.load_users()
 
     def add_user(self):
         dialog = UserDialog(self)
@@ -595,42 +808,47 @@ class UsersTab(QWidget):
                                        data['phone'], data['address'])
             if result:
                 QMessageBox.information(self, 'Success', 'User added successfully')
-                self.load_users()
+                if not self.model.insert_record(result):
+                    self.refresh_users()
             else:
                 QMessageBox.warning(self, 'Error', 'Failed to add user')
 
     def edit_user(self):
-        row = self.table.currentRow()
-        if row < 0:
+        user = self.model.record(self.table.currentIndex().row())
+        if user is None:
             QMessageBox.warning(self, 'Error', 'Please select a user')
             return
         
-        user_id = int(self.table.item(row, 0).text())
+        user_id = user['id']
+        shown = user
         user = UserModel.get_user_by_id(user_id)
         
         dialog = UserDialog(self, user)
         if dialog.exec_() == QDialog.Accepted:
             data = dialog.get_data()
-            if UserModel.update_user(user_id, data['name'], data['email'],
-                                    data['phone'], data['address']):
+            updated = UserModel.update_user(user_id, data['name'], data['email'],
+                                            data['phone'], data['address'])
+            if updated:
                 QMessageBox.information(self, 'Success', 'User updated successfully')
-                self.load_users()
+                if not self.model.replace_record(shown, updated):
+                    self.refresh_users()
             else:
                 QMessageBox.warning(self, 'Error', 'Failed to update user')
 
     def delete_user(self):
-        row = self.table.currentRow()
-        if row < 0:
+        user = self.model.record(self.table.currentIndex().row())
+        if user is None:
             QMessageBox.warning(self, 'Error', 'Please select a user')
             return
         
-        user_id = int(self.table.item(row, 0).text())
+        user_id = user['id']
         reply = QMessageBox.question(self, 'Confirm', 'Delete this user?',
                                     QMessageBox.Yes | QMessageBox.No)
         if reply == QMessageBox.Yes:
             if UserModel.delete_user(user_id):
                 QMessageBox.information(self, 'Success', 'User deleted successfully')
-                self.load_users()
+                if not self.model.remove_record(user):
+                    self.refresh_users()
             else:
                 QMessageBox.warning(self, 'Error', 'Failed to delete user')
 
@@ -651,7 +869,7 @@ class LoansTab(QWidget):
         
         filter_layout = QHBoxLayout()
         self.filter_combo = QComboBox()
-        self.filter_combo.addItems(['جميع الإعارات', 'الإعارات النشطة فقط'])
+        self.filter_combo.addItems(list(LOAN_VIEWS))
         self.filter_combo.setMinimumHeight(35)
         self.filter_combo.setMaximumWidth(300)
         self.filter_combo.currentTextChanged.connect(self.load_loans)
@@ -659,13 +877,11 @@ class LoansTab(QWidget):
         filter_layout.addStretch()
         layout.addLayout(filter_layout)
         
-        self.table = QTableWidget()
-        self.table.setColumnCount(9)
-        self.table.setHorizontalHeaderLabels(['ID', 'المستخدم', 'الكتاب', 'تاريخ الإعارة', 'تاريخ الاستحقاق', 'تاريخ الإرجاع', 'الحالة', 'User ID', 'Book ID'])
+        self.model = LazyTableModel(LOAN_COLUMNS, self)
+        self.table = create_table_view(self.model)
+        self.table.setSelectionMode(QAbstractItemView.ExtendedSelection)
         self.table.setColumnHidden(7, True)
         self.table.setColumnHidden(8, True)
-        self.table.horizontalHeader().setStretchLastSection(True)
-        self.table.setRowHeight(25, 30)
         layout.addWidget(self.table)
         
         btn_layout = QHBoxLayout()
@@ -676,6 +892,11 @@ class LoansTab(QWidget):
         new_loan_btn.setMinimumWidth(130)
         new_loan_btn.clicked.connect(self.create_loan)
         
+        batch_loan_btn = QPushButton('📚 إعارة جماعية')
+        batch_loan_btn.setMinimumHeight(40)
+        batch_loan_btn.setMinimumWidth(130)
+        batch_loan_btn.clicked.connect(self.create_batch_loans)
+        
         return_btn = QPushButton('↩️ إرجاع كتاب')
         return_btn.setMinimumHeight(40)
         return_btn.setMinimumWidth(120)
@@ -687,6 +908,7 @@ class LoansTab(QWidget):
         refresh_btn.clicked.connect(self.load_loans)
         
         btn_layout.addWidget(new_loan_btn)
+        btn_layout.addWidget(batch_loan_btn)
         btn_layout.addWidget(return_btn)
         btn_layout.addWidget(refresh_btn)
         btn_layout.addStretch()
@@ -696,22 +918,45 @@ class LoansTab(QWidget):
         self.load_loans()
 
     def load_loans(self):
-        if self.filter_combo.currentText() == 'الإعارات النشطة فقط':
-            loans = LoanModel.get_active_loans()
+        fetch_page, order, self.status = LOAN_VIEWS[self.filter_combo.currentText()]
+        self.model.reset(fetch_page, order)
+
+    def show_loan_change(self, old, new):
+        """Patch the table for one created (``old`` None) or changed loan."""
+        shown = new is not None and self.status in (None, new['status'])
+        if old is None:
+            done = not shown or self.model.insert_record(new)
+        elif shown:
+            done = self.model.replace_record(old, new)
         else:
-            loans = LoanModel.get_all_loans()
-        
-        self.table.setRowCount(len(loans))
-        for row, loan in enumerate(loans):
-            self.table.setItem(row, 0, QTableWidgetItem(str(loan['id'])))
-            self.table.setItem(row, 1, QTableWidgetItem(loan['name']))
-            self.table.setItem(row, 2, QTableWidgetItem(loan['title']))
-            self.table.setItem(row, 3, QTableWidgetItem(loan['loan_date'][:10] if loan['loan_date'] else ''))
-            self.table.setItem(row, 4, QTableWidgetItem(loan['due_date'][:10] if loan['due_date'] else ''))
-            self.table.setItem(row, 5, QTableWidgetItem(loan['return_date'][:10] if loan['return_date'] else ''))
-            self.table.setItem(row, 6, QTableWidgetItem(loan['status']))
-            self.table.setItem(row, 7, QTableWidgetItem(str(loan['user_id'])))
-            self.table.setItem(row, 8, QTableWidgetItem(str(loan['book_id'])))
+            done = self.model.remove_record(old)
+        if not done:
+            self.load_loans()
+
+    def current_loan(self, loan_id):
+        """The loan as this view shows it, or None if it is not part of the view."""
+        loan = LoanModel.get_loan(loan_id)
+        if loan is None or self.status not in (None, loan['status']):
+            return None
+        return loan
+
+    def apply_changes(self, changes):
+        """Refresh the loans other app instances changed, and loans showing changed names."""
+        if not changes.keys() & {'loans', 'users', 'books'}:
+            return
+        loans = changes.get('loans', {})
+        if loans is None or any(changes.get(table, {}) is None for table in ('users', 'books')):
+            self.load_loans()
+            return
+        loans = dict(loans)
+        for table, field in (('users', 'user_id'), ('books', 'book_id')):
+            ids = changes.get(table, {})
+            if ids:
+                for loan in self.model.loaded_records():
+                    if loan[field] in ids:
+                        loans.setdefault(loan['id'], 'update')
+        if not self.model.apply_changes(loans, self.current_loan):
+            self.load_loans()
 
     def create_loan(self):
         dialog = LoanDialog(self)
@@ -720,28 +965,59 @@ class LoansTab(QWidget):
             result = LoanModel.create_loan(data['user_id'], data['book_id'], data['days'])
             if result:
                 QMessageBox.information(self, 'Success', 'Loan created successfully')
-                self.load_loans()
+                self.show_loan_change(None, result)
             else:
                 QMessageBox.warning(self, 'Error', 'Failed to create loan')
 
+    def create_batch_loans(self):
+        dialog = LoanDialog(self, batch=True)
+        if dialog.exec_() == QDialog.Accepted:
+            data = dialog.get_data()
+            results = LoanModel.create_loans_batch(
+                [(data['user_id'], book_id) for book_id in data['book_ids']], data['days'])
+            created = sum(1 for result in results if result)
+            if created == len(results):
+                QMessageBox.information(self, 'Success', f'{created} loans created successfully')
+            else:
+                QMessageBox.warning(self, 'Error',
+                                    f'{created} of {len(results)} loans created '
+                                    '(some books have no copies left)')
+            for loan_id in filter(None, results):
+                self.show_loan_change(None, LoanModel.get_loan(loan_id))
+
+    def selected_loans(self):
+        rows = sorted(index.row() for index in self.table.selectionModel().selectedRows())
+        if not rows and self.table.currentIndex().isValid():
+            rows = [self.table.currentIndex().row()]
+        return [loan for loan in map(self.model.record, rows) if loan is not None]
+
     def return_book(self):
-        row = self.table.currentRow()
-        if row < 0:
+        loans = self.selected_loans()
+        if not loans:
             QMessageBox.warning(self, 'Error', 'Please select a loan')
             return
         
-        loan_id = int(self.table.item(row, 0).text())
-        status = self.table.item(row, 6).text()
-        
-        if status != 'active':
-            QMessageBox.warning(self, 'Error', 'Only active loans can be returned')
+        returnable = [loan for loan in loans if loan['status'] != 'returned']
+        loan_ids = [loan['id'] for loan in returnable]
+        if not loan_ids:
+            QMessageBox.warning(self, 'Error', 'Only active or overdue loans can be returned')
             return
         
-        if LoanModel.return_book(loan_id):
+        results = LoanModel.return_loans_batch(loan_ids)
+        returned = sum(results)
+        if len(loans) == 1 and returned:
             QMessageBox.information(self, 'Success', 'Book returned successfully')
-            self.load_loans()
+        elif returned == len(loans):
+            QMessageBox.information(self, 'Success', f'{returned} books returned successfully')
+        elif returned:
+            QMessageBox.warning(self, 'Error',
+                                f'{returned} of {len(loans)} selected loans returned '
+                                '(only active or overdue loans can be returned)')
         else:
             QMessageBox.warning(self, 'Error', 'Failed to return book')
+        for loan, ok in zip(returnable, results):
+            if ok:
+                self.show_loan_change(loan, LoanModel.get_loan(loan['id']))
 
 
 class ReportsTab(QWidget):
@@ -754,66 +1030,517 @@ class ReportsTab(QWidget):
         layout.setSpacing(12)
         layout.setContentsMargins(15, 15, 15, 15)
         
-        title_label = QLabel('📊 التقرير: أكثر الكتب استعارة')
-        title_label.setFont(QFont('Arial', 13, QFont.Bold))
-        layout.addWidget(title_label)
+        self.title_label = QLabel()
+        self.title_label.setFont(QFont('Arial', 13, QFont.Bold))
+        layout.addWidget(self.title_label)
+        
+        report_layout = QHBoxLayout()
+        self.report_combo = QComboBox()
+        self.report_combo.addItems(list(REPORT_VIEWS))
+        self.report_combo.setMinimumHeight(35)
+        report_layout.addWidget(self.report_combo)
+        
+        self.report_period = QComboBox()
+        for text, period in REPORT_PERIODS:
+            self.report_period.addItem(text, period)
+        report_layout.addWidget(self.report_period)
+        
+        report_layout.addWidget(QLabel('من'))
+        self.report_since = QDateEdit(QDate.currentDate().addYears(-1))
+        self.report_since.setCalendarPopup(True)
+        report_layout.addWidget(self.report_since)
+        report_layout.addWidget(QLabel('إلى'))
+        self.report_until = QDateEdit(QDate.currentDate())
+        self.report_until.setCalendarPopup(True)
+        report_layout.addWidget(self.report_until)
+        report_layout.addStretch()
+        layout.addLayout(report_layout)
+        
+        self.report_combo.currentTextChanged.connect(self.load_report)
+        self.report_period.currentIndexChanged.connect(self.load_report)
+        self.report_since.dateChanged.connect(self.load_report)
+        self.report_until.dateChanged.connect(self.load_report)
         
         self.table = QTableWidget()
-        self.table.setColumnCount(4)
-        self.table.setHorizontalHeaderLabels(['ID', 'العنوان', 'المؤلف', 'عدد الإعارات'])
         self.table.horizontalHeader().setStretchLastSection(True)
         self.table.setRowHeight(25, 30)
         layout.addWidget(self.table)
         
+        self.report_summary = QLabel()
+        self.report_summary.setWordWrap(True)
+        layout.addWidget(self.report_summary)
+        
+        from workers import ExportTask, ReportTask
+        self.report_task = ReportTask(self)
+        self.report_task.progress.connect(self.show_report_progress)
+        self.report_task.finished.connect(self.show_parallel_report)
+        self.report_task.failed.connect(self.report_failed)
+        
         btn_layout = QHBoxLayout()
         refresh_btn = QPushButton('🔄 تحديث التقرير')
         refresh_btn.setMinimumHeight(40)
         refresh_btn.setMinimumWidth(130)
         refresh_btn.clicked.connect(self.load_report)
         btn_layout.addWidget(refresh_btn)
+        self.cancel_report_btn = QPushButton('⏹ إيقاف التقرير')
+        self.cancel_report_btn.setMinimumHeight(40)
+        self.cancel_report_btn.setEnabled(False)
+        self.cancel_report_btn.clicked.connect(self.report_task.cancel)
+        btn_layout.addWidget(self.cancel_report_btn)
         btn_layout.addStretch()
         layout.addLayout(btn_layout)
         
+        export_label = QLabel('📤 تصدير البيانات:')
+        export_label.setFont(QFont('Arial', 11, QFont.Bold))
+        layout.addWidget(export_label)
+        
+        export_layout = QHBoxLayout()
+        self.export_table = QComboBox()
+        for text, table in EXPORT_TABLES:
+            self.export_table.addItem(text, table)
+        self.export_table.currentIndexChanged.connect(self.update_export_filters)
+        export_layout.addWidget(self.export_table)
+        
+        self.export_status = QComboBox()
+        for text, status in EXPORT_STATUSES:
+            self.export_status.addItem(text, status)
+        export_layout.addWidget(self.export_status)
+        
+        self.export_history = QCheckBox('مع الأرشيف')
+        export_layout.addWidget(self.export_history)
+        
+        self.export_range = QCheckBox('من')
+        export_layout.addWidget(self.export_range)
+        self.export_since = QDateEdit(QDate.currentDate().addMonths(-1))
+        self.export_since.setCalendarPopup(True)
+        export_layout.addWidget(self.export_since)
+        export_layout.addWidget(QLabel('إلى'))
+        self.export_until = QDateEdit(QDate.currentDate())
+        self.export_until.setCalendarPopup(True)
+        export_layout.addWidget(self.export_until)
+        
+        self.export_btn = QPushButton('📤 تصدير...')
+        self.export_btn.setMinimumHeight(40)
+        self.export_btn.clicked.connect(self.start_export)
+        export_layout.addWidget(self.export_btn)
+        
+        self.cancel_export_btn = QPushButton('⏹ إيقاف')
+        self.cancel_export_btn.setMinimumHeight(40)
+        self.cancel_export_btn.setEnabled(False)
+        export_layout.addWidget(self.cancel_export_btn)
+        
+        self.export_progress = QProgressBar()
+        export_layout.addWidget(self.export_progress, 1)
+        layout.addLayout(export_layout)
+        
+        self.exporter = ExportTask(self)
+        self.exporter.progress.connect(self.show_export_progress)
+        self.exporter.finished.connect(self.export_finished)
+        self.exporter.failed.connect(self.export_failed)
+        self.cancel_export_btn.clicked.connect(self.exporter.cancel)
+        
         self.setLayout(layout)
         self.load_report()
 
+    def apply_changes(self, changes):
+        import parallel_reports
+        # The parallel reports read every loan; they are only rerun on request.
+        if (changes.keys() & {'loans', 'books'}
+                and REPORT_VIEWS[self.report_combo.currentText()] not in parallel_reports.REPORTS):
+            self.load_report()
+
+    def update_export_filters(self):
+        loans = self.export_table.currentData() == 'loans'
+        self.export_status.setEnabled(loans)
+        self.export_history.setEnabled(loans)
+
+    def start_export(self):
+        """Export the chosen table on a worker thread; the tab stays usable meanwhile."""
+        table = self.export_table.currentData()
+        path, chosen = QFileDialog.getSaveFileName(self, 'تصدير', f'{table}.csv',
+                                                   ';;'.join(EXPORT_FILTERS))
+        if not path:
+            return
+        fmt, compress = EXPORT_FILTERS.get(chosen, (None, None))
+        options = {'table': table, 'path': path, 'fmt': fmt, 'compress': compress}
+        if table == 'loans':
+            options['status'] = self.export_status.currentData()
+            options['history'] = self.export_history.isChecked()
+        if self.export_range.isChecked():
+            options['since'] = self.export_since.date().toString(Qt.ISODate)
+            options['until'] = self.export_until.date().toString(Qt.ISODate)
+        if self.exporter.start(**options):
+            self.export_progress.setValue(0)
+            self.export_btn.setEnabled(False)
+            self.cancel_export_btn.setEnabled(True)
+
+    def show_export_progress(self, written, total):
+        self.export_progress.setMaximum(max(total, 1))
+        self.export_progress.setValue(written)
+        self.export_progress.setFormat(f'{written:,} / {total:,}')
+
+    def export_finished(self, stats):
+        self.export_btn.setEnabled(True)
+        self.cancel_export_btn.setEnabled(False)
+        if stats['cancelled']:
+            self.export_progress.reset()
+            return
+        QMessageBox.information(self, 'Success',
+                                f"{stats['rows']:,} rows exported in {stats['seconds']:.1f}s")
+
+    def export_failed(self, message):
+        self.export_btn.setEnabled(True)
+        self.cancel_export_btn.setEnabled(False)
+        self.export_progress.reset()
+        QMessageBox.warning(self, 'Error', f'Export failed: {message}')
+
     def load_report(self):
-        books = LoanModel.get_most_borrowed_books()
-        self.table.setRowCount(len(books))
-        for row, book in enumerate(books):
-            self.table.setItem(row, 0, QTableWidgetItem(str(book['id'])))
-            self.table.setItem(row, 1, QTableWidgetItem(book['title']))
-            self.table.setItem(row, 2, QTableWidgetItem(book['author']))
-            self.table.setItem(row, 3, QTableWidgetItem(str(book['borrow_count'])))
+        """Show the chosen report; the rollup-backed ones over the chosen dates."""
+        import parallel_reports
+        import reports
+        text = self.report_combo.currentText()
+        self.title_label.setText(f'📊 التقرير: {text}')
+        name = REPORT_VIEWS[text]
+        self.report_period.setEnabled(name in parallel_reports.REPORTS or
+                                      name in reports.REPORTS and reports.REPORTS[name][2] is not None)
+        self.report_since.setEnabled(name is not None)
+        self.report_until.setEnabled(name is not None)
+        self.report_summary.clear()
+        if name in parallel_reports.REPORTS:
+            self.start_parallel_report()
+            return
+        self.report_task.cancel()
+        if name is None:
+            columns, rows = MOST_BORROWED_COLUMNS, LoanModel.get_most_borrowed_books()
+        else:
+            columns = reports.REPORTS[name][1]
+            rows = reports.run_report(name, self.report_since.date().toString(Qt.ISODate),
+                                      self.report_until.date().toString(Qt.ISODate),
+                                      self.report_period.currentData())
+        self.show_rows(columns, rows)
 
+    def show_rows(self, columns, rows):
+        self.table.setColumnCount(len(columns))
+        self.table.setHorizontalHeaderLabels([REPORT_HEADERS[column] for column in columns])
+        self.table.setRowCount(len(rows))
+        for row, record in enumerate(rows):
+            for column, value in enumerate(record):
+                self.table.setItem(row, column, QTableWidgetItem('' if value is None else str(value)))
+
+    def parallel_report_request(self):
+        """The ``parallel_reports`` name and options the controls ask for."""
+        name = REPORT_VIEWS[self.report_combo.currentText()]
+        period = self.report_period.currentData()
+        if name == DEMAND_REPORT and period not in ('week', 'month'):
+            period = 'month'
+        return name, {'since': self.report_since.date().toPyDate(),
+                      'until': self.report_until.date().toPyDate(), 'period': period}
+
+    def start_parallel_report(self):
+        """Run the chosen ``parallel_reports`` report in worker processes,
+        replacing the one still running."""
+        import parallel_reports
+        name, options = self.parallel_report_request()
+        self.report_task.start(name, **options)
+        self.show_rows(parallel_reports.REPORTS[name].columns, [])
+        self.report_summary.setText('⏳ جارٍ التحليل...')
+        self.cancel_report_btn.setEnabled(True)
+
+    def show_report_progress(self, done, total):
+        self.report_summary.setText(f'⏳ جارٍ التحليل... {done} / {total}')
+
+    def show_parallel_report(self, name, options, result):
+        import parallel_reports
+        self.cancel_report_btn.setEnabled(False)
+        if (name, options) != self.parallel_report_request():
+            return  # computed for controls that have changed since
+        if result is None:
+            self.report_summary.setText('تم إيقاف التقرير')
+            return
+        if name != DEMAND_REPORT:
+            self.report_summary.clear()
+            self.show_rows(parallel_reports.REPORTS[name].columns, result)
+            return
+        self.show_rows(parallel_reports.REPORTS[name].columns, result['titles'])
+        duration, lateness = result['duration'], result['lateness']
+        late_share = lateness['late_share']
+        self.report_summary.setText(
+            f"{result['loans']:,} إعارة في {result['seconds']:.1f} ث — "
+            f"مدة الإعارة: المتوسط {duration['mean']} يوم، "
+            f"الوسيط {duration['percentiles'][50]}، p90 {duration['percentiles'][90]} — "
+            f"أعيدت متأخرة: {late_share or 0:.1%}، "
+            f"التأخير p90 {lateness['percentiles'][90]} يوم، p99 {lateness['percentiles'][99]} يوم")
+
+    def report_failed(self, message):
+        self.cancel_report_btn.setEnabled(False)
+        self.report_summary.clear()
+        QMessageBox.warning(self, 'Error', f'Report failed: {message}')
+
+
+class DiagnosticsDialog(QDialog):
+    """Query and model-method timings collected by ``database.instrumentation``."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.init_ui()
+
+    def init_ui(self):
+        self.setWindowTitle('🩺 التشخيص')
+        self.setGeometry(150, 150, 900, 600)
+        layout = QVBoxLayout()
+
+        self.report = QTextEdit()
+        self.report.setReadOnly(True)
+        self.report.setFont(QFont('Courier New', 9))
+        layout.addWidget(self.report)
+
+        controls = QHBoxLayout()
+        controls.addWidget(QLabel('حد الاستعلام البطيء (ms):'))
+        self.threshold = QSpinBox()
+        self.threshold.setRange(1, 60000)
+        self.threshold.setValue(int(instrumentation.slow_query_ms))
+        controls.addWidget(self.threshold)
+
+        self.toggle_btn = QPushButton()
+        self.toggle_btn.clicked.connect(self.toggle)
+        controls.addWidget(self.toggle_btn)
+
+        for text, slot in (('🔄 تحديث', self.refresh), ('🧹 تصفير', self.reset),
+                           ('💾 تصدير JSON', self.export)):
+            btn = QPushButton(text)
+            btn.clicked.connect(slot)
+            controls.addWidget(btn)
+        controls.addStretch()
+        layout.addLayout(controls)
+
+        self.setLayout(layout)
+        self.refresh()
+
+    def toggle(self):
+        if instrumentation.enabled:
+            instrumentation.disable()
+        else:
+            instrumentation.enable(self.threshold.value())
+        self.refresh()
+
+    def reset(self):
+        instrumentation.reset()
+        self.refresh()
+
+    def export(self):
+        path, _ = QFileDialog.getSaveFileName(self, 'تصدير', 'diagnostics.json', 'JSON (*.json)')
+        if path:
+            instrumentation.export_json(path)
+
+    def refresh(self):
+        self.toggle_btn.setText('⏸ إيقاف القياس' if instrumentation.enabled else '▶ تشغيل القياس')
+        stats = instrumentation.snapshot()
+        lines = ['== Model methods ==']
+        for name, h in sorted(stats['methods'].items(), key=lambda item: -item[1]['total_ms']):
+            lines.append(f"{h['count']:>7} calls  {h['mean_ms']:>9.3f} ms avg  "
+                         f"{h['max_ms']:>9.3f} ms max  {h['rows']:>9} rows  {name}")
+        lines.append('')
+        lines.append('== Statements (by total time) ==')
+        for sql, h in list(stats['statements'].items())[:50]:
+            lines.append(f"{h['count']:>7} x  {h['total_ms']:>10.3f} ms  "
+                         f"{h['max_ms']:>9.3f} ms max  {sql}")
+        lines.append('')
+        lines.append(f"== Slow queries (>= {stats['slow_query_ms']} ms) ==")
+        for entry in reversed(stats['slow_queries']):
+            lines.append(f"{entry['ms']:.3f} ms  {' '.join(entry['sql'].split())}")
+            lines.extend(f'    {step}' for step in entry['plan'] or ())
+        self.report.setPlainText('\n'.join(lines))
+
+
+# Tabs are built on first activation.  Widgets can only be built on the GUI
+# thread, so what is prefetched while idle is the modules each tab imports.
+TABS = (
+    (BooksTab, '📖 الكتب', ('search', 'workers')),
+    (UsersTab, '👥 المستخدمون', ('search', 'workers')),
+    (LoansTab, '📚 الإعارات', ('workers',)),
+    (ReportsTab, '📊 التقارير', ('workers', 'reports', 'parallel_reports')),
+)
+
+
+def import_modules(names):
+    """Import ``names`` so that later imports of them are a dict lookup."""
+    for name in names:
+        importlib.import_module(name)
+
+
+class StartupTiming:
+    """Milliseconds from process start to each startup milestone."""
 
-class LibraryApp(QMainWindow):
     def __init__(self):
+        self.marks = {}
+
+    def mark(self, name):
+        self.marks.setdefault(name, round((time.perf_counter() - PROCESS_START) * 1000, 2))
+
+    def report(self):
+        return dict(self.marks)
+
+
+class LibraryApp(QMainWindow):
+    interactive = pyqtSignal()
+
+    def __init__(self, timing=None):
         super().__init__()
-        init_database()
+        self.timing = timing or StartupTiming()
+        self.shown = False
+        self.ready = False
         self.init_ui()
+        self.timing.mark('window_created')
 
     def init_ui(self):
         self.setWindowTitle('📚 نظام إدارة المكتبة الحديث')
         self.setGeometry(100, 100, 1200, 700)
         self.setMinimumSize(1000, 600)
         
-        tabs = QTabWidget()
-        tabs.addTab(BooksTab(), '📖 الكتب')
-        tabs.addTab(UsersTab(), '👥 المستخدمون')
-        tabs.addTab(LoansTab(), '📚 الإعارات')
-        tabs.addTab(ReportsTab(), '📊 التقارير')
+        self.tabs = QTabWidget()
+        for _, title, _ in TABS:
+            self.tabs.addTab(QWidget(), title)
+        self.built = [None] * len(TABS)
+        self.tabs.currentChanged.connect(self.activate_tab)
         
-        self.setCentralWidget(tabs)
+        self.setCentralWidget(self.tabs)
+
+        tools_menu = self.menuBar().addMenu('🛠 أدوات')
+        tools_menu.addAction('🩺 التشخيص', self.show_diagnostics)
 
+    def showEvent(self, event):
+        super().showEvent(event)
+        if not self.shown:
+            self.shown = True
+            QTimer.singleShot(0, self.start)
 
-def main():
-    app = QApplication(sys.argv)
+    def start(self):
+        """Open the database and load the first tab once the window is on screen."""
+        self.repaint()
+        self.timing.mark('first_paint')
+
+        from archive import ARCHIVE_INTERVAL_SECONDS, run_archive_jobs
+        from changefeed import POLL_INTERVAL_MS, ChangeFeed
+        from overdue import SCAN_INTERVAL_SECONDS, run_overdue_jobs
+        from workers import BackgroundTask
+        database.init_database()
+        # Follow the change log from before the first load so nothing is missed.
+        self.feed = ChangeFeed()
+        self.feed.start()
+        self.ready = True
+        self.activate_tab(self.tabs.currentIndex())
+        self.timing.mark('first_tab_loaded')
+        QTimer.singleShot(0, self.became_interactive)
+
+        # The scan writes to every overdue loan; keep it off the GUI thread.
+        self.overdue_task = BackgroundTask(run_overdue_jobs, self)
+        self.overdue_task.failed.connect(self.overdue_jobs_failed)
+        self.overdue_task.start()
+        self.overdue_timer = QTimer(self)
+        self.overdue_timer.timeout.connect(self.overdue_task.start)
+        self.overdue_timer.start(SCAN_INTERVAL_SECONDS * 1000)
+
+        # Archiving moves old loans in short batches, also off the GUI thread.
+        self.archive_task = BackgroundTask(run_archive_jobs, self)
+        self.archive_task.failed.connect(self.archive_jobs_failed)
+        self.archive_task.start()
+        self.archive_timer = QTimer(self)
+        self.archive_timer.timeout.connect(self.archive_task.start)
+        self.archive_timer.start(ARCHIVE_INTERVAL_SECONDS * 1000)
+
+        self.feed_timer = QTimer(self)
+        self.feed_timer.timeout.connect(self.apply_changes)
+        self.feed_timer.start(POLL_INTERVAL_MS)
+
+    def overdue_jobs_failed(self, message):
+        self.statusBar().showMessage(f'Overdue scan failed: {message}', 10000)
+
+    def archive_jobs_failed(self, message):
+        self.statusBar().showMessage(f'Archiving failed: {message}', 10000)
+
+    def apply_changes(self):
+        """Show what other app instances (and background jobs) wrote since the last poll."""
+        changes = self.feed.poll()
+        if changes:
+            for widget in self.built:
+                if widget is not None:
+                    widget.apply_changes(changes)
+
+    def became_interactive(self):
+        self.timing.mark('interactive')
+        self.interactive.emit()
+        self.prefetch_tabs()
+
+    def prefetch_tabs(self):
+        """Import the modules of the tabs not built yet on a worker thread."""
+        from workers import BackgroundTask
+        names = sorted({name for (_, _, modules), widget in zip(TABS, self.built)
+                        if widget is None for name in modules})
+        self.prefetch_task = BackgroundTask(functools.partial(import_modules, names), self)
+        self.prefetch_task.start()
+
+    def activate_tab(self, index):
+        """Build tab ``index`` if it has not been built yet."""
+        if not self.ready or index < 0:
+            return
+        self.build_tab(index)
+
+    def build_tab(self, index):
+        if self.built[index] is not None:
+            return self.built[index]
+        factory, title, _ = TABS[index]
+        widget = factory()
+        self.built[index] = widget
+
+        current = self.tabs.currentIndex()
+        placeholder = self.tabs.widget(index)
+        self.tabs.blockSignals(True)
+        self.tabs.removeTab(index)
+        self.tabs.insertTab(index, widget, title)
+        self.tabs.setCurrentIndex(current)
+        self.tabs.blockSignals(False)
+        placeholder.deleteLater()
+        return widget
+
+    def show_diagnostics(self):
+        DiagnosticsDialog(self).exec_()
+
+    def closeEvent(self, event):
+        # Stop a running parallel report rather than wait for its workers on exit.
+        for widget in self.built:
+            if isinstance(widget, ReportsTab):
+                widget.report_task.cancel()
+        super().closeEvent(event)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Library management system.')
+    parser.add_argument('--db', help='database file (default: library.db)')
+    parser.add_argument('--startup-timing', nargs='?', const='-', metavar='FILE',
+                        help='measure startup, write the timings as JSON (to FILE or '
+                             'stdout) and exit once the window is interactive')
+    args, qt_args = parser.parse_known_args(argv)
+    if args.db:
+        database.DB_PATH = Path(args.db)
+
+    timing = StartupTiming()
+    timing.mark('imports')
+    app = QApplication(sys.argv[:1] + qt_args)
     app.setStyle('Fusion')
     
     app.setStyleSheet(STYLESHEET)
     
-    window = LibraryApp()
+    window = LibraryApp(timing)
+    if args.startup_timing:
+        def report():
+            text = json.dumps(timing.report(), indent=2)
+            if args.startup_timing == '-':
+                print(text)
+            else:
+                with open(args.startup_timing, 'w') as fh:
+                    fh.write(text)
+            app.quit()
+        window.interactive.connect(report)
     window.show()
     sys.exit(app.exec_())
 
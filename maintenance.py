@@ -0,0 +1,122 @@
+"""Database maintenance tasks.
+
+Usage::
+
+    python maintenance.py rebuild-stats
+    python maintenance.py rebuild-rollups
+    python maintenance.py scan-overdue
+    python maintenance.py send-notices
+    python maintenance.py archive-loans [--days 365]
+    python maintenance.py vacuum [--full]
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+import database
+from archive import (ARCHIVE_AFTER_DAYS, AUTO_VACUUM_INCREMENTAL, archive_returned_loans,
+                     full_vacuum, reclaim_space)
+from cache import invalidates
+from database import connection, transaction
+from migrations import BOOK_STATS_REBUILD_WITH_ARCHIVE, ROLLUP_REBUILD
+from overdue import run_overdue_jobs, send_overdue_notices
+
+
+@invalidates('loans')
+def rebuild_book_stats():
+    """Recompute ``book_stats`` from the raw loans table and the archive."""
+    with transaction() as conn:
+        for statement in BOOK_STATS_REBUILD_WITH_ARCHIVE:
+            conn.execute(statement)
+
+
+def rebuild_stats_command(args):
+    rebuild_book_stats()
+
+
+@invalidates('loans')
+def rebuild_rollups(args=None):
+    """Recompute the daily circulation rollups from the live and archived loans."""
+    with transaction() as conn:
+        for statement in ROLLUP_REBUILD:
+            conn.execute(statement)
+
+
+def scan_overdue_loans(args):
+    """Flip newly overdue loans and queue their notices."""
+    flipped, queued = run_overdue_jobs()
+    print(f'{flipped} loans overdue, {queued} notices queued')
+
+
+def print_notices(notices):
+    for notice in notices:
+        print(json.dumps(notice, ensure_ascii=False))
+
+
+def send_notices(args):
+    """Write pending overdue notices to stdout as JSON lines and mark them sent."""
+    sent = send_overdue_notices(print_notices)
+    sys.stderr.write(f'{sent} notices sent\n')
+
+
+def print_archived(moved):
+    sys.stderr.write(f'\r{moved:,} loans archived')
+    sys.stderr.flush()
+
+
+def archive_loans(args):
+    """Move returned loans due more than ``--days`` ago to ``loans_archive``."""
+    moved = archive_returned_loans(args.days, progress=print_archived)
+    if moved:
+        sys.stderr.write('\n')
+    released = reclaim_space()
+    print(f'{moved} loans archived, {released} pages released')
+
+
+def vacuum(args):
+    """Release free pages; ``--full`` rebuilds the file (and enables incremental vacuum)."""
+    if args.full:
+        full_vacuum()
+        print('database rebuilt')
+        return
+    with connection() as conn:
+        mode = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+    if mode != AUTO_VACUUM_INCREMENTAL:
+        print('incremental vacuum is off for this database; run "vacuum --full" once')
+        return
+    print(f'{reclaim_space()} pages released')
+
+
+COMMANDS = {
+    'rebuild-stats': rebuild_stats_command,
+    'rebuild-rollups': rebuild_rollups,
+    'scan-overdue': scan_overdue_loans,
+    'send-notices': send_notices,
+    'archive-loans': archive_loans,
+    'vacuum': vacuum,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Library database maintenance.')
+    parser.add_argument('command', choices=sorted(COMMANDS))
+    parser.add_argument('--db', help='database file (default: library.db)')
+    parser.add_argument('--days', type=int, default=ARCHIVE_AFTER_DAYS,
+                        help='archive-loans: age in days of the due date (default: %(default)s)')
+    parser.add_argument('--full', action='store_true',
+                        help='vacuum: rebuild the whole file')
+    args = parser.parse_args(argv)
+
+    if args.db:
+        database.DB_PATH = Path(args.db)
+    database.init_database()
+    database.configure_pool(database.DB_PATH)
+    try:
+        COMMANDS[args.command](args)
+    finally:
+        database.close_pool()
+
+
+if __name__ == '__main__':
+    main()
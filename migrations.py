@@ -0,0 +1,593 @@
+"""Versioned schema migrations keyed on ``PRAGMA user_version``.
+
+Each step brings the schema from version ``n - 1`` to ``n`` and is written
+to be idempotent, so a database created before versioning existed (version
+0 with the tables already present) upgrades cleanly.  Append new steps to
+``MIGRATIONS``; never reorder or edit a step that has shipped.
+"""
+
+
+def create_base_tables(conn):
+    """Version 1: books, users and loans."""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS books (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            title TEXT NOT NULL,
+            author TEXT NOT NULL,
+            isbn TEXT UNIQUE,
+            category TEXT,
+            total_copies INTEGER DEFAULT 1,
+            available_copies INTEGER DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            email TEXT UNIQUE,
+            phone TEXT,
+            address TEXT,
+            membership_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS loans (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            book_id INTEGER NOT NULL,
+            loan_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            due_date TIMESTAMP,
+            return_date TIMESTAMP,
+            status TEXT DEFAULT 'active',
+            FOREIGN KEY (user_id) REFERENCES users(id),
+            FOREIGN KEY (book_id) REFERENCES books(id)
+        )
+    ''')
+
+
+# Current secondary indexes on books, by name.  Kept together so that bulk
+# loads can drop them and rebuild them once at the end (see bulk_import.py).
+BOOK_INDEXES = {
+    # get_all_books: ORDER BY title
+    'idx_books_title': 'CREATE INDEX IF NOT EXISTS idx_books_title ON books (title)',
+    # Checkout picker: type-ahead over books that can be lent out.
+    'idx_books_available_title_nocase': '''
+        CREATE INDEX IF NOT EXISTS idx_books_available_title_nocase
+        ON books (title COLLATE NOCASE) WHERE available_copies > 0
+    ''',
+}
+
+
+def create_hot_path_indexes(conn):
+    """Version 2: indexes behind the listing, loan and report queries."""
+    # get_active_loans: WHERE status = 'active' ORDER BY due_date
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_loans_status_due ON loans (status, due_date)')
+    # get_all_loans: ORDER BY loan_date DESC
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_loans_loan_date ON loans (loan_date)')
+    # get_most_borrowed_books join, per-book and per-user loan lookups
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_loans_book ON loans (book_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_loans_user ON loans (user_id)')
+    # get_all_books / get_all_users: ORDER BY title / name
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_books_title ON books (title)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_users_name ON users (name)')
+    # Checkout pickers only ever list books that can be lent out.
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_books_available_title
+        ON books (title) WHERE available_copies > 0
+    ''')
+
+
+def fts5_available(conn):
+    """Return True if this SQLite build supports FTS5."""
+    try:
+        conn.execute('CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)')
+    except Exception:
+        return False
+    conn.execute('DROP TABLE temp.fts5_probe')
+    return True
+
+
+def fts_statements(table, columns):
+    """DDL for an external-content FTS5 index over ``table`` kept in sync by triggers."""
+    fts = f'{table}_fts'
+    cols = ', '.join(columns)
+    new = ', '.join(f'new.{c}' for c in columns)
+    old = ', '.join(f'old.{c}' for c in columns)
+    return (
+        f'''
+        CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+            {cols}, content='{table}', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN
+            INSERT INTO {fts} (rowid, {cols}) VALUES (new.id, {new});
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN
+            INSERT INTO {fts} ({fts}, rowid, {cols}) VALUES ('delete', old.id, {old});
+        END
+        ''',
+        f'''
+        CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN
+            INSERT INTO {fts} ({fts}, rowid, {cols}) VALUES ('delete', old.id, {old});
+            INSERT INTO {fts} (rowid, {cols}) VALUES (new.id, {new});
+        END
+        ''',
+        f"INSERT INTO {fts} ({fts}) VALUES ('rebuild')",
+    )
+
+
+BOOK_FTS_COLUMNS = ('title', 'author', 'isbn')
+USER_FTS_COLUMNS = ('name', 'email')
+
+
+def create_search_index(conn):
+    """Version 3: FTS5 search index over books and users.
+
+    Skipped on SQLite builds without FTS5; searches then fall back to LIKE.
+    """
+    if not fts5_available(conn):
+        return
+    for statement in fts_statements('books', BOOK_FTS_COLUMNS):
+        conn.execute(statement)
+    for statement in fts_statements('users', USER_FTS_COLUMNS):
+        conn.execute(statement)
+
+
+# Rebuilds book_stats from the raw loans; shared with maintenance.py.
+BOOK_STATS_REBUILD = (
+    'DELETE FROM book_stats',
+    '''
+    INSERT INTO book_stats (book_id, borrow_count, last_borrowed, active_count)
+    SELECT b.id, COUNT(l.id), MAX(l.loan_date),
+           COALESCE(SUM(l.status <> 'returned'), 0)
+    FROM books b
+    LEFT JOIN loans l ON l.book_id = b.id
+    GROUP BY b.id
+    ''',
+)
+
+
+def create_book_stats(conn):
+    """Version 4: per-book borrow statistics maintained by triggers.
+
+    ``borrow_count`` counts every loan ever recorded for the book and
+    ``active_count`` the ones not yet returned, so the most-borrowed report
+    is a range read of ``idx_book_stats_borrow`` instead of a join over the
+    whole loan history.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS book_stats (
+            book_id INTEGER PRIMARY KEY REFERENCES books(id),
+            borrow_count INTEGER NOT NULL DEFAULT 0,
+            last_borrowed TIMESTAMP,
+            active_count INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_book_stats_borrow
+        ON book_stats (borrow_count DESC)
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS book_stats_book_ai AFTER INSERT ON books BEGIN
+            INSERT OR IGNORE INTO book_stats (book_id) VALUES (new.id);
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS book_stats_book_ad AFTER DELETE ON books BEGIN
+            DELETE FROM book_stats WHERE book_id = old.id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS book_stats_loan_ai AFTER INSERT ON loans BEGIN
+            INSERT INTO book_stats (book_id, borrow_count, last_borrowed, active_count)
+            VALUES (new.book_id, 1, new.loan_date, new.status <> 'returned')
+            ON CONFLICT (book_id) DO UPDATE SET
+                borrow_count = borrow_count + 1,
+                last_borrowed = MAX(COALESCE(last_borrowed, ''), excluded.last_borrowed),
+                active_count = active_count + excluded.active_count;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS book_stats_loan_au AFTER UPDATE OF status ON loans
+        WHEN (old.status <> 'returned') IS NOT (new.status <> 'returned') BEGIN
+            UPDATE book_stats
+            SET active_count = active_count + (new.status <> 'returned') - (old.status <> 'returned')
+            WHERE book_id = new.book_id;
+        END
+    ''')
+    for statement in BOOK_STATS_REBUILD:
+        conn.execute(statement)
+
+
+def create_prefix_indexes(conn):
+    """Version 5: case-insensitive indexes for the checkout type-ahead pickers."""
+    conn.execute('DROP INDEX IF EXISTS idx_books_available_title')
+    conn.execute(BOOK_INDEXES['idx_books_available_title_nocase'])
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_users_name_nocase
+        ON users (name COLLATE NOCASE)
+    ''')
+
+
+def create_overdue_tracking(conn):
+    """Version 6: scan watermarks and the overdue-notice queue.
+
+    Overdue scans only look at loans whose ``due_date`` lies between the
+    previous scan's watermark and now, through ``idx_loans_status_due``.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS scan_watermarks (
+            job TEXT PRIMARY KEY,
+            watermark TEXT NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS overdue_notices (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            loan_id INTEGER NOT NULL UNIQUE,
+            user_id INTEGER NOT NULL,
+            book_id INTEGER NOT NULL,
+            due_date TIMESTAMP NOT NULL,
+            queued_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_overdue_notices_pending
+        ON overdue_notices (id) WHERE sent_at IS NULL
+    ''')
+
+
+# Tables whose row changes are logged to ``changes`` for other app instances.
+CHANGE_LOG_TABLES = ('books', 'users', 'loans')
+# Rows the change log keeps; every CHANGE_LOG_COMPACT_EVERY-th change trims
+# the older ones and records the highest discarded seq in change_log_state.
+CHANGE_LOG_KEEP = 10000
+CHANGE_LOG_COMPACT_EVERY = 1000
+
+
+def change_log_statements(table):
+    """Triggers that log every insert, update and delete on ``table`` to ``changes``."""
+    return tuple(
+        f'''
+        CREATE TRIGGER IF NOT EXISTS changes_{table}_{suffix} AFTER {event} ON {table} BEGIN
+            INSERT INTO changes (table_name, row_id, op) VALUES ('{table}', {row}.id, '{op}');
+        END
+        '''
+        for suffix, event, row, op in (('ai', 'INSERT', 'new', 'insert'),
+                                       ('au', 'UPDATE', 'new', 'update'),
+                                       ('ad', 'DELETE', 'old', 'delete'))
+    )
+
+
+def create_change_log(conn):
+    """Version 7: trigger-maintained log of row changes, compacted as it grows.
+
+    Other connections (e.g. a second desk running the app) read the rows
+    after the last ``seq`` they have seen to refresh only what changed.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS changes (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            row_id INTEGER,
+            op TEXT NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS change_log_state (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            compacted_through INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('INSERT OR IGNORE INTO change_log_state (id) VALUES (1)')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS changes_compact AFTER INSERT ON changes
+        WHEN new.seq % {CHANGE_LOG_COMPACT_EVERY} = 0 BEGIN
+            DELETE FROM changes WHERE seq <= new.seq - {CHANGE_LOG_KEEP};
+            UPDATE change_log_state
+            SET compacted_through = MAX(compacted_through, new.seq - {CHANGE_LOG_KEEP});
+        END
+    ''')
+    for table in CHANGE_LOG_TABLES:
+        for statement in change_log_statements(table):
+            conn.execute(statement)
+
+
+def create_loan_archive(conn):
+    """Version 8: ``loans_archive`` for old returned loans (see archive.py).
+
+    Archived rows keep their loan ids.  Moving a loan into the archive is
+    not logged as a delete in ``changes``; the archiver logs one reload per
+    batch instead.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS loans_archive (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            book_id INTEGER NOT NULL,
+            loan_date TIMESTAMP,
+            due_date TIMESTAMP,
+            return_date TIMESTAMP,
+            status TEXT,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id),
+            FOREIGN KEY (book_id) REFERENCES books(id)
+        )
+    ''')
+    # get_all_loans(history=True): ORDER BY loan_date DESC, merged with the live index
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_loans_archive_loan_date
+        ON loans_archive (loan_date)
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_loans_archive_book ON loans_archive (book_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_loans_archive_user ON loans_archive (user_id)')
+    conn.execute('DROP TRIGGER IF EXISTS changes_loans_ad')
+    conn.execute('''
+        CREATE TRIGGER changes_loans_ad AFTER DELETE ON loans
+        WHEN NOT EXISTS (SELECT 1 FROM loans_archive WHERE id = old.id) BEGIN
+            INSERT INTO changes (table_name, row_id, op) VALUES ('loans', old.id, 'delete');
+        END
+    ''')
+
+
+# Rebuilds book_stats from the live and the archived loans; used by
+# maintenance.py from version 8 on (BOOK_STATS_REBUILD predates the archive).
+BOOK_STATS_REBUILD_WITH_ARCHIVE = (
+    'DELETE FROM book_stats',
+    '''
+    INSERT INTO book_stats (book_id, borrow_count, last_borrowed, active_count)
+    SELECT b.id, COALESCE(SUM(h.loans), 0), MAX(h.last_borrowed), COALESCE(SUM(h.active), 0)
+    FROM books b
+    LEFT JOIN (
+        SELECT book_id, COUNT(*) AS loans, MAX(loan_date) AS last_borrowed,
+               SUM(status <> 'returned') AS active
+        FROM loans GROUP BY book_id
+        UNION ALL
+        SELECT book_id, COUNT(*), MAX(loan_date), 0
+        FROM loans_archive GROUP BY book_id
+    ) h ON h.book_id = b.id
+    GROUP BY b.id
+    ''',
+)
+
+
+# A loan counts as late once it is overdue or was returned after its due date.
+LATE_LOAN = ("COALESCE({row}.status = 'overdue' OR "
+             "({row}.status = 'returned' AND {row}.return_date > {row}.due_date), 0)")
+ROLLUP_COUNTS = ('checkouts', 'returns', 'loan_days', 'due', 'late')
+# The Monday starting the week of a date.
+WEEK_OF = "date({day}, 'weekday 0', '-6 days')"
+
+
+# Recomputes both rollup tables from the live and the archived loans.
+ROLLUP_REBUILD = (
+    'DELETE FROM daily_circulation',
+    f'''
+    WITH history AS (
+        SELECT h.user_id, h.loan_date, h.due_date, h.return_date, h.status,
+               COALESCE(b.category, '') AS category
+        FROM (SELECT user_id, book_id, loan_date, due_date, return_date, status FROM loans
+              UNION ALL
+              SELECT user_id, book_id, loan_date, due_date, return_date, status
+              FROM loans_archive) h
+        LEFT JOIN books b ON b.id = h.book_id
+    )
+    INSERT INTO daily_circulation (day, category, {', '.join(ROLLUP_COUNTS)})
+    SELECT day, category, SUM(checkouts), SUM(returns), SUM(loan_days), SUM(due), SUM(late)
+    FROM (
+        SELECT date(loan_date) AS day, category, 1 AS checkouts, 0 AS returns,
+               0.0 AS loan_days, 0 AS due, 0 AS late
+        FROM history
+        UNION ALL
+        SELECT date(return_date), category, 0, 1,
+               COALESCE(julianday(return_date) - julianday(loan_date), 0), 0, 0
+        FROM history WHERE status = 'returned' AND return_date IS NOT NULL
+        UNION ALL
+        SELECT date(due_date), category, 0, 0, 0.0, 1, {LATE_LOAN.format(row='history')}
+        FROM history
+    )
+    WHERE day IS NOT NULL
+    GROUP BY day, category
+    ''',
+    'DELETE FROM weekly_active_users',
+    f'''
+    INSERT OR IGNORE INTO weekly_active_users (week, user_id)
+    SELECT {WEEK_OF.format(day='day')}, user_id FROM (
+        SELECT date(loan_date) AS day, user_id FROM loans
+        UNION ALL
+        SELECT date(return_date), user_id FROM loans WHERE status = 'returned'
+        UNION ALL
+        SELECT date(loan_date), user_id FROM loans_archive
+        UNION ALL
+        SELECT date(return_date), user_id FROM loans_archive WHERE status = 'returned'
+    )
+    WHERE day IS NOT NULL
+    ''',
+)
+
+
+def rollup_statement(day, counts, when):
+    """Add ``counts`` (column -> expression) to the ``daily_circulation`` row
+    for the date of ``new.<day>`` and the category of the loan's book."""
+    columns = ', '.join(counts)
+    values = ', '.join(counts.values())
+    updates = ', '.join(f'{column} = {column} + excluded.{column}' for column in counts)
+    return f'''
+            INSERT INTO daily_circulation (day, category, {columns})
+            SELECT date(new.{day}),
+                   COALESCE((SELECT category FROM books WHERE id = new.book_id), ''), {values}
+            WHERE date(new.{day}) IS NOT NULL AND ({when})
+            ON CONFLICT (day, category) DO UPDATE SET {updates};'''
+
+
+def active_user_statement(day, when):
+    """Record ``new.user_id`` as active in the week of ``new.<day>``."""
+    return f'''
+            INSERT OR IGNORE INTO weekly_active_users (week, user_id)
+            SELECT {WEEK_OF.format(day=f'new.{day}')}, new.user_id
+            WHERE date(new.{day}) IS NOT NULL AND ({when});'''
+
+
+def create_circulation_rollups(conn):
+    """Version 9: daily circulation rollups maintained by triggers (see reports.py).
+
+    ``daily_circulation`` has one row per day and book category: loans
+    checked out and returned that day, the days those returned loans were
+    out, and the loans falling due that day with how many of them turned
+    late.  ``weekly_active_users`` lists the users who borrowed or returned
+    something each week (keyed on its Monday).  Reports over any date range sum these rows instead
+    of scanning the loans; archived loans stay counted, since moving a loan
+    to the archive is a delete and deletes are not rolled up.  A loan is
+    filed under its book's category at the time of each event.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS daily_circulation (
+            day TEXT NOT NULL,
+            category TEXT NOT NULL,
+            checkouts INTEGER NOT NULL DEFAULT 0,
+            returns INTEGER NOT NULL DEFAULT 0,
+            loan_days REAL NOT NULL DEFAULT 0,
+            due INTEGER NOT NULL DEFAULT 0,
+            late INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, category)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS weekly_active_users (
+            week TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            PRIMARY KEY (week, user_id)
+        ) WITHOUT ROWID
+    ''')
+    late_new, late_old = LATE_LOAN.format(row='new'), LATE_LOAN.format(row='old')
+    returned = "new.status = 'returned' AND new.return_date IS NOT NULL"
+    loan_days = 'COALESCE(julianday(new.return_date) - julianday(new.loan_date), 0)'
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS rollup_loan_ai AFTER INSERT ON loans BEGIN
+            {rollup_statement('loan_date', {'checkouts': '1'}, '1')}
+            {rollup_statement('due_date', {'due': '1', 'late': late_new}, '1')}
+            {rollup_statement('return_date', {'returns': '1', 'loan_days': loan_days}, returned)}
+            {active_user_statement('loan_date', '1')}
+            {active_user_statement('return_date', returned)}
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS rollup_loan_au AFTER UPDATE OF status ON loans
+        WHEN old.status IS NOT new.status BEGIN
+            {rollup_statement('due_date', {'late': '1'}, f'{late_new} AND NOT {late_old}')}
+            {rollup_statement('return_date', {'returns': '1', 'loan_days': loan_days},
+                              f"{returned} AND old.status <> 'returned'")}
+            {active_user_statement('return_date', f"{returned} AND old.status <> 'returned'")}
+        END
+    ''')
+    for statement in ROLLUP_REBUILD:
+        conn.execute(statement)
+
+
+MIGRATIONS = (
+    create_base_tables,
+    create_hot_path_indexes,
+    create_search_index,
+    create_book_stats,
+    create_prefix_indexes,
+    create_overdue_tracking,
+    create_change_log,
+    create_loan_archive,
+    create_circulation_rollups,
+)
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def get_version(conn):
+    """Return the schema version recorded in the database."""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn):
+    """Apply pending migrations and return the versions that were applied.
+
+    ``conn`` must be in autocommit mode (``isolation_level=None``).  Each step
+    runs in its own ``BEGIN IMMEDIATE`` transaction together with the version
+    bump, and the version is re-read under the write lock so that two
+    processes starting at once do not apply a step twice.
+    """
+    if get_version(conn) >= SCHEMA_VERSION:
+        return []
+    if get_version(conn) == 0:
+        # Only takes effect on a new, empty file (or at the next full VACUUM):
+        # lets archive.reclaim_space return freed pages a step at a time.
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+
+    applied = []
+    for version, step in enumerate(MIGRATIONS, start=1):
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if get_version(conn) < version:
+                step(conn)
+                conn.execute(f'PRAGMA user_version = {version}')
+                applied.append(version)
+        except BaseException:
+            conn.rollback()
+            raise
+        conn.commit()
+    return applied
+
+
+def book_load_statements(conn):
+    """DDL recreating what a bulk load drops (see bulk_import.py) in this schema."""
+    tables = {name for name, in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table'")}
+    statements = list(BOOK_INDEXES.values())
+    if 'books_fts' in tables:
+        statements.extend(fts_statements('books', BOOK_FTS_COLUMNS))
+    if 'changes' in tables:
+        statements.extend(change_log_statements('books'))
+    return statements
+
+
+def book_load_interrupted(conn):
+    """Return True if indexes or triggers dropped by a bulk load are missing."""
+    names = {name for name, in conn.execute('SELECT name FROM sqlite_master')}
+    expected = set(BOOK_INDEXES)
+    for suffix in ('ai', 'ad', 'au'):
+        if 'books_fts' in names:
+            expected.add(f'books_fts_{suffix}')
+        if 'changes' in names:
+            expected.add(f'changes_books_{suffix}')
+    return not expected <= names
+
+
+def repair_book_load(conn):
+    """Finish a bulk load that was killed before it rebuilt what it dropped.
+
+    ``conn`` must be in autocommit mode.  Returns True if anything was
+    restored; the search index is rebuilt and followers are told to reload
+    books, since the load bypassed the triggers.
+    """
+    if not book_load_interrupted(conn):
+        return False
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        repaired = book_load_interrupted(conn)
+        if repaired:
+            for statement in book_load_statements(conn):
+                conn.execute(statement)
+            has_change_log = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'changes'").fetchone()
+            if has_change_log:
+                # As changefeed.log_reload, which imports this module.
+                conn.execute("INSERT INTO changes (table_name, op) VALUES ('books', 'reload')")
+    except BaseException:
+        conn.rollback()
+        raise
+    conn.commit()
+    return repaired
@@ -1,294 +1,432 @@
+import functools
 import sqlite3
-from database import get_connection, dict_factory
+import search
+from cache import cached, invalidates
+from database import connection, transaction, encode_cursor, decode_cursor, instrument_model
+from records import Book, User, Loan, Record, row_factory
 from datetime import datetime, timedelta
 
+PAGE_SIZE = 100
+PICKER_LIMIT = 50
 
+LOAN_SELECT = '''
+    SELECT l.id, l.user_id, l.book_id, u.name, b.title,
+           l.loan_date, l.due_date, l.return_date, l.status
+    FROM loans l
+    JOIN users u ON l.user_id = u.id
+    JOIN books b ON l.book_id = b.id
+'''
+
+# Live and archived loans (see archive.py) under the same alias and columns.
+LOAN_HISTORY_SELECT = f'''
+    SELECT * FROM (
+        {LOAN_SELECT}
+        UNION ALL
+        SELECT a.id, a.user_id, a.book_id, u.name, b.title,
+               a.loan_date, a.due_date, a.return_date, a.status
+        FROM loans_archive a
+        JOIN users u ON a.user_id = u.id
+        JOIN books b ON a.book_id = b.id
+    ) l
+'''
+
+
+def _keyset_page(select, keys, after, limit, where=None, descending=False, record=Record):
+    """Fetch one page ordered by ``keys`` and starting after cursor ``after``.
+
+    ``keys`` are ``(column, field)`` pairs naming the sort columns in SQL and
+    in the returned records; the last one must be unique (the row id).
+    Returns ``(rows, next_cursor)`` where ``next_cursor`` is None on the
+    last page.
+    """
+    if limit <= 0:
+        return [], None
+    columns = ', '.join(column for column, _ in keys)
+    conditions = [where] if where else []
+    params = []
+    if after is not None:
+        conditions.append(f'({columns}) {"<" if descending else ">"} '
+                          f'({", ".join("?" * len(keys))})')
+        params.extend(decode_cursor(after))
+    direction = ' DESC' if descending else ''
+    order = ', '.join(column + direction for column, _ in keys)
+    where_sql = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = row_factory(record)
+        cursor.execute(f'{select} {where_sql} ORDER BY {order} LIMIT ?',
+                       (*params, limit))
+        rows = cursor.fetchall()
+    if len(rows) < limit:
+        return rows, None
+    last = rows[-1]
+    return rows, encode_cursor([last[field] for _, field in keys])
+
+
+def _fetch_record(conn, sql, params, record):
+    cursor = conn.cursor()
+    cursor.row_factory = row_factory(record)
+    cursor.execute(sql, params)
+    return cursor.fetchone()
+
+
+def _prefix_range(prefix):
+    """Bounds such that ``lower <= value < upper`` iff value starts with prefix."""
+    return prefix, prefix + '\U0010ffff'
+
+
+def _walk(fetch_page, page_size=1000):
+    """Yield every record from a keyset-paginated ``fetch_page``."""
+    after = None
+    while True:
+        rows, after = fetch_page(after, page_size)
+        yield from rows
+        if after is None:
+            return
+
+
+@instrument_model
 class BookModel:
     @staticmethod
+    @invalidates('books')
     def add_book(title, author, isbn, category, total_copies):
-        """Add a new book to database."""
-        conn = get_connection()
-        cursor = conn.cursor()
+        """Add a new book to database; returns the new Book or None."""
         try:
-            cursor.execute('''
-                INSERT INTO books (title, author, isbn, category, total_copies, available_copies)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (title, author, isbn, category, total_copies, total_copies))
-            conn.commit()
-            return cursor.lastrowid
+            with transaction() as conn:
+                cursor = conn.execute('''
+                    INSERT INTO books (title, author, isbn, category, total_copies, available_copies)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', (title, author, isbn, category, total_copies, total_copies))
+                return _fetch_record(conn, 'SELECT * FROM books WHERE id = ?',
+                                     (cursor.lastrowid,), Book)
         except sqlite3.IntegrityError:
             return None
-        finally:
-            conn.close()
 
     @staticmethod
+    @invalidates('books')
     def update_book(book_id, title, author, isbn, category, total_copies):
-        """Update book information."""
-        conn = get_connection()
-        cursor = conn.cursor()
+        """Update book information; returns the updated Book or None."""
         try:
-            cursor.execute('''
-                UPDATE books
-                SET title = ?, author = ?, isbn = ?, category = ?, total_copies = ?
-                WHERE id = ?
-            ''', (title, author, isbn, category, total_copies, book_id))
-            conn.commit()
-            return True
+            with transaction() as conn:
+                conn.execute('''
+                    UPDATE books
+                    SET title = ?, author = ?, isbn = ?, category = ?, total_copies = ?
+                    WHERE id = ?
+                ''', (title, author, isbn, category, total_copies, book_id))
+                return _fetch_record(conn, 'SELECT * FROM books WHERE id = ?', (book_id,), Book)
         except Exception:
-            return False
-        finally:
-            conn.close()
+            return None
 
     @staticmethod
+    @invalidates('books')
     def delete_book(book_id):
         """Delete a book."""
-        conn = get_connection()
-        cursor = conn.cursor()
         try:
-            cursor.execute('DELETE FROM books WHERE id = ?', (book_id,))
-            conn.commit()
+            with transaction() as conn:
+                conn.execute('DELETE FROM books WHERE id = ?', (book_id,))
             return True
         except Exception:
             return False
-        finally:
-            conn.close()
 
     @staticmethod
+    @cached('books')
     def get_all_books():
         """Get all books."""
-        conn = get_connection()
-        conn.row_factory = dict_factory
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM books ORDER BY title')
-        books = cursor.fetchall()
-        conn.close()
-        return books
+        return list(_walk(BookModel.get_books_page))
+
+    @staticmethod
+    def get_books_page(after=None, limit=PAGE_SIZE):
+        """Get one page of books in title order.
+
+        Returns ``(books, cursor)``; pass ``cursor`` back as ``after`` for the
+        next page.  ``cursor`` is None after the last page.
+        """
+        return _keyset_page('SELECT * FROM books', (('title', 'title'), ('id', 'id')),
+                            after, limit, record=Book)
+
+    @staticmethod
+    @cached('books')
+    def find_available_books(prefix, limit=PICKER_LIMIT):
+        """Get available books whose title or ISBN starts with ``prefix``."""
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = row_factory(Book)
+            cursor.execute('''
+                SELECT * FROM (
+                    SELECT * FROM books
+                    WHERE available_copies > 0
+                      AND title COLLATE NOCASE >= ? AND title COLLATE NOCASE < ?
+                    ORDER BY title COLLATE NOCASE
+                    LIMIT ?
+                )
+                UNION
+                SELECT * FROM (
+                    SELECT * FROM books
+                    WHERE isbn >= ? AND isbn < ? AND available_copies > 0
+                    LIMIT ?
+                )
+                ORDER BY title COLLATE NOCASE
+                LIMIT ?
+            ''', (*_prefix_range(prefix), limit, *_prefix_range(prefix), limit, limit))
+            return cursor.fetchall()
 
     @staticmethod
+    @cached('books')
     def get_book_by_id(book_id):
         """Get book by ID."""
-        conn = get_connection()
-        conn.row_factory = dict_factory
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM books WHERE id = ?', (book_id,))
-        book = cursor.fetchone()
-        conn.close()
-        return book
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = row_factory(Book)
+            cursor.execute('SELECT * FROM books WHERE id = ?', (book_id,))
+            return cursor.fetchone()
 
     @staticmethod
-    def search_books(keyword):
+    def search_books(keyword, limit=None):
         """Search books by title, author, or ISBN."""
-        conn = get_connection()
-        conn.row_factory = dict_factory
-        cursor = conn.cursor()
-        search_term = f'%{keyword}%'
-        cursor.execute('''
-            SELECT * FROM books
-            WHERE title LIKE ? OR author LIKE ? OR isbn LIKE ?
-            ORDER BY title
-        ''', (search_term, search_term, search_term))
-        books = cursor.fetchall()
-        conn.close()
-        return books
+        with connection() as conn:
+            return search.search_books(conn, keyword, limit)
 
 
+@instrument_model
 class UserModel:
     @staticmethod
+    @invalidates('users')
     def add_user(name, email, phone, address):
-        """Add a new user."""
-        conn = get_connection()
-        cursor = conn.cursor()
+        """Add a new user; returns the new User or None."""
         try:
-            cursor.execute('''
-                INSERT INTO users (name, email, phone, address)
-                VALUES (?, ?, ?, ?)
-            ''', (name, email, phone, address))
-            conn.commit()
-            return cursor.lastrowid
+            with transaction() as conn:
+                cursor = conn.execute('''
+                    INSERT INTO users (name, email, phone, address)
+                    VALUES (?, ?, ?, ?)
+                ''', (name, email, phone, address))
+                return _fetch_record(conn, 'SELECT * FROM users WHERE id = ?',
+                                     (cursor.lastrowid,), User)
         except Exception:
             return None
-        finally:
-            conn.close()
 
     @staticmethod
+    @invalidates('users')
     def update_user(user_id, name, email, phone, address):
-        """Update user information."""
-        conn = get_connection()
-        cursor = conn.cursor()
+        """Update user information; returns the updated User or None."""
         try:
-            cursor.execute('''
-                UPDATE users
-                SET name = ?, email = ?, phone = ?, address = ?
-                WHERE id = ?
-            ''', (name, email, phone, address, user_id))
-            conn.commit()
-            return True
+            with transaction() as conn:
+                conn.execute('''
+                    UPDATE users
+                    SET name = ?, email = ?, phone = ?, address = ?
+                    WHERE id = ?
+                ''', (name, email, phone, address, user_id))
+                return _fetch_record(conn, 'SELECT * FROM users WHERE id = ?', (user_id,), User)
         except Exception:
-            return False
-        finally:
-            conn.close()
+            return None
 
     @staticmethod
+    @invalidates('users')
     def delete_user(user_id):
         """Delete a user."""
-        conn = get_connection()
-        cursor = conn.cursor()
         try:
-            cursor.execute('DELETE FROM users WHERE id = ?', (user_id,))
-            conn.commit()
+            with transaction() as conn:
+                conn.execute('DELETE FROM users WHERE id = ?', (user_id,))
             return True
         except Exception:
             return False
-        finally:
-            conn.close()
 
     @staticmethod
+    @cached('users')
     def get_all_users():
         """Get all users."""
-        conn = get_connection()
-        conn.row_factory = dict_factory
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM users ORDER BY name')
-        users = cursor.fetchall()
-        conn.close()
-        return users
+        return list(_walk(UserModel.get_users_page))
+
+    @staticmethod
+    def get_users_page(after=None, limit=PAGE_SIZE):
+        """Get one page of users in name order, like get_books_page."""
+        return _keyset_page('SELECT * FROM users', (('name', 'name'), ('id', 'id')),
+                            after, limit, record=User)
 
     @staticmethod
+    @cached('users')
+    def find_users(prefix, limit=PICKER_LIMIT):
+        """Get users whose name or email starts with ``prefix``."""
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = row_factory(User)
+            cursor.execute('''
+                SELECT * FROM (
+                    SELECT * FROM users
+                    WHERE name COLLATE NOCASE >= ? AND name COLLATE NOCASE < ?
+                    ORDER BY name COLLATE NOCASE
+                    LIMIT ?
+                )
+                UNION
+                SELECT * FROM (
+                    SELECT * FROM users
+                    WHERE email >= ? AND email < ?
+                    LIMIT ?
+                )
+                ORDER BY name COLLATE NOCASE
+                LIMIT ?
+            ''', (*_prefix_range(prefix), limit, *_prefix_range(prefix), limit, limit))
+            return cursor.fetchall()
+
+    @staticmethod
+    @cached('users')
     def get_user_by_id(user_id):
         """Get user by ID."""
-        conn = get_connection()
-        conn.row_factory = dict_factory
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
-        user = cursor.fetchone()
-        conn.close()
-        return user
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = row_factory(User)
+            cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
+            return cursor.fetchone()
 
     @staticmethod
-    def search_users(keyword):
+    def search_users(keyword, limit=None):
         """Search users by name or email."""
-        conn = get_connection()
-        conn.row_factory = dict_factory
-        cursor = conn.cursor()
-        search_term = f'%{keyword}%'
-        cursor.execute('''
-            SELECT * FROM users
-            WHERE name LIKE ? OR email LIKE ?
-            ORDER BY name
-        ''', (search_term, search_term))
-        users = cursor.fetchall()
-        conn.close()
-        return users
+        with connection() as conn:
+            return search.search_users(conn, keyword, limit)
 
 
+@instrument_model
 class LoanModel:
     @staticmethod
+    @invalidates('loans', 'books')
     def create_loan(user_id, book_id, days=14):
-        """Create a new loan."""
-        conn = get_connection()
-        cursor = conn.cursor()
+        """Create a new loan; returns the new Loan or None."""
+        loan_id = LoanModel.create_loans_batch([(user_id, book_id)], days)[0]
+        return LoanModel.get_loan(loan_id) if loan_id else None
+
+    @staticmethod
+    @invalidates('loans', 'books')
+    def create_loans_batch(items, days=14):
+        """Create many loans in one transaction.
+
+        ``items`` is a sequence of ``(user_id, book_id)`` pairs.  Returns a
+        list with the new loan ID for each item, or None where the user or
+        the book does not exist or the book had no copy left (or for every
+        item if the transaction failed).
+        """
+        results = [None] * len(items)
         try:
-            due_date = datetime.now() + timedelta(days=days)
-            cursor.execute('''
-                INSERT INTO loans (user_id, book_id, due_date, status)
-                VALUES (?, ?, ?, ?)
-            ''', (user_id, book_id, due_date.isoformat(), 'active'))
-            
-            cursor.execute('''
-                UPDATE books
-                SET available_copies = available_copies - 1
-                WHERE id = ?
-            ''', (book_id,))
-            
-            conn.commit()
-            return cursor.lastrowid
+            due_date = (datetime.now() + timedelta(days=days)).isoformat()
+            with transaction() as conn:
+                for i, (user_id, book_id) in enumerate(items):
+                    # Foreign keys are not enforced, so an unknown user would
+                    # leave an orphan loan; an unknown book fails the UPDATE.
+                    if conn.execute('SELECT 1 FROM users WHERE id = ?',
+                                    (user_id,)).fetchone() is None:
+                        continue
+                    cursor = conn.execute('''
+                        UPDATE books
+                        SET available_copies = available_copies - 1
+                        WHERE id = ? AND available_copies > 0
+                    ''', (book_id,))
+                    if cursor.rowcount != 1:
+                        continue
+                    cursor = conn.execute('''
+                        INSERT INTO loans (user_id, book_id, due_date, status)
+                        VALUES (?, ?, ?, ?)
+                    ''', (user_id, book_id, due_date, 'active'))
+                    results[i] = cursor.lastrowid
         except Exception:
-            conn.rollback()
-            return None
-        finally:
-            conn.close()
+            return [None] * len(items)
+        return results
 
     @staticmethod
+    @invalidates('loans', 'books')
     def return_book(loan_id):
-        """Return a borrowed book."""
-        conn = get_connection()
-        cursor = conn.cursor()
+        """Return a borrowed book; returns the updated Loan or None."""
+        if LoanModel.return_loans_batch([loan_id])[0]:
+            return LoanModel.get_loan(loan_id)
+        return None
+
+    @staticmethod
+    @invalidates('loans', 'books')
+    def return_loans_batch(loan_ids):
+        """Return many loans in one transaction.
+
+        Returns a list with True for each loan that was returned, or False
+        where it was unknown or already returned (or for every loan if the
+        transaction failed).
+        """
+        results = [False] * len(loan_ids)
         try:
-            cursor.execute('SELECT book_id FROM loans WHERE id = ?', (loan_id,))
-            result = cursor.fetchone()
-            if result:
-                book_id = result[0]
-                cursor.execute('''
-                    UPDATE loans
-                    SET return_date = ?, status = ?
-                    WHERE id = ?
-                ''', (datetime.now().isoformat(), 'returned', loan_id))
-                
-                cursor.execute('''
-                    UPDATE books
-                    SET available_copies = available_copies + 1
-                    WHERE id = ?
-                ''', (book_id,))
-                
-                conn.commit()
-                return True
+            return_date = datetime.now().isoformat()
+            with transaction() as conn:
+                for i, loan_id in enumerate(loan_ids):
+                    cursor = conn.execute('''
+                        UPDATE loans
+                        SET return_date = ?, status = 'returned'
+                        WHERE id = ? AND status <> 'returned'
+                    ''', (return_date, loan_id))
+                    if cursor.rowcount != 1:
+                        continue
+                    conn.execute('''
+                        UPDATE books
+                        SET available_copies = available_copies + 1
+                        WHERE id = (SELECT book_id FROM loans WHERE id = ?)
+                    ''', (loan_id,))
+                    results[i] = True
         except Exception:
-            conn.rollback()
-        finally:
-            conn.close()
-        return False
+            return [False] * len(loan_ids)
+        return results
 
     @staticmethod
-    def get_all_loans():
-        """Get all loans."""
-        conn = get_connection()
-        conn.row_factory = dict_factory
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT l.id, l.user_id, l.book_id, u.name, b.title, 
-                   l.loan_date, l.due_date, l.return_date, l.status
-            FROM loans l
-            JOIN users u ON l.user_id = u.id
-            JOIN books b ON l.book_id = b.id
-            ORDER BY l.loan_date DESC
-        ''')
-        loans = cursor.fetchall()
-        conn.close()
-        return loans
+    def get_loan(loan_id):
+        """Get one loan with its user's name and book's title."""
+        with connection() as conn:
+            return _fetch_record(conn, LOAN_SELECT + ' WHERE l.id = ?', (loan_id,), Loan)
 
     @staticmethod
+    @cached('loans', 'books', 'users')
+    def get_all_loans(history=False):
+        """Get all loans; with ``history`` also the archived ones."""
+        return list(_walk(functools.partial(LoanModel.get_loans_page, history=history)))
+
+    @staticmethod
+    @cached('loans', 'books', 'users')
     def get_active_loans():
         """Get active loans only."""
-        conn = get_connection()
-        conn.row_factory = dict_factory
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT l.id, l.user_id, l.book_id, u.name, b.title, 
-                   l.loan_date, l.due_date, l.return_date, l.status
-            FROM loans l
-            JOIN users u ON l.user_id = u.id
-            JOIN books b ON l.book_id = b.id
-            WHERE l.status = 'active'
-            ORDER BY l.due_date
-        ''')
-        loans = cursor.fetchall()
-        conn.close()
-        return loans
+        return list(_walk(LoanModel.get_active_loans_page))
+
+    @staticmethod
+    @cached('loans', 'books', 'users')
+    def get_overdue_loans():
+        """Get overdue loans only."""
+        return list(_walk(LoanModel.get_overdue_loans_page))
 
     @staticmethod
+    def get_loans_page(after=None, limit=PAGE_SIZE, history=False):
+        """Get one page of loans, newest first, like get_books_page.
+
+        With ``history`` archived loans are merged in.
+        """
+        select = LOAN_HISTORY_SELECT if history else LOAN_SELECT
+        return _keyset_page(select, (('l.loan_date', 'loan_date'), ('l.id', 'id')),
+                            after, limit, descending=True, record=Loan)
+
+    @staticmethod
+    def get_active_loans_page(after=None, limit=PAGE_SIZE):
+        """Get one page of active loans, soonest due first, like get_books_page."""
+        return _keyset_page(LOAN_SELECT, (('l.due_date', 'due_date'), ('l.id', 'id')),
+                            after, limit, where="l.status = 'active'", record=Loan)
+
+    @staticmethod
+    def get_overdue_loans_page(after=None, limit=PAGE_SIZE):
+        """Get one page of overdue loans, longest overdue first, like get_books_page."""
+        return _keyset_page(LOAN_SELECT, (('l.due_date', 'due_date'), ('l.id', 'id')),
+                            after, limit, where="l.status = 'overdue'", record=Loan)
+
+    @staticmethod
+    @cached('loans', 'books')
     def get_most_borrowed_books(limit=10):
         """Get most borrowed books."""
-        conn = get_connection()
-        conn.row_factory = dict_factory
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT b.id, b.title, b.author, COUNT(l.id) as borrow_count
-            FROM books b
-            LEFT JOIN loans l ON b.id = l.book_id
-            GROUP BY b.id
-            ORDER BY borrow_count DESC
-            LIMIT ?
-        ''', (limit,))
-        books = cursor.fetchall()
-        conn.close()
-        return books
+        with connection() as conn:
+            cursor = conn.cursor()
+            cursor.row_factory = row_factory(Record)
+            cursor.execute('''
+                SELECT b.id, b.title, b.author, s.borrow_count
+                FROM book_stats s
+                JOIN books b ON b.id = s.book_id
+                ORDER BY s.borrow_count DESC
+                LIMIT ?
+            ''', (limit,))
+            return cursor.fetchall()
@@ -0,0 +1,122 @@
+"""Overdue-loan engine.
+
+Two incremental jobs, each remembering how far it got in ``scan_watermarks``:
+
+* ``scan_overdue`` moves loans from ``active`` to ``overdue`` once their
+  ``due_date`` has passed, with one range ``UPDATE`` over
+  ``idx_loans_status_due`` covering only the due dates since the last scan.
+* ``queue_overdue_notices`` adds the loans that became overdue since its own
+  last run to the ``overdue_notices`` queue, which ``send_overdue_notices``
+  drains in batches.
+
+A scan therefore costs time proportional to the loans that fell due since
+the previous one, however many loans there are in total.  Due dates are
+stored as local-time ISO strings (``datetime.isoformat``), so "now" is
+compared in the same format.
+
+Usage::
+
+    python maintenance.py scan-overdue
+    python maintenance.py send-notices
+"""
+from datetime import datetime
+
+from cache import invalidates
+from database import connection, transaction, dict_factory
+
+SCAN_INTERVAL_SECONDS = 60
+NOTICE_BATCH_SIZE = 500
+
+STATUS_JOB = 'overdue-status'
+NOTICE_JOB = 'overdue-notices'
+
+
+def get_watermark(conn, job):
+    row = conn.execute('SELECT watermark FROM scan_watermarks WHERE job = ?',
+                       (job,)).fetchone()
+    return row[0] if row else ''
+
+
+def set_watermark(conn, job, watermark):
+    conn.execute('''
+        INSERT INTO scan_watermarks (job, watermark) VALUES (?, ?)
+        ON CONFLICT (job) DO UPDATE SET watermark = excluded.watermark
+    ''', (job, watermark))
+
+
+@invalidates('loans')
+def scan_overdue(now=None):
+    """Mark loans that fell due since the last scan as overdue; returns how many."""
+    now = (now or datetime.now()).isoformat()
+    with transaction() as conn:
+        since = get_watermark(conn, STATUS_JOB)
+        if now <= since:
+            return 0
+        cursor = conn.execute('''
+            UPDATE loans SET status = 'overdue'
+            WHERE status = 'active' AND due_date > ? AND due_date <= ?
+        ''', (since, now))
+        set_watermark(conn, STATUS_JOB, now)
+    return cursor.rowcount
+
+
+def queue_overdue_notices():
+    """Queue a notice for every loan that became overdue since the last run."""
+    with transaction() as conn:
+        since = get_watermark(conn, NOTICE_JOB)
+        until = get_watermark(conn, STATUS_JOB)
+        if until <= since:
+            return 0
+        cursor = conn.execute('''
+            INSERT OR IGNORE INTO overdue_notices (loan_id, user_id, book_id, due_date)
+            SELECT id, user_id, book_id, due_date FROM loans
+            WHERE status = 'overdue' AND due_date > ? AND due_date <= ?
+        ''', (since, until))
+        set_watermark(conn, NOTICE_JOB, until)
+    return cursor.rowcount
+
+
+def run_overdue_jobs(now=None):
+    """Run both jobs; returns ``(loans_flipped, notices_queued)``."""
+    return scan_overdue(now), queue_overdue_notices()
+
+
+def pending_notices(limit=NOTICE_BATCH_SIZE):
+    """Get the oldest unsent notices with the user's and book's details."""
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = dict_factory
+        cursor.execute('''
+            SELECT n.id, n.loan_id, n.due_date, n.queued_at,
+                   u.name, u.email, u.phone, b.title
+            FROM overdue_notices n
+            JOIN users u ON u.id = n.user_id
+            JOIN books b ON b.id = n.book_id
+            WHERE n.sent_at IS NULL
+            ORDER BY n.id
+            LIMIT ?
+        ''', (limit,))
+        return cursor.fetchall()
+
+
+def mark_notices_sent(notice_ids):
+    with transaction() as conn:
+        conn.executemany(
+            'UPDATE overdue_notices SET sent_at = CURRENT_TIMESTAMP WHERE id = ?',
+            ((notice_id,) for notice_id in notice_ids))
+
+
+def send_overdue_notices(send, batch_size=NOTICE_BATCH_SIZE):
+    """Drain the queue: ``send(notices)`` gets each batch; returns the count sent.
+
+    A batch is marked sent only after ``send`` returns, so a failure leaves
+    it queued for the next run.
+    """
+    sent = 0
+    while True:
+        notices = pending_notices(batch_size)
+        if not notices:
+            return sent
+        send(notices)
+        mark_notices_sent([notice['id'] for notice in notices])
+        sent += len(notices)
@@ -0,0 +1,280 @@
+"""Heavy reports over the whole loan history, computed in parallel.
+
+The report's date range is cut into shards of consecutive days and each
+shard runs in a worker process of a ``ProcessPoolExecutor``, on its own
+read-only connection (``database.connect_read_only``, a ``mode=ro`` URI).
+A shard reads its loans through the ``loan_date`` indexes and returns a
+small partial aggregate; the parent merges the partials as shards complete
+and reports ``progress(done, total)`` in shards.  Shards share nothing, so
+the work spreads over as many cores as there are workers.
+
+There are at least ``SHARDS_PER_WORKER`` shards per worker, so a slow
+shard does not leave the others idle, and none longer than
+``MAX_SHARD_DAYS``, which bounds the memory of a worker.  Workers are
+started with ``spawn`` (fork is unsafe in the threaded GUI), so a report
+pays about a second of start-up.
+
+``cancelled()`` is polled while shards run; once it turns true pending
+shards are dropped and running ones stop at their next SQLite progress
+callback.
+
+Reports (``REPORTS``):
+
+* ``demand``: ``analytics.analyze`` (needs NumPy).
+* ``loan-history``: checkouts, returns, late loans and days on loan per
+  period of checkout and category, straight from the loans.
+
+Usage::
+
+    python parallel_reports.py loan-history --since 2020-01-01 --period year --workers 16
+    python parallel_reports.py demand --until 2024-12-31 --top 20
+"""
+import argparse
+import csv
+import math
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import date, timedelta
+from pathlib import Path
+
+import database
+from database import connect_read_only, connection, get_pool
+from migrations import LATE_LOAN, WEEK_OF
+from records import Record, record_type
+
+WORKERS = os.cpu_count() or 1
+SHARDS_PER_WORKER = 4
+MAX_SHARD_DAYS = 31
+# SQLite virtual machine steps between checks for cancellation in a worker.
+CANCEL_CHECK_STEPS = 100000
+CANCEL_POLL_SECONDS = 0.2
+
+# period -> expression turning l.loan_date into the period's label, as in
+# reports.PERIODS.
+LOAN_PERIODS = {
+    'day': 'date(l.loan_date)',
+    'week': WEEK_OF.format(day='l.loan_date'),
+    'month': 'substr(l.loan_date, 1, 7)',
+    'year': 'substr(l.loan_date, 1, 4)',
+}
+LOAN_HISTORY_SQL = '''
+    SELECT {period}, COALESCE(b.category, ''), COUNT(*),
+           SUM(l.status = 'returned' AND l.return_date IS NOT NULL), SUM({late}),
+           SUM(COALESCE(julianday(l.return_date) - julianday(l.loan_date), 0))
+    FROM {table} l LEFT JOIN books b ON b.id = l.book_id
+    WHERE l.loan_date >= ? AND l.loan_date < date(?, '+1 day')
+    GROUP BY 1, 2
+'''
+
+
+class DemandReport:
+    """``analytics.analyze`` over shards; the result is the same dict."""
+
+    # analytics.TITLE_COLUMNS, repeated so this module imports without NumPy.
+    columns = ('book_id', 'title', 'total_copies', 'checkouts', 'forecast',
+               'loan_days', 'needed', 'shortfall')
+
+    def __init__(self, conn, until, period='month', periods=None, top=None):
+        import analytics
+        self.start = time.perf_counter()
+        periods = analytics.SERIES_PERIODS if periods is None else periods
+        self.top = analytics.TOP_TITLES if top is None else top
+        self.context = {
+            'first_period': analytics.demand_window(until, period, periods),
+            'periods': periods,
+            'period': period,
+            'books': analytics.book_count(conn),
+        }
+        self.totals = analytics.DemandTotals(**self.context)
+
+    @staticmethod
+    def shard(conn, since, until, history, **context):
+        import analytics
+        totals = analytics.DemandTotals(**context)
+        for chunk in analytics.iter_loan_range(conn, since, until, history):
+            totals.add(*chunk)
+        return totals.parts()
+
+    def merge(self, partial):
+        self.totals.merge(partial)
+
+    def finish(self, conn):
+        import analytics
+        result = analytics.summarize(conn, self.totals, self.top)
+        result['seconds'] = time.perf_counter() - self.start
+        return result
+
+
+class LoanHistoryReport:
+    """Loans per period of checkout and category; a list of records."""
+
+    columns = ('period', 'category', 'checkouts', 'returns', 'late', 'average_days')
+
+    def __init__(self, conn, until, period='month'):
+        if period not in LOAN_PERIODS:
+            raise ValueError(f'period must be one of {tuple(LOAN_PERIODS)}')
+        self.context = {'period': period}
+        self.totals = {}
+
+    @staticmethod
+    def shard(conn, since, until, history, period):
+        rows = []
+        for table in ('loans', 'loans_archive') if history else ('loans',):
+            sql = LOAN_HISTORY_SQL.format(period=LOAN_PERIODS[period],
+                                          late=LATE_LOAN.format(row='l'), table=table)
+            rows += conn.execute(sql, (str(since), str(until))).fetchall()
+        return rows
+
+    def merge(self, partial):
+        for period, category, *counts in partial:
+            totals = self.totals.setdefault((period, category), [0, 0, 0, 0.0])
+            for i, count in enumerate(counts):
+                totals[i] += count
+
+    def finish(self, conn):
+        row = record_type(Record, self.columns)
+        return [row((period, category, checkouts, returns, late,
+                     round(days / returns, 1) if returns else None))
+                for (period, category), (checkouts, returns, late, days)
+                in sorted(self.totals.items())]
+
+
+REPORTS = {
+    'demand': DemandReport,
+    'loan-history': LoanHistoryReport,
+}
+
+
+def _as_date(day):
+    return date.fromisoformat(day) if isinstance(day, str) else day
+
+
+def date_shards(since, until, shards):
+    """Split ``since``..``until`` (inclusive dates) into at most ``shards``
+    consecutive, inclusive ``(first, last)`` day ranges of near-equal length."""
+    days = (until - since).days + 1
+    if days <= 0:
+        return []
+    shards = min(max(shards, 1), days)
+    bounds = [since + timedelta(days=days * i // shards) for i in range(shards + 1)]
+    return [(first, last - timedelta(days=1)) for first, last in zip(bounds, bounds[1:])]
+
+
+def shard_count(since, until, workers):
+    days = (until - since).days + 1
+    return max(workers * SHARDS_PER_WORKER, math.ceil(days / MAX_SHARD_DAYS))
+
+
+def history_start(conn, history=True):
+    """The day of the first loan (archived ones included with ``history``), or None."""
+    days = [conn.execute(f'SELECT date(MIN(loan_date)) FROM {table}').fetchone()[0]
+            for table in (('loans', 'loans_archive') if history else ('loans',))]
+    days = [day for day in days if day]
+    return date.fromisoformat(min(days)) if days else None
+
+
+# -- Worker processes -----------------------------------------------------------
+
+_worker = {}
+
+
+def _init_worker(path, stop):
+    conn = connect_read_only(path)
+    # A non-zero return aborts the running statement (OperationalError).
+    conn.set_progress_handler(stop.is_set, CANCEL_CHECK_STEPS)
+    _worker.update(conn=conn, stop=stop)
+
+
+def _run_shard(name, since, until, history, context):
+    if _worker['stop'].is_set():
+        return None
+    return REPORTS[name].shard(_worker['conn'], since, until, history, **context)
+
+
+def run(name, since=None, until=None, history=True, workers=WORKERS, progress=None,
+        cancelled=None, **options):
+    """Run report ``name`` over loans checked out ``since``..``until``.
+
+    Dates are inclusive and default to the first loan and today; ``history``
+    includes archived loans.  ``options`` go to the report (``period``, and
+    ``periods`` and ``top`` for ``demand``).  Returns the report's result,
+    or None if ``cancelled()`` turned true first.
+    """
+    since, until = _as_date(since), _as_date(until) or date.today()
+    with connection() as conn:
+        report = REPORTS[name](conn, until, **options)
+        since = since or history_start(conn, history) or until
+    shards = date_shards(since, until, shard_count(since, until, workers))
+
+    context = multiprocessing.get_context('spawn')
+    stop = context.Event()
+    pool = ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker,
+                               initargs=(str(get_pool().path), stop))
+    try:
+        pending = {pool.submit(_run_shard, name, first, last, history, report.context)
+                   for first, last in shards}
+        done = 0
+        while pending:
+            finished, pending = wait(pending, CANCEL_POLL_SECONDS, FIRST_COMPLETED)
+            if cancelled is not None and cancelled():
+                return None
+            for future in finished:
+                report.merge(future.result())
+                done += 1
+                if progress is not None:
+                    progress(done, len(shards))
+    finally:
+        # Stops the running shards too when leaving early (cancelled or failed).
+        stop.set()
+        pool.shutdown(cancel_futures=True)
+    with connection() as conn:
+        return report.finish(conn)
+
+
+def _print_progress(done, total):
+    sys.stderr.write(f'\r{done} / {total} shards')
+    sys.stderr.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Reports over the loan history, in parallel.')
+    parser.add_argument('report', choices=sorted(REPORTS))
+    parser.add_argument('--since', type=date.fromisoformat,
+                        help='first loan date (YYYY-MM-DD; default: the first loan)')
+    parser.add_argument('--until', type=date.fromisoformat,
+                        help='last loan date (YYYY-MM-DD; default: today)')
+    parser.add_argument('--period', choices=LOAN_PERIODS,
+                        help='grouping (demand: week or month)')
+    parser.add_argument('--periods', type=int, help='demand: periods to forecast from')
+    parser.add_argument('--top', type=int, default=20, help='demand: titles to list')
+    parser.add_argument('--workers', type=int, default=WORKERS, help='worker processes')
+    parser.add_argument('--live-only', action='store_true', help='leave out archived loans')
+    parser.add_argument('--db', help='database file (default: library.db)')
+    args = parser.parse_args(argv)
+
+    options = {'period': args.period or 'month'}
+    if args.report == 'demand':
+        options.update(periods=args.periods, top=args.top)
+    if args.db:
+        database.DB_PATH = Path(args.db)
+    database.init_database()
+    database.configure_pool(database.DB_PATH)
+    start = time.perf_counter()
+    try:
+        result = run(args.report, args.since, args.until, not args.live_only, args.workers,
+                     _print_progress, **options)
+    finally:
+        database.close_pool()
+    sys.stderr.write(f'\n{args.workers} workers, {time.perf_counter() - start:.1f}s\n')
+
+    rows = result['titles'] if args.report == 'demand' else result
+    writer = csv.writer(sys.stdout)
+    writer.writerow(REPORTS[args.report].columns)
+    writer.writerows(rows)
+
+
+if __name__ == '__main__':
+    main()
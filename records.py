@@ -0,0 +1,116 @@
+"""Compact, typed records for query results.
+
+A record is a tuple subclass with no per-instance ``__dict__``: building one
+from a SQLite row is a single ``tuple.__new__`` call, and it takes a fraction
+of the memory of the dictionary ``dict_factory`` builds.  Records still read
+like the dictionaries the rest of the code expects::
+
+    book = BookModel.get_book_by_id(1)
+    book['title'], book.title, book.get('isbn'), dict(book)
+
+Column positions are resolved once per result shape, not once per row.  Use
+``as_dicts`` where plain dictionaries are needed, e.g. for JSON.
+"""
+
+
+class Record(tuple):
+    """Immutable row readable by column name, attribute or position."""
+
+    __slots__ = ()
+    _fields = ()
+    _index = {}
+
+    def __getitem__(self, key):
+        if key.__class__ is str:
+            try:
+                key = self._index[key]
+            except KeyError:
+                raise KeyError(key) from None
+        return tuple.__getitem__(self, key)
+
+    def __getattr__(self, name):
+        try:
+            return tuple.__getitem__(self, self._index[name])
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def get(self, key, default=None):
+        index = self._index.get(key)
+        return default if index is None else tuple.__getitem__(self, index)
+
+    def keys(self):
+        return self._fields
+
+    def values(self):
+        return tuple(self)
+
+    def items(self):
+        return zip(self._fields, self)
+
+    def _asdict(self):
+        return dict(zip(self._fields, self))
+
+    def __repr__(self):
+        fields = ', '.join(f'{name}={value!r}' for name, value in self.items())
+        return f'{type(self).__name__}({fields})'
+
+    def __reduce__(self):
+        return _rebuild, (type(self).__bases__[0], self._fields, tuple(self))
+
+
+class Book(Record):
+    __slots__ = ()
+
+
+class User(Record):
+    __slots__ = ()
+
+
+class Loan(Record):
+    __slots__ = ()
+
+
+_shapes = {}
+
+
+def record_type(base, fields):
+    """The subclass of ``base`` for rows with columns ``fields`` (cached)."""
+    key = (base, fields)
+    cls = _shapes.get(key)
+    if cls is None:
+        cls = type(base.__name__, (base,), {
+            '__slots__': (),
+            '_fields': fields,
+            '_index': {name: i for i, name in enumerate(fields)},
+        })
+        _shapes[key] = cls
+    return cls
+
+
+def _rebuild(base, fields, values):
+    return record_type(base, fields)(values)
+
+
+def row_factory(base=Record):
+    """A ``cursor.row_factory`` that returns ``base`` records."""
+    last = [None, None]  # cursor.description and the record type built for it
+    new = tuple.__new__
+
+    def factory(cursor, row):
+        description = cursor.description
+        if description is not last[0]:
+            last[0] = description
+            last[1] = record_type(base, tuple(column[0] for column in description))
+        return new(last[1], row)
+    return factory
+
+
+def as_dicts(data):
+    """Replace records inside ``data`` (lists, tuples, dicts) with plain dicts."""
+    if isinstance(data, Record):
+        return data._asdict()
+    if isinstance(data, (list, tuple)):
+        return [as_dicts(item) for item in data]
+    if isinstance(data, dict):
+        return {key: as_dicts(value) for key, value in data.items()}
+    return data
@@ -0,0 +1,166 @@
+"""Circulation reports answered from the daily rollup tables.
+
+``daily_circulation`` and ``weekly_active_users`` (see
+``migrations.create_circulation_rollups``) are kept up to date by triggers
+as loans are created, turn overdue and are returned, so a report over any
+date range reads at most one row per day and category (or per week and
+active user) instead of scanning and joining the loans::
+
+    reports.circulation_by_category('2024-01-01', '2024-12-31', period='month')
+    reports.overdue_rate_by_category(since='2024-01-01')
+
+Date ranges are inclusive ``YYYY-MM-DD`` strings (or dates) and apply to
+the day of the event a report counts: the checkout or return for
+circulation, the return for loan duration and the due date for the overdue
+rate.  Active users are counted per whole week, for the weeks overlapping
+the range.
+
+Usage::
+
+    python reports.py circulation --since 2024-01-01 --period month
+    python reports.py overdue-rate --since 2024-01-01 --until 2024-06-30
+"""
+import argparse
+import csv
+import sys
+from datetime import date
+from pathlib import Path
+
+import database
+from cache import cached
+from database import connection
+from migrations import WEEK_OF
+from records import Record, row_factory
+
+# period -> expression turning a rollup ``day`` into the period's label;
+# weeks are labelled with their Monday.
+PERIODS = {
+    'day': 'day',
+    'week': WEEK_OF.format(day='day'),
+    'month': 'substr(day, 1, 7)',
+    'year': 'substr(day, 1, 4)',
+}
+
+
+def _date_range(since, until, column='day', start='?'):
+    where, params = [], []
+    if since:
+        where.append(f'{column} >= {start}')
+        params.append(str(since))
+    if until:
+        where.append(f'{column} <= ?')
+        params.append(str(until))
+    return (' WHERE ' + ' AND '.join(where) if where else ''), params
+
+
+def _period(period):
+    try:
+        return PERIODS[period]
+    except KeyError:
+        raise ValueError(f'period must be one of {tuple(PERIODS)}') from None
+
+
+def _report(sql, params):
+    with connection() as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = row_factory(Record)
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+@cached('loans')
+def circulation_by_category(since=None, until=None, period='month'):
+    """Loans checked out and returned per period and book category."""
+    where, params = _date_range(since, until)
+    return _report(f'''
+        SELECT {_period(period)} AS period, category,
+               SUM(checkouts) AS checkouts, SUM(returns) AS returns
+        FROM daily_circulation{where}
+        GROUP BY 1, 2
+        ORDER BY 1, 2
+    ''', params)
+
+
+@cached('loans')
+def active_users(since=None, until=None):
+    """Users who borrowed or returned something, per week (labelled with its Monday)."""
+    where, params = _date_range(since, until, 'week', WEEK_OF.format(day='?'))
+    return _report(f'''
+        SELECT week AS period, COUNT(*) AS users
+        FROM weekly_active_users{where}
+        GROUP BY week
+        ORDER BY week
+    ''', params)
+
+
+@cached('loans')
+def loan_duration_by_category(since=None, until=None):
+    """Average days on loan of the loans returned in the range, per category."""
+    where, params = _date_range(since, until)
+    return _report(f'''
+        SELECT category, SUM(returns) AS returns,
+               ROUND(SUM(loan_days) / NULLIF(SUM(returns), 0), 1) AS average_days
+        FROM daily_circulation{where}
+        GROUP BY category
+        ORDER BY category
+    ''', params)
+
+
+@cached('loans')
+def overdue_rate_by_category(since=None, until=None):
+    """Share of the loans falling due in the range that went late, per category."""
+    where, params = _date_range(since, until)
+    return _report(f'''
+        SELECT category, SUM(due) AS due, SUM(late) AS late,
+               ROUND(100.0 * SUM(late) / NULLIF(SUM(due), 0), 1) AS late_percent
+        FROM daily_circulation{where}
+        GROUP BY category
+        ORDER BY category
+    ''', params)
+
+
+# name -> (function, columns, default period or None if it takes none)
+REPORTS = {
+    'circulation': (circulation_by_category,
+                    ('period', 'category', 'checkouts', 'returns'), 'month'),
+    'active-users': (active_users, ('period', 'users'), None),
+    'loan-duration': (loan_duration_by_category,
+                      ('category', 'returns', 'average_days'), None),
+    'overdue-rate': (overdue_rate_by_category,
+                     ('category', 'due', 'late', 'late_percent'), None),
+}
+
+
+def run_report(name, since=None, until=None, period=None):
+    """Run the report called ``name``; ``period`` only applies to periodic ones."""
+    func, columns, default_period = REPORTS[name]
+    if default_period is None:
+        return func(since, until)
+    return func(since, until, period or default_period)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Circulation reports from the daily rollups.')
+    parser.add_argument('report', choices=sorted(REPORTS))
+    parser.add_argument('--since', type=date.fromisoformat, help='first day (YYYY-MM-DD) to include')
+    parser.add_argument('--until', type=date.fromisoformat, help='last day (YYYY-MM-DD) to include')
+    parser.add_argument('--period', choices=PERIODS, help='grouping of periodic reports')
+    parser.add_argument('--db', help='database file (default: library.db)')
+    args = parser.parse_args(argv)
+
+    if args.db:
+        database.DB_PATH = Path(args.db)
+    database.init_database()
+    database.configure_pool(database.DB_PATH)
+    try:
+        rows = run_report(args.report, args.since, args.until, args.period)
+    finally:
+        database.close_pool()
+
+    writer = csv.writer(sys.stdout)
+    writer.writerow(REPORTS[args.report][1])
+    writer.writerows(rows)
+
+
+if __name__ == '__main__':
+    main()
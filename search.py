@@ -0,0 +1,86 @@
+"""Full-text search over books and users.
+
+Searches go through the FTS5 indexes created by migration 3 and are ranked
+with BM25.  Each word of the keyword is matched as a prefix, so ``"har pot"``
+finds *Harry Potter*.  When the index is missing (SQLite built without
+FTS5) or the keyword has no searchable words, the original ``LIKE``
+substring scan is used instead.
+"""
+import re
+
+from records import Book, User, row_factory
+
+_WORD = re.compile(r'\w+')
+
+# BM25 column weights: a hit in the title/name counts for more than one in
+# the author/email, which counts for more than one in the ISBN.
+BOOK_WEIGHTS = (10.0, 5.0, 1.0)
+USER_WEIGHTS = (10.0, 2.0)
+
+
+def build_match_query(keyword):
+    """Turn free text into an FTS5 prefix query, or None if it has no words."""
+    words = _WORD.findall(keyword)
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def has_index(conn, table):
+    """Return True if the FTS5 index for ``table`` exists."""
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+        (f'{table}_fts',)).fetchone() is not None
+
+
+def _query(conn, sql, params, record):
+    cursor = conn.cursor()
+    cursor.row_factory = row_factory(record)
+    cursor.execute(sql, params)
+    return cursor.fetchall()
+
+
+def search_books(conn, keyword, limit=None):
+    """Return books matching ``keyword``, best match first."""
+    limit = -1 if limit is None else limit
+    match = build_match_query(keyword)
+    if match is not None and has_index(conn, 'books'):
+        weights = ', '.join(str(w) for w in BOOK_WEIGHTS)
+        return _query(conn, f'''
+            SELECT b.* FROM books_fts f
+            JOIN books b ON b.id = f.rowid
+            WHERE books_fts MATCH ?
+            ORDER BY bm25(books_fts, {weights}), b.title
+            LIMIT ?
+        ''', (match, limit), Book)
+
+    search_term = f'%{keyword}%'
+    return _query(conn, '''
+        SELECT * FROM books
+        WHERE title LIKE ? OR author LIKE ? OR isbn LIKE ?
+        ORDER BY title
+        LIMIT ?
+    ''', (search_term, search_term, search_term, limit), Book)
+
+
+def search_users(conn, keyword, limit=None):
+    """Return users matching ``keyword``, best match first."""
+    limit = -1 if limit is None else limit
+    match = build_match_query(keyword)
+    if match is not None and has_index(conn, 'users'):
+        weights = ', '.join(str(w) for w in USER_WEIGHTS)
+        return _query(conn, f'''
+            SELECT u.* FROM users_fts f
+            JOIN users u ON u.id = f.rowid
+            WHERE users_fts MATCH ?
+            ORDER BY bm25(users_fts, {weights}), u.name
+            LIMIT ?
+        ''', (match, limit), User)
+
+    search_term = f'%{keyword}%'
+    return _query(conn, '''
+        SELECT * FROM users
+        WHERE name LIKE ? OR email LIKE ?
+        ORDER BY name
+        LIMIT ?
+    ''', (search_term, search_term, limit), User)
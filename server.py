@@ -0,0 +1,555 @@
+"""Headless HTTP/JSON service over the library models.
+
+A small asyncio HTTP/1.1 server, standard library only, so several front
+desks can share one catalogue without opening the SQLite file themselves.
+
+* Model calls go through ``async_models.ModelExecutor``: reads run on a
+  thread pool sized to the shared connection pool; writes go through one
+  dedicated writer thread, so concurrent checkouts queue up in the service
+  instead of contending for the SQLite write lock.
+* Keep-alive connections may pipeline requests: they are parsed and started
+  as soon as they arrive, and the responses are written back in order.
+* Full listings (``/books/all``, ``/users/all``, ``/loans/all``) are streamed
+  page by page with chunked encoding instead of being built in memory.
+  ``/loans`` and ``/loans/all`` take ``history=1`` to include archived loans.
+* Returned loans are archived once a day, a batch per writer job, so
+  checkouts keep flowing while it runs (see ``archive.py``).
+
+Usage::
+
+    python server.py --port 8080
+    curl localhost:8080/books?limit=20
+    curl -X POST localhost:8080/loans -d '{"user_id": 1, "book_id": 42}'
+"""
+import argparse
+import asyncio
+import functools
+import json
+import re
+import sys
+from datetime import date
+from pathlib import Path
+from urllib.parse import parse_qsl, urlsplit
+
+import database
+from archive import ARCHIVE_INTERVAL_SECONDS, archive_batch, archive_cutoff, reclaim_space
+from async_models import ModelExecutor
+from models import BookModel, UserModel, LoanModel, PAGE_SIZE, PICKER_LIMIT
+from overdue import SCAN_INTERVAL_SECONDS, run_overdue_jobs
+from records import as_dicts
+from reports import REPORTS, run_report
+
+HOST = '127.0.0.1'
+PORT = 8080
+MAX_BODY = 1 << 20
+MAX_PAGE = 1000
+STREAM_PAGE_SIZE = 1000
+# Requests of one connection that may be in flight before we stop reading.
+PIPELINE_DEPTH = 32
+
+REASONS = {200: 'OK', 201: 'Created', 400: 'Bad Request', 404: 'Not Found',
+           405: 'Method Not Allowed', 409: 'Conflict', 413: 'Payload Too Large',
+           500: 'Internal Server Error'}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message=None):
+        super().__init__(message or REASONS[status])
+        self.status = status
+
+
+class Request:
+    def __init__(self, method, target, headers, body):
+        url = urlsplit(target)
+        self.method = method
+        self.path = url.path
+        self.query = dict(parse_qsl(url.query))
+        self.headers = headers
+        self.body = body
+        self.keep_alive = True
+
+    def json(self):
+        try:
+            data = json.loads(self.body or b'{}')
+        except ValueError:
+            raise HTTPError(400, 'invalid JSON body')
+        if not isinstance(data, dict):
+            raise HTTPError(400, 'JSON body must be an object')
+        return data
+
+    def int_param(self, name, default, maximum=None, minimum=1):
+        try:
+            value = int(self.query.get(name, default))
+        except ValueError:
+            raise HTTPError(400, f'{name} must be an integer')
+        if value < minimum:
+            raise HTTPError(400, f'{name} must be at least {minimum}')
+        return min(value, maximum) if maximum else value
+
+
+class Response:
+    """A JSON response; ``stream`` is an async iterator of body chunks."""
+
+    def __init__(self, status=200, data=None, stream=None):
+        self.status = status
+        self.data = data
+        self.stream = stream
+
+
+def dumps(data):
+    return json.dumps(as_dicts(data), ensure_ascii=False, default=str).encode('utf-8')
+
+
+def required(data, *fields):
+    missing = [field for field in fields if data.get(field) in (None, '')]
+    if missing:
+        raise HTTPError(400, f'missing fields: {", ".join(missing)}')
+    return [data[field] for field in fields]
+
+
+def int_field(data, field, default, minimum=1):
+    try:
+        value = int(data.get(field, default))
+    except (TypeError, ValueError):
+        raise HTTPError(400, f'{field} must be an integer')
+    if value < minimum:
+        raise HTTPError(400, f'{field} must be at least {minimum}')
+    return value
+
+
+class LibraryService:
+    """Routes requests to the models on the read pool or the writer thread."""
+
+    def __init__(self, readers=database.POOL_SIZE):
+        self.executor = ModelExecutor(readers)
+        self.read = self.executor.read
+        self.write = self.executor.write
+        self.routes = []
+        for method, pattern, handler in (
+                ('GET', r'/health', self.health),
+                ('GET', r'/books', self.books_page),
+                ('GET', r'/books/all', self.books_all),
+                ('GET', r'/books/search', self.books_search),
+                ('GET', r'/books/available', self.books_available),
+                ('GET', r'/books/(\d+)', self.book),
+                ('POST', r'/books', self.add_book),
+                ('PUT', r'/books/(\d+)', self.update_book),
+                ('DELETE', r'/books/(\d+)', self.delete_book),
+                ('GET', r'/users', self.users_page),
+                ('GET', r'/users/all', self.users_all),
+                ('GET', r'/users/search', self.users_search),
+                ('GET', r'/users/find', self.users_find),
+                ('GET', r'/users/(\d+)', self.user),
+                ('POST', r'/users', self.add_user),
+                ('PUT', r'/users/(\d+)', self.update_user),
+                ('DELETE', r'/users/(\d+)', self.delete_user),
+                ('GET', r'/loans', self.loans_page),
+                ('GET', r'/loans/all', self.loans_all),
+                ('POST', r'/loans', self.checkout),
+                ('POST', r'/loans/return', self.return_loans),
+                ('POST', r'/loans/(\d+)/return', self.return_loan),
+                ('GET', r'/reports/most-borrowed', self.most_borrowed)):
+            self.routes.append((method, re.compile(pattern + '$'), handler))
+        for name in REPORTS:
+            self.routes.append(('GET', re.compile(f'/reports/{name}$'),
+                                functools.partial(self.report, name)))
+
+    def close(self):
+        self.executor.close()
+
+    async def dispatch(self, request):
+        allowed = False
+        for method, pattern, handler in self.routes:
+            match = pattern.match(request.path)
+            if match:
+                if method == request.method:
+                    return await handler(request, *(int(g) for g in match.groups()))
+                allowed = True
+        raise HTTPError(405 if allowed else 404)
+
+    # -- helpers ------------------------------------------------------------
+
+    async def page(self, request, fetch_page):
+        limit = request.int_param('limit', PAGE_SIZE, MAX_PAGE)
+        try:
+            rows, after = await self.read(fetch_page, request.query.get('after'), limit)
+        except (ValueError, TypeError):
+            raise HTTPError(400, 'invalid cursor')
+        return Response(data={'items': rows, 'next': after})
+
+    def stream(self, fetch_page):
+        """Stream every record of ``fetch_page`` as one JSON array."""
+        async def chunks():
+            yield b'['
+            after, first = None, True
+            while True:
+                rows, after = await self.read(fetch_page, after, STREAM_PAGE_SIZE)
+                if rows:
+                    body = b',\n'.join(dumps(row) for row in rows)
+                    yield body if first else b',\n' + body
+                    first = False
+                if after is None:
+                    break
+            yield b']'
+        return Response(stream=chunks())
+
+    async def found(self, func, *args):
+        record = await self.read(func, *args)
+        if record is None:
+            raise HTTPError(404)
+        return Response(data=record)
+
+    async def check_loanable(self, user_id, book_id=None):
+        """404 if the user (or the book) of a refused checkout does not exist."""
+        if await self.read(UserModel.get_user_by_id, user_id) is None:
+            raise HTTPError(404, 'user not found')
+        if book_id is not None and await self.read(BookModel.get_book_by_id, book_id) is None:
+            raise HTTPError(404, 'book not found')
+
+    # -- handlers -----------------------------------------------------------
+
+    async def scan_overdue_forever(self, interval=SCAN_INTERVAL_SECONDS):
+        """Run the overdue jobs on the writer thread every ``interval`` seconds."""
+        while True:
+            try:
+                await self.write(run_overdue_jobs)
+            except Exception as exc:
+                log_job_failure('overdue scan', exc)
+            await asyncio.sleep(interval)
+
+    async def archive_forever(self, interval=ARCHIVE_INTERVAL_SECONDS):
+        """Archive old returned loans every ``interval`` seconds, one batch per write."""
+        while True:
+            try:
+                cutoff = archive_cutoff()
+                while await self.write(archive_batch, cutoff):
+                    pass
+                await self.write(reclaim_space)
+            except Exception as exc:
+                log_job_failure('archiving', exc)
+            await asyncio.sleep(interval)
+
+    async def health(self, request):
+        return Response(data={'status': 'ok'})
+
+    async def books_page(self, request):
+        return await self.page(request, BookModel.get_books_page)
+
+    async def books_all(self, request):
+        return self.stream(BookModel.get_books_page)
+
+    async def books_search(self, request):
+        limit = request.int_param('limit', PAGE_SIZE, MAX_PAGE)
+        return Response(data=await self.read(BookModel.search_books,
+                                              request.query.get('q', ''), limit))
+
+    async def books_available(self, request):
+        limit = request.int_param('limit', PICKER_LIMIT, MAX_PAGE)
+        return Response(data=await self.read(BookModel.find_available_books,
+                                              request.query.get('prefix', ''), limit))
+
+    async def book(self, request, book_id):
+        return await self.found(BookModel.get_book_by_id, book_id)
+
+    async def add_book(self, request):
+        data = request.json()
+        title, author = required(data, 'title', 'author')
+        book = await self.write(BookModel.add_book, title, author, data.get('isbn'),
+                                data.get('category'), int_field(data, 'total_copies', 1))
+        if book is None:
+            raise HTTPError(409, 'could not add book (duplicate ISBN?)')
+        return Response(201, book)
+
+    async def update_book(self, request, book_id):
+        data = request.json()
+        title, author, _ = required(data, 'title', 'author', 'total_copies')
+        book = await self.write(BookModel.update_book, book_id, title, author,
+                                data.get('isbn'), data.get('category'),
+                                int_field(data, 'total_copies', None))
+        if book is None:
+            raise HTTPError(409, 'could not update book')
+        return Response(data=book)
+
+    async def delete_book(self, request, book_id):
+        if not await self.write(BookModel.delete_book, book_id):
+            raise HTTPError(409, 'could not delete book')
+        return Response(data={'id': book_id})
+
+    async def users_page(self, request):
+        return await self.page(request, UserModel.get_users_page)
+
+    async def users_all(self, request):
+        return self.stream(UserModel.get_users_page)
+
+    async def users_search(self, request):
+        limit = request.int_param('limit', PAGE_SIZE, MAX_PAGE)
+        return Response(data=await self.read(UserModel.search_users,
+                                              request.query.get('q', ''), limit))
+
+    async def users_find(self, request):
+        limit = request.int_param('limit', PICKER_LIMIT, MAX_PAGE)
+        return Response(data=await self.read(UserModel.find_users,
+                                              request.query.get('prefix', ''), limit))
+
+    async def user(self, request, user_id):
+        return await self.found(UserModel.get_user_by_id, user_id)
+
+    async def add_user(self, request):
+        data = request.json()
+        name, = required(data, 'name')
+        user = await self.write(UserModel.add_user, name, data.get('email'),
+                                data.get('phone'), data.get('address'))
+        if user is None:
+            raise HTTPError(409, 'could not add user (duplicate email?)')
+        return Response(201, user)
+
+    async def update_user(self, request, user_id):
+        data = request.json()
+        name, = required(data, 'name')
+        user = await self.write(UserModel.update_user, user_id, name, data.get('email'),
+                                data.get('phone'), data.get('address'))
+        if user is None:
+            raise HTTPError(409, 'could not update user')
+        return Response(data=user)
+
+    async def delete_user(self, request, user_id):
+        if not await self.write(UserModel.delete_user, user_id):
+            raise HTTPError(409, 'could not delete user')
+        return Response(data={'id': user_id})
+
+    def loan_pager(self, request):
+        status = request.query.get('status')
+        if status == 'active':
+            return LoanModel.get_active_loans_page
+        if status == 'overdue':
+            return LoanModel.get_overdue_loans_page
+        if request.query.get('history') in ('1', 'true'):
+            return functools.partial(LoanModel.get_loans_page, history=True)
+        return LoanModel.get_loans_page
+
+    async def loans_page(self, request):
+        return await self.page(request, self.loan_pager(request))
+
+    async def loans_all(self, request):
+        return self.stream(self.loan_pager(request))
+
+    async def checkout(self, request):
+        """``{"user_id", "book_id"}`` or ``{"user_id", "book_ids": [...]}``."""
+        data = request.json()
+        user_id, = required(data, 'user_id')
+        days = int_field(data, 'days', 14)
+        if 'book_ids' in data:
+            book_ids = data['book_ids']
+            if not isinstance(book_ids, list):
+                raise HTTPError(400, 'book_ids must be a list')
+            loan_ids = await self.write(LoanModel.create_loans_batch,
+                                        [(user_id, book_id) for book_id in book_ids], days)
+            if book_ids and not any(loan_ids):
+                await self.check_loanable(user_id)
+            return Response(201, {'loan_ids': loan_ids})
+        book_id, = required(data, 'book_id')
+        loan = await self.write(LoanModel.create_loan, user_id, book_id, days)
+        if loan is None:
+            await self.check_loanable(user_id, book_id)
+            raise HTTPError(409, 'book not available')
+        return Response(201, loan)
+
+    async def return_loans(self, request):
+        loan_ids = request.json().get('loan_ids')
+        if not isinstance(loan_ids, list):
+            raise HTTPError(400, 'loan_ids must be a list')
+        return Response(data={'returned': await self.write(LoanModel.return_loans_batch,
+                                                           loan_ids)})
+
+    async def return_loan(self, request, loan_id):
+        loan = await self.write(LoanModel.return_book, loan_id)
+        if loan is None:
+            raise HTTPError(409, 'loan unknown or already returned')
+        return Response(data=loan)
+
+    async def most_borrowed(self, request):
+        limit = request.int_param('limit', 10, MAX_PAGE)
+        return Response(data=await self.read(LoanModel.get_most_borrowed_books, limit))
+
+    async def report(self, name, request):
+        """A rollup report; ``?since=&until=`` (YYYY-MM-DD) and ``?period=``."""
+        query = request.query
+        try:
+            since, until = (date.fromisoformat(query[key]) if query.get(key) else None
+                            for key in ('since', 'until'))
+            rows = await self.read(run_report, name, since, until, query.get('period'))
+        except ValueError as exc:
+            raise HTTPError(400, str(exc))
+        return Response(data=rows)
+
+
+# -- HTTP/1.1 -----------------------------------------------------------------
+
+async def read_request(reader):
+    """Parse one request from ``reader``; None when the client is done."""
+    try:
+        head = await reader.readuntil(b'\r\n\r\n')
+    except asyncio.IncompleteReadError:
+        return None
+    except asyncio.LimitOverrunError:
+        raise HTTPError(413, 'request head too large')
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, target, version = lines[0].split(' ')
+    except ValueError:
+        raise HTTPError(400, 'malformed request line')
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+    length = int(headers.get('content-length') or 0)
+    if length > MAX_BODY:
+        raise HTTPError(413)
+    body = await reader.readexactly(length) if length else b''
+    request = Request(method.upper(), target, headers, body)
+    connection = headers.get('connection', '').lower()
+    request.keep_alive = (connection != 'close' if version == 'HTTP/1.1'
+                          else connection == 'keep-alive')
+    return request
+
+
+async def write_response(writer, response, keep_alive):
+    head = [f'HTTP/1.1 {response.status} {REASONS.get(response.status, "")}',
+            'Content-Type: application/json; charset=utf-8',
+            f'Connection: {"keep-alive" if keep_alive else "close"}']
+    if response.stream is None:
+        body = dumps(response.data)
+        head.append(f'Content-Length: {len(body)}')
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+        return
+    head.append('Transfer-Encoding: chunked')
+    writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+    async for chunk in response.stream:
+        if chunk:
+            writer.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+            await writer.drain()
+    writer.write(b'0\r\n\r\n')
+    await writer.drain()
+
+
+def log_job_failure(job, exc):
+    """Report a failed background job; its schedule keeps running."""
+    sys.stderr.write(f'{job} failed: {type(exc).__name__}: {exc}\n')
+
+
+def error_response(exc):
+    if isinstance(exc, HTTPError):
+        return Response(exc.status, {'error': str(exc)})
+    return Response(500, {'error': f'{type(exc).__name__}: {exc}'})
+
+
+class HTTPServer:
+    """Serves a ``LibraryService`` with keep-alive and request pipelining."""
+
+    def __init__(self, service, host=HOST, port=PORT):
+        self.service = service
+        self.host = host
+        self.port = port
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def serve_forever(self):
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def respond(self, request):
+        try:
+            return await self.service.dispatch(request)
+        except Exception as exc:
+            return error_response(exc)
+
+    async def handle(self, reader, writer):
+        # The reader side starts every request as soon as it is parsed; the
+        # responder writes the results back in request order.
+        pending = asyncio.Queue(PIPELINE_DEPTH)
+
+        async def responder():
+            while True:
+                item = await pending.get()
+                if item is None:
+                    return
+                task, keep_alive = item
+                try:
+                    await write_response(writer, await task, keep_alive)
+                except (ConnectionError, asyncio.CancelledError):
+                    return
+                if not keep_alive:
+                    return
+
+        responding = asyncio.create_task(responder())
+        try:
+            while not responding.done():
+                try:
+                    request = await read_request(reader)
+                except (HTTPError, ValueError) as exc:
+                    future = asyncio.get_running_loop().create_future()
+                    future.set_result(error_response(exc if isinstance(exc, HTTPError)
+                                                     else HTTPError(400)))
+                    await pending.put((future, False))
+                    break
+                except ConnectionError:
+                    break
+                if request is None:
+                    break
+                await pending.put((asyncio.create_task(self.respond(request)),
+                                   request.keep_alive))
+                if not request.keep_alive:
+                    break
+            await pending.put(None)
+            await responding
+        finally:
+            writer.close()
+
+
+async def serve(host=HOST, port=PORT, ready=None):
+    """Run the service until cancelled; ``ready(port)`` is called once listening."""
+    service = LibraryService()
+    server = await HTTPServer(service, host, port).start()
+    if ready is not None:
+        ready(server.port)
+    jobs = [asyncio.create_task(service.scan_overdue_forever()),
+            asyncio.create_task(service.archive_forever())]
+    try:
+        await server.serve_forever()
+    finally:
+        for job in jobs:
+            job.cancel()
+        service.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve the library over HTTP/JSON.')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT, help='0 picks a free port')
+    parser.add_argument('--db', help='database file (default: library.db)')
+    args = parser.parse_args(argv)
+
+    if args.db:
+        database.DB_PATH = Path(args.db)
+    database.init_database()
+    database.configure_pool(database.DB_PATH)
+
+    def ready(port):
+        print(f'listening on http://{args.host}:{port}', flush=True)
+
+    try:
+        asyncio.run(serve(args.host, args.port, ready))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        database.close_pool()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
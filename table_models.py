@@ -0,0 +1,393 @@
+"""Lazily paged Qt table model shared by the Books, Users and Loans tabs.
+
+``LazyTableModel`` never materialises a whole table.  Rows are pulled from a
+*pager* in fixed-size pages as the view scrolls (``canFetchMore`` /
+``fetchMore``), and only the most recently used pages are kept in memory;
+an evicted page is fetched again from the cursor it was first read from.
+
+A pager is any callable ``fetch_page(cursor, limit) -> (rows, next_cursor)``
+where ``cursor`` is ``None`` for the first page, such as the keyset
+``get_*_page`` methods of the models.
+
+When the model is also given the pager's sort ``order`` it can apply single
+row changes in place (``insert_record``, ``replace_record``,
+``remove_record``) instead of being reset: the row is found by binary search
+over the pages and then within its page, and the view keeps its selection
+and scroll position.  Page *n* holds the rows whose sort key lies after the
+last key of page *n - 1* and up to its own last key, so an evicted page is
+re-read with its updated row count and still lines up with its neighbours.
+
+Changes made by other app instances arrive through the change log
+(``changefeed.py``) as row ids; ``apply_change`` reconciles one of them with
+the rows on screen and can safely be repeated.
+"""
+from bisect import bisect_right
+from collections import OrderedDict
+
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex
+
+PAGE_SIZE = 200
+MAX_CACHED_PAGES = 16
+
+
+def text(value):
+    """Default cell formatter."""
+    return '' if value is None else str(value)
+
+
+def date_text(value):
+    """Show only the date part of an ISO timestamp."""
+    return value[:10] if value else ''
+
+
+def list_pager(rows):
+    """Page over an already materialised list, e.g. search results."""
+    def fetch_page(cursor, limit):
+        offset = cursor or 0
+        return rows[offset:offset + limit], offset + limit
+    return fetch_page
+
+
+class Order:
+    """Sort order of a pager: ``fields`` (ending with the unique id) and direction."""
+
+    def __init__(self, *fields, descending=False):
+        self.fields = fields
+        self.descending = descending
+
+    def key(self, record):
+        return tuple(record[field] for field in self.fields)
+
+    def before(self, a, b):
+        """True if key ``a`` sorts strictly before key ``b``."""
+        return a > b if self.descending else a < b
+
+    def position(self, items, key, item_key=None):
+        """Index of the first of the sorted ``items`` that does not sort before ``key``."""
+        lo, hi = 0, len(items)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            probe = items[mid] if item_key is None else item_key(items[mid])
+            if self.before(probe, key):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+
+class LazyTableModel(QAbstractTableModel):
+    """Read-only table of records fetched page by page from a pager.
+
+    ``columns`` is a sequence of ``(header, field)`` or
+    ``(header, field, formatter)`` tuples; records are mappings.
+    """
+
+    def __init__(self, columns, parent=None, page_size=PAGE_SIZE,
+                 max_cached_pages=MAX_CACHED_PAGES):
+        super().__init__(parent)
+        self.columns = [column if len(column) == 3 else (*column, text)
+                        for column in columns]
+        self.page_size = page_size
+        self.max_cached_pages = max_cached_pages
+        self._fetch_page = None
+        self.order = None
+        self._pages = OrderedDict()
+        self._cursors = []
+        self._counts = []     # rows in each page
+        self._starts = []     # row number of each page's first row
+        self._last_keys = []  # sort key of each page's last row when it was read
+        self._unsynced = set()  # pages whose row count no longer matches the database
+        self._row_count = 0
+        self._exhausted = True
+
+    def reset(self, fetch_page, order=None):
+        """Drop everything and start paging from ``fetch_page``.
+
+        ``order`` (an ``Order``) enables the row-level update methods.
+        """
+        self.beginResetModel()
+        self._fetch_page = fetch_page
+        self.order = order
+        self._pages.clear()
+        self._cursors = [None]
+        self._counts = []
+        self._starts = []
+        self._last_keys = []
+        self._unsynced = set()
+        self._row_count = 0
+        self._exhausted = False
+        self.endResetModel()
+        if self.canFetchMore():
+            self.fetchMore()
+
+    def _locate(self, row):
+        number = bisect_right(self._starts, row) - 1
+        return number, row - self._starts[number]
+
+    def record(self, row):
+        """Return the record shown at ``row``, or None."""
+        if not 0 <= row < self._row_count:
+            return None
+        number, offset = self._locate(row)
+        page = self._page(number)
+        return page[offset] if offset < len(page) else None
+
+    def _store(self, number, rows):
+        self._pages[number] = rows
+        self._pages.move_to_end(number)
+        while len(self._pages) > self.max_cached_pages:
+            self._pages.popitem(last=False)
+
+    def _read_page(self, number):
+        """Fetch the rows that now lie in page ``number``'s key range."""
+        count = self._counts[number]
+        if self.order is None:
+            rows, _ = self._fetch_page(self._cursors[number], count) if count else ([], None)
+            return list(rows)
+        open_ended = self._exhausted and number == len(self._counts) - 1
+        last = self._last_keys[number]
+        limit = count + 1
+        while True:
+            rows, _ = self._fetch_page(self._cursors[number], limit)
+            in_range = rows if open_ended else [
+                row for row in rows if not self.order.before(last, self.order.key(row))]
+            if len(in_range) < limit:
+                return list(in_range)
+            limit *= 2
+
+    def _page(self, number):
+        rows = self._pages.get(number)
+        if rows is None:
+            rows = self._read_page(number)
+            if len(rows) != self._counts[number]:
+                # Rows were added or removed elsewhere; the row count cannot
+                # change while the view is painting, so fix it in the next
+                # apply_changes().
+                self._unsynced.add(number)
+                rows = rows[:self._counts[number]]
+            self._store(number, rows)
+        else:
+            self._pages.move_to_end(number)
+        return rows
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self._row_count
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._exhausted
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self._exhausted:
+            return
+        number = len(self._cursors) - 1
+        rows, next_cursor = self._fetch_page(self._cursors[number], self.page_size)
+        if len(rows) < self.page_size:
+            self._exhausted = True
+        else:
+            self._cursors.append(next_cursor)
+        if not rows:
+            return
+        self.beginInsertRows(QModelIndex(), self._row_count,
+                             self._row_count + len(rows) - 1)
+        self._store(number, list(rows))
+        self._starts.append(self._row_count)
+        self._counts.append(len(rows))
+        if self.order is not None:
+            self._last_keys.append(self.order.key(rows[-1]))
+        self._row_count += len(rows)
+        self.endInsertRows()
+
+    # -- row-level updates ----------------------------------------------------
+
+    def _shift(self, number, delta):
+        self._counts[number] += delta
+        for later in range(number + 1, len(self._starts)):
+            self._starts[later] += delta
+        self._row_count += delta
+
+    def _find_page(self, key):
+        """The page whose key range holds ``key``, or None if it is not loaded yet."""
+        number = self.order.position(self._last_keys, key)
+        if number < len(self._last_keys):
+            return number
+        if self._exhausted and self._last_keys:
+            return len(self._last_keys) - 1  # the last page is open-ended
+        return None
+
+    def insert_record(self, record):
+        """Show a new ``record`` at its sorted position."""
+        if self.order is None:
+            return False
+        if not self._counts and self._exhausted:
+            # The table was empty: the record becomes its only page.
+            self.beginInsertRows(QModelIndex(), 0, 0)
+            self._store(0, [record])
+            self._starts, self._counts = [0], [1]
+            self._last_keys = [self.order.key(record)]
+            self._row_count = 1
+            self.endInsertRows()
+            return True
+        key = self.order.key(record)
+        number = self._find_page(key)
+        if number is None:
+            return True  # sorts after the loaded rows; fetchMore will bring it
+        rows = self._pages.get(number)
+        offset = 0
+        if rows is not None:
+            offset = self.order.position(rows, key, self.order.key)
+        row = self._starts[number] + offset
+        self.beginInsertRows(QModelIndex(), row, row)
+        if rows is not None:
+            rows.insert(offset, record)
+        if self.order.before(self._last_keys[number], key):
+            self._last_keys[number] = key
+        self._shift(number, 1)
+        self.endInsertRows()
+        return True
+
+    def remove_record(self, record):
+        """Remove the row showing ``record`` (matched by sort key)."""
+        if self.order is None:
+            return False
+        key = self.order.key(record)
+        number = self._find_page(key)
+        if number is None:
+            return True
+        rows = self._pages.get(number)
+        offset = 0
+        if rows is not None:
+            offset = self.order.position(rows, key, self.order.key)
+            if offset >= len(rows) or self.order.key(rows[offset]) != key:
+                return True  # not shown
+        elif not self._counts[number]:
+            return True
+        row = self._starts[number] + offset
+        self.beginRemoveRows(QModelIndex(), row, row)
+        if rows is not None:
+            del rows[offset]
+        self._shift(number, -1)
+        self.endRemoveRows()
+        return True
+
+    def replace_record(self, old, new):
+        """Show ``new`` in place of ``old``, moving the row if its sort key changed."""
+        if self.order is None:
+            return False
+        key = self.order.key(old)
+        if key != self.order.key(new):
+            self.remove_record(old)
+            return self.insert_record(new)
+        number = self._find_page(key)
+        rows = self._pages.get(number) if number is not None else None
+        if rows is None:
+            return True  # re-read from the database when it is next shown
+        offset = self.order.position(rows, key, self.order.key)
+        if offset < len(rows) and self.order.key(rows[offset]) == key:
+            rows[offset] = new
+            row = self._starts[number] + offset
+            self.dataChanged.emit(self.index(row, 0),
+                                  self.index(row, len(self.columns) - 1))
+        return True
+
+    # -- changes made elsewhere ------------------------------------------------
+
+    def loaded_records(self):
+        """The records of the pages currently in memory."""
+        return [record for rows in self._pages.values() for record in rows]
+
+    def find_record(self, record_id):
+        """The loaded record with id ``record_id``, or None."""
+        for rows in self._pages.values():
+            for record in rows:
+                if record['id'] == record_id:
+                    return record
+        return None
+
+    def _reread_page(self, number):
+        """Re-read a page, adjusting its row count to the rows now in its range."""
+        self._unsynced.discard(number)
+        count = self._counts[number]
+        rows = self._read_page(number)
+        start, delta = self._starts[number], len(rows) - count
+        if delta > 0:
+            self.beginInsertRows(QModelIndex(), start + count, start + len(rows) - 1)
+        elif delta < 0:
+            self.beginRemoveRows(QModelIndex(), start + len(rows), start + count - 1)
+        self._store(number, rows)
+        if rows and self.order.before(self._last_keys[number], self.order.key(rows[-1])):
+            self._last_keys[number] = self.order.key(rows[-1])  # the open-ended last page
+        if delta > 0:
+            self._shift(number, delta)
+            self.endInsertRows()
+        elif delta < 0:
+            self._shift(number, delta)
+            self.endRemoveRows()
+        if rows:
+            self.dataChanged.emit(self.index(start, 0),
+                                  self.index(start + len(rows) - 1, len(self.columns) - 1))
+
+    def apply_changes(self, changes, fetch):
+        """Apply logged ``{id: op}`` changes, reading each row with ``fetch(id)``.
+
+        ``changes`` is None when the whole table changed.  Returns False when
+        the model has to be reset instead.
+        """
+        if self.order is None or changes is None:
+            return False
+        for record_id, op in changes.items():
+            if not self.apply_change(record_id, op, fetch(record_id)):
+                return False
+        for number in sorted(self._unsynced):
+            self._reread_page(number)
+        return True
+
+    def apply_change(self, record_id, op, current):
+        """Bring row ``record_id`` in line with the database after a logged change.
+
+        ``op`` is the change-log operation and ``current`` the row as it now
+        reads through this view, or None if it is gone or no longer belongs
+        here.  Applying a change the model already shows is a no-op, so the
+        app's own writes may come back through the log.  Returns False when
+        the row may sit in an evicted page that cannot be adjusted; the
+        caller should then reset.
+        """
+        if self.order is None:
+            return False
+        shown = self.find_record(record_id)
+        if shown is not None:
+            if current is None:
+                return self.remove_record(shown)
+            return shown == current or self.replace_record(shown, current)
+        evicted = len(self._pages) < len(self._counts)
+        if evicted and op != 'insert':
+            return False  # it may have been counted in an evicted page
+        if current is None:
+            return True
+        number = self._find_page(self.order.key(current))
+        if number is not None and number not in self._pages:
+            self._reread_page(number)
+            return True
+        return self.insert_record(current)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        record = self.record(index.row())
+        if record is None:
+            return None
+        if role == Qt.DisplayRole:
+            _, field, formatter = self.columns[index.column()]
+            return formatter(record[field])
+        if role == Qt.UserRole:
+            return record
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return self.columns[section][0]
+        return str(section + 1)
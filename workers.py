@@ -0,0 +1,292 @@
+"""Background workers that keep database work off the GUI thread."""
+import threading
+
+from PyQt5.QtCore import (QCoreApplication, QObject, QRunnable, QThreadPool, QTimer,
+                          pyqtSignal)
+
+from database import connection
+
+SEARCH_DEBOUNCE_MS = 200
+
+
+class _SearchJob(QRunnable):
+    """Runs one search on a pooled connection; can be interrupted mid-query."""
+
+    def __init__(self, scheduler, generation, keyword):
+        super().__init__()
+        self.scheduler = scheduler
+        self.generation = generation
+        self.keyword = keyword
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def run(self):
+        if self.scheduler.is_stale(self.generation):
+            return
+        try:
+            with connection() as conn:
+                with self._lock:
+                    self._conn = conn
+                try:
+                    rows = self.scheduler.query(conn, self.keyword)
+                finally:
+                    with self._lock:
+                        self._conn = None
+        except Exception as exc:
+            # An exception raised out of QRunnable.run aborts the process, so
+            # failures go back as a signal.  A stale search was interrupted
+            # because a newer keystroke superseded it.
+            if not self.scheduler.is_stale(self.generation):
+                self.scheduler._job_failed.emit(self.generation, str(exc))
+            return
+        self.scheduler._job_finished.emit(self.generation, rows)
+
+    def cancel(self):
+        # sqlite3_interrupt is a no-op when no statement is running, so an
+        # interrupt that lands after the query finished cannot leak into the
+        # next user of the pooled connection.
+        with self._lock:
+            if self._conn is not None:
+                self._conn.interrupt()
+
+
+class SearchScheduler(QObject):
+    """Debounced search that runs ``query(conn, keyword)`` on a worker thread.
+
+    Every call to ``schedule`` supersedes the previous one: the pending
+    debounce restarts, an in-flight query is interrupted, and only the
+    results of the latest keyword are delivered through ``results_ready``,
+    or ``failed(keyword, message)`` if its query raised.
+    """
+
+    results_ready = pyqtSignal(str, object)
+    failed = pyqtSignal(str, str)
+    _job_finished = pyqtSignal(int, object)
+    _job_failed = pyqtSignal(int, str)
+
+    def __init__(self, query, parent=None, debounce_ms=SEARCH_DEBOUNCE_MS):
+        super().__init__(parent)
+        self.query = query
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(2)
+        self._generation = 0
+        self._keyword = ''
+        self._job = None
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(debounce_ms)
+        self._timer.timeout.connect(self._start)
+        self._job_finished.connect(self._deliver)
+        self._job_failed.connect(self._fail)
+
+    def is_stale(self, generation):
+        return generation != self._generation
+
+    def schedule(self, keyword):
+        """Search for ``keyword`` once typing pauses for the debounce interval."""
+        self.cancel()
+        self._keyword = keyword
+        self._timer.start()
+
+    def cancel(self):
+        """Abandon the pending and in-flight search, if any."""
+        self._generation += 1
+        self._timer.stop()
+        if self._job is not None:
+            self._job.cancel()
+            self._job = None
+
+    def _start(self):
+        self._job = _SearchJob(self, self._generation, self._keyword)
+        self.pool.start(self._job)
+
+    def _deliver(self, generation, rows):
+        if self.is_stale(generation):
+            return
+        self._job = None
+        self.results_ready.emit(self._keyword, rows)
+
+    def _fail(self, generation, message):
+        if self.is_stale(generation):
+            return
+        self._job = None
+        self.failed.emit(self._keyword, message)
+
+
+class _ExportJob(QRunnable):
+    def __init__(self, task, kwargs):
+        super().__init__()
+        self.task = task
+        self.kwargs = kwargs
+
+    def run(self):
+        from export import export
+        try:
+            stats = export(progress=self.task.progress.emit,
+                           cancelled=self.task.is_cancelled, **self.kwargs)
+        except Exception as exc:
+            self.task.failed.emit(str(exc))
+            return
+        self.task.finished.emit(stats)
+
+
+class ExportTask(QObject):
+    """Runs ``export.export`` on a worker thread.
+
+    ``progress(written, total)`` fires after every chunk, then either
+    ``finished(stats)`` or ``failed(message)``.  ``cancel`` stops the export
+    between chunks and removes the partial file.
+    """
+
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self._cancelled = threading.Event()
+
+    def start(self, **kwargs):
+        """Start ``export(**kwargs)``; returns False if an export is already running."""
+        if self.pool.activeThreadCount():
+            return False
+        self._cancelled.clear()
+        self.pool.start(_ExportJob(self, kwargs))
+        return True
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def is_cancelled(self):
+        return self._cancelled.is_set()
+
+
+class _ReportJob(QRunnable):
+    def __init__(self, task, name, kwargs):
+        super().__init__()
+        self.task = task
+        self.name = name
+        self.kwargs = kwargs
+
+    def run(self):
+        import parallel_reports
+        try:
+            result = parallel_reports.run(self.name, progress=self.task.progress.emit,
+                                          cancelled=self.task.is_cancelled, **self.kwargs)
+        except ImportError as exc:
+            # NumPy is optional: only the demand report needs it.
+            self.task._job_done.emit(self.name, self.kwargs, None,
+                                     f'{exc.name} is required for this report (pip install {exc.name})')
+            return
+        except Exception as exc:
+            self.task._job_done.emit(self.name, self.kwargs, None, str(exc))
+            return
+        self.task._job_done.emit(self.name, self.kwargs, result, None)
+
+
+class ReportTask(QObject):
+    """Runs ``parallel_reports.run`` from a worker thread; the shards run in
+    worker processes.
+
+    One report runs at a time.  ``start`` while one is running cancels it
+    and queues the new request in place of any queued before, so the latest
+    request always runs and the superseded ones report nothing.
+    ``progress(done, total)`` fires as shards complete, then either
+    ``finished(name, kwargs, result)`` (``result`` is None if cancelled) or
+    ``failed(message)``.
+    """
+
+    progress = pyqtSignal(int, int)
+    finished = pyqtSignal(str, object, object)
+    failed = pyqtSignal(str)
+    _job_done = pyqtSignal(str, object, object, object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self._cancelled = threading.Event()
+        self._running = False
+        self._pending = None
+        self._job_done.connect(self._finish)
+
+    def start(self, name, **kwargs):
+        """Run report ``name`` with ``kwargs`` once the running one, if any, has stopped."""
+        self._pending = (name, kwargs)
+        if self._running:
+            self._cancelled.set()
+        else:
+            self._start_pending()
+
+    def _start_pending(self):
+        name, kwargs = self._pending
+        self._pending = None
+        self._running = True
+        self._cancelled.clear()
+        self.pool.start(_ReportJob(self, name, kwargs))
+
+    def _finish(self, name, kwargs, result, error):
+        self._running = False
+        if self._pending is not None:
+            self._start_pending()
+        elif error is not None:
+            self.failed.emit(error)
+        else:
+            self.finished.emit(name, kwargs, result)
+
+    def is_running(self):
+        return self._running
+
+    def cancel(self):
+        """Stop the running report and drop the queued one."""
+        self._pending = None
+        self._cancelled.set()
+
+    def is_cancelled(self):
+        return self._cancelled.is_set()
+
+
+class _CallJob(QRunnable):
+    def __init__(self, task):
+        super().__init__()
+        self.task = task
+
+    def run(self):
+        try:
+            result = self.task.func()
+        except Exception as exc:
+            self.task.failed.emit(str(exc))
+            return
+        self.task.finished.emit(result)
+
+
+class BackgroundTask(QObject):
+    """Runs ``func()`` on a worker thread, one run at a time.
+
+    Each run ends with ``finished(result)`` or ``failed(message)``.  ``start``
+    while a run is going does nothing, so a slow run of a periodic job
+    absorbs the timer ticks that come due meanwhile.  A run still going when
+    the application quits is waited for; the pool's destructor would wait
+    with the GIL held, while the run needs it to finish.
+    """
+
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+    def __init__(self, func, parent=None):
+        super().__init__(parent)
+        self.func = func
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        app = QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self.pool.waitForDone)
+
+    def start(self):
+        """Start a run; returns False if one is already going."""
+        if self.pool.activeThreadCount():
+            return False
+        self.pool.start(_CallJob(self))
+        return True